@@ -101,6 +101,9 @@ const char* ssid = MY_SSID;
 const char* password = MY_WIFI_PASSWORD;
 
 const double clock_rate = 1000; /* In Hz */
+/* Counts are taken on both clock edges. This must match the rate (counts per
+   second) given to the race manager with --clock_rate or --calibration_file. */
+const double counts_per_second = 2.0*clock_rate;
 const int port = MY_PORT;
 int i;
 int current_rate = STANDBY_RATE;
@@ -308,7 +311,7 @@ void send_start_message(){
 } /* send_start_message()*/
 void send_lane_results(){
   char msg[64];
-  sprintf(msg,"Time:\n%5.3lf",(double)counts/(2.0*clock_rate));
+  sprintf(msg,"Time:\n%5.3lf",(double)counts/counts_per_second);
   static_message(msg);
   sprintf(msg,"<Track count:%lu>",counts);
   if(wifiClient){
@@ -317,6 +320,11 @@ void send_lane_results(){
     } /* if the client is connected */
   } /* if the client is valid */
 } /* send_lane_results()*/
+void send_counts(){
+  char msg[64];
+  sprintf(msg,"<Counts:%lu>",counts);
+  wifiClient.write((uint8_t *)&msg,strlen(msg));
+} /* send_counts()*/
 void send_ready_message(){
   char msg[]= "<Ready to Race.>\n";
     if(wifiClient){
@@ -384,7 +392,7 @@ void check_client_data(){
           if(strstr(line,"reset"))
             send_reset_to_timer();
           else if(strstr(line,"counts"))
-            wifiClient.write((uint8_t *)&counts,sizeof(counts));
+            send_counts();
           else{
 #if DEBUG_MODE
                 Serial.println("TODO: figure out how to handle that string!");
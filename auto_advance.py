@@ -0,0 +1,95 @@
+"""
+auto_advance.py
+
+Automatic turnaround between races. When every occupied lane has reported a
+count, AutoAdvance.check looks the result over. If nothing is wrong the race
+manager accepts the result, logs it, moves to the next race and resets the
+track after delay_s seconds (time for the MC to read the times out). Any
+problem holds the race for the operator, who accepts, reruns or moves on by
+hand as before.
+
+The checks are:
+    - Every occupied lane reported a count.
+    - Every time is between min_time and max_time seconds.
+    - The slowest and fastest lanes are within max_spread seconds.
+    - Every racer with earlier runs is within max_change seconds of their
+      average.
+    - The race does not already have an accepted result (a rerun).
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from typing import List
+
+from race_event import Event
+
+# The plausible range of a lane time in seconds, shared with outliers.py
+min_lane_time = 1.5
+max_lane_time = 10.0
+
+
+class AutoAdvance:
+    def __init__(self,
+                 delay_s: float = 3.0,
+                 min_time: float = min_lane_time,
+                 max_time: float = max_lane_time,
+                 max_spread: float = 2.5,
+                 max_change: float = 1.0):
+        if delay_s < 0.0:
+            raise ValueError(f"The auto advance delay must not be negative, not {delay_s}.")
+        self.delay_s = delay_s
+        self.min_time = min_time
+        self.max_time = max_time
+        self.max_spread = max_spread
+        self.max_change = max_change
+        self.n_accepted = 0
+        self.n_held = 0
+
+    def check(self, event: Event, counts) -> List[str]:
+        """ The reasons to hold the current race for the operator. An empty
+        list means the result can be accepted. """
+        race = event.current_race
+        if race is None:
+            return ["There is no current race."]
+        problems = []
+        if race.accepted_result_idx >= 0:
+            problems.append(f"Race {event.current_race_idx} already has an accepted result.")
+        times = event.times_from_counts(counts)
+        occupied = []
+        for li in range(event.n_lanes):
+            if race.is_empty[li]:
+                continue
+            if counts[li] <= 0:
+                problems.append(f"Lane {li + 1} did not report a time.")
+                continue
+            if not self.min_time <= times[li] <= self.max_time:
+                problems.append(f"Lane {li + 1} time {times[li]:.3f} s is outside "
+                                f"{self.min_time:.1f} to {self.max_time:.1f} s.")
+                continue
+            occupied.append(times[li])
+            average = race.racers[li].get_average()
+            if average > 0.0 and abs(times[li] - average) > self.max_change:
+                problems.append(f"Lane {li + 1} ({race.racers[li].name}) ran {times[li]:.3f} s "
+                                f"against an average of {average:.3f} s.")
+        if len(occupied) > 1 and max(occupied) - min(occupied) > self.max_spread:
+            problems.append(f"The lanes are {max(occupied) - min(occupied):.3f} s apart.")
+        if problems:
+            self.n_held += 1
+        return problems
+
+    def accepted(self):
+        self.n_accepted += 1
+
+    def status(self):
+        return f"Auto advanced {self.n_accepted}, held {self.n_held}"
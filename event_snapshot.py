@@ -0,0 +1,229 @@
+"""
+event_snapshot.py
+
+Immutable snapshots of an Event for readers that should not share the
+race loop's mutable objects (exports on a worker thread, reports, another
+process). A snapshot is taken on the thread that owns the Event, which is
+cheap, and can then be read anywhere without locking.
+
+Snapshots share structure. SnapshotCache listens to the event and
+remembers the view it built for each racer, heat and race. The next
+snapshot rebuilds only the objects that changed since then, plus the heats
+and races that hold a rebuilt racer. Everything else is the very same
+view object as in the previous snapshot.
+
+RacerView, HeatView and RaceView have the fields that the report and
+export code reads from Racer, Heat and Race, so EventSnapshot can be
+passed to race_export in place of the Event.
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+from race_event import rank_counts
+
+
+def frozen_array(values, dtype=np.float64):
+    out = np.array(values, dtype=dtype)
+    out.flags.writeable = False
+    return out
+
+
+class RacerView(NamedTuple):
+    name: str
+    rank: str
+    heat_name: str
+    car_number: int
+    car_status: dict
+    race_times: np.ndarray
+    race_counts: np.ndarray
+    race_plan_nums: np.ndarray
+    race_log_nums: np.ndarray
+    race_positions: np.ndarray
+
+    def get_average(self):
+        if any(self.race_times > 0.0):
+            return np.mean(self.race_times[self.race_times > 0.0])
+        else:
+            return 0.0
+
+    def get_worst(self):
+        return np.max(self.race_times)
+
+    def get_best(self):
+        if any(self.race_times > 0.0):
+            return np.min(self.race_times[self.race_times > 0.0])
+        else:
+            return 0.0
+
+
+class HeatView(NamedTuple):
+    name: str
+    ability_rank: int
+    racers: Tuple[RacerView, ...]
+
+    def get_racer(self, racer_name):
+        for racer in self.racers:
+            if racer.name == racer_name:
+                return racer
+        return None
+
+
+class RaceView(NamedTuple):
+    plan_number: int
+    racers: Tuple[RacerView, ...]
+    is_empty: Tuple[bool, ...]
+    race_number: Tuple[int, ...]
+    times: Tuple[Tuple[float, ...], ...]
+    counts: Tuple[Tuple[int, ...], ...]
+    placements: Tuple[Tuple[int, ...], ...]
+    accepted_result_idx: int
+
+
+class EventSnapshot(NamedTuple):
+    version: int
+    n_lanes: int
+    tie_tolerance: float
+    heats: Tuple[HeatView, ...]
+    races: Tuple[RaceView, ...]
+    current_race_idx: int
+    current_race_log_idx: int
+
+    @property
+    def current_race(self):
+        if 0 <= self.current_race_idx < len(self.races):
+            return self.races[self.current_race_idx]
+        return None
+
+    def get_heat(self, heat_name):
+        for heat in self.heats:
+            if heat.name == heat_name:
+                return heat
+        return None
+
+    def rank_accepted_races(self):
+        """ Same as Event.rank_accepted_races. """
+        race_idx = [ri for ri, race in enumerate(self.races)
+                    if race.accepted_result_idx >= 0]
+        if len(race_idx) == 0:
+            return race_idx, np.zeros((0, self.n_lanes), dtype=np.int64)
+        times = np.array([self.races[ri].times[self.races[ri].accepted_result_idx]
+                          for ri in race_idx], dtype=np.float64)
+        is_empty = np.array([self.races[ri].is_empty for ri in race_idx], dtype=bool)
+        return race_idx, rank_counts(times, is_empty, self.tie_tolerance)
+
+
+def racer_view(racer):
+    return RacerView(racer.name, racer.rank, racer.heat_name, int(racer.car_number),
+                     racer.inspection.to_dict(),
+                     frozen_array(racer.race_times), frozen_array(racer.race_counts),
+                     frozen_array(racer.race_plan_nums), frozen_array(racer.race_log_nums),
+                     frozen_array(racer.race_positions))
+
+
+def race_view(race, racers):
+    return RaceView(int(race.plan_number), racers,
+                    tuple(bool(x) for x in race.is_empty),
+                    tuple(int(x) for x in race.race_number),
+                    tuple(tuple(float(x) for x in times) for times in race.times),
+                    tuple(tuple(int(x) for x in counts) for counts in race.counts),
+                    tuple(tuple(int(x) for x in places) for places in race.placements),
+                    int(race.accepted_result_idx))
+
+
+class SnapshotCache:
+    """
+    Keeps the views from the last snapshot of an event. The cache is keyed
+    by the objects themselves (by id, with the object kept alongside so a
+    reused id is not mistaken for the old object).
+    """
+
+    def __init__(self, event):
+        self.event = event
+        self.version = 0
+        self.racers = {}  # id -> (racer, view)
+        self.heats = {}
+        self.races = {}
+        self.dirty = set()  # ids of objects changed since the last snapshot
+        event.add_observer(self.on_change)
+
+    def detach(self):
+        self.event.remove_observer(self.on_change)
+
+    def on_change(self, event, kind, race_idx=None, racer=None, heat=None, **info):
+        self.version += 1
+        if kind == 'result' and race_idx is not None and race_idx < len(event.races):
+            race = event.races[race_idx]
+            self.dirty.add(id(race))
+            self.dirty.update(id(r) for r in race.racers)
+        elif kind == 'racer':
+            if racer is not None:
+                self.dirty.add(id(racer))
+            if heat is not None:
+                self.dirty.update(id(r) for r in heat.racers)
+        elif kind == 'plan':
+            self.racers, self.heats, self.races = {}, {}, {}
+
+    @staticmethod
+    def _cached(cache, obj, dirty):
+        entry = cache.get(id(obj))
+        if entry is None or entry[0] is not obj or id(obj) in dirty:
+            return None
+        return entry[1]
+
+    def _racer(self, racer, racers):
+        entry = racers.get(id(racer))
+        if entry is not None:
+            return entry[1]
+        view = self._cached(self.racers, racer, self.dirty)
+        if view is None or view.name != racer.name or view.heat_name != racer.heat_name or \
+                view.car_number != racer.car_number:
+            view = racer_view(racer)
+        racers[id(racer)] = (racer, view)
+        return view
+
+    def snapshot(self) -> EventSnapshot:
+        """ Must be called on the thread that changes the event. """
+        event = self.event
+        racers, heats, races = {}, {}, {}
+
+        heat_views = []
+        for heat in event.heats:
+            members = tuple(self._racer(r, racers) for r in heat.racers)
+            view = self._cached(self.heats, heat, self.dirty)
+            if view is None or view.name != heat.name or len(view.racers) != len(members) or \
+                    any(a is not b for a, b in zip(view.racers, members)):
+                view = HeatView(heat.name, heat.ability_rank, members)
+            heats[id(heat)] = (heat, view)
+            heat_views.append(view)
+
+        race_views = []
+        for race in event.races:
+            members = tuple(self._racer(r, racers) for r in race.racers)
+            view = self._cached(self.races, race, self.dirty)
+            if view is None or len(view.race_number) != len(race.race_number) or \
+                    view.accepted_result_idx != race.accepted_result_idx or \
+                    any(a is not b for a, b in zip(view.racers, members)):
+                view = race_view(race, members)
+            races[id(race)] = (race, view)
+            race_views.append(view)
+
+        self.racers, self.heats, self.races = racers, heats, races
+        self.dirty = set()
+        return EventSnapshot(self.version, event.n_lanes, event.tie_tolerance,
+                             tuple(heat_views), tuple(race_views),
+                             event.current_race_idx, event.current_race_log_idx)
@@ -0,0 +1,384 @@
+"""
+event_store.py
+
+SQLite storage for an Event. One database file holds the plan (heats,
+racers, races and their lane entries) and every attempt at a race with its
+lane results, so a restart is a handful of indexed queries instead of
+re-reading the plan and replaying the race log.
+
+heats:          name, ability rank, and order.
+racers:         heat, name, rank, car number, inspection flags, notes and
+                whether they are checked in.
+races:          plan number.
+race_entries:   racer (NULL for an empty lane) in each lane of each race.
+attempts:       Every recorded run of a race, with its log number and
+                whether it was accepted.
+lane_results:   count, time and placement for each lane of an attempt.
+
+The database runs in WAL mode, and each recorded result is written in its
+own transaction. Attach a store to an Event (EventStore.attach) and it follows
+the Event's notifications. An Event whose event file ends in .db or .sqlite
+is loaded from, and saved to, the store.
+
+    python event_store.py demo_race.yaml log_file.csv event.db
+
+imports a plan and race log into a new store.
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import sqlite3
+import sys
+import time
+
+store_extensions = ('.db', '.sqlite')
+
+schema = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS heats (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    ability_rank INTEGER,
+    position INTEGER
+);
+CREATE TABLE IF NOT EXISTS racers (
+    id INTEGER PRIMARY KEY,
+    heat_id INTEGER NOT NULL REFERENCES heats(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    rank TEXT,
+    car_number INTEGER,
+    position INTEGER,
+    inspection INTEGER DEFAULT 0,
+    notes TEXT DEFAULT '',
+    checked_in INTEGER DEFAULT 1,
+    UNIQUE (heat_id, name)
+);
+CREATE TABLE IF NOT EXISTS races (
+    id INTEGER PRIMARY KEY,
+    plan_number INTEGER NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS race_entries (
+    race_id INTEGER NOT NULL REFERENCES races(id) ON DELETE CASCADE,
+    lane INTEGER NOT NULL,
+    racer_id INTEGER REFERENCES racers(id) ON DELETE SET NULL,
+    PRIMARY KEY (race_id, lane)
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY,
+    plan_number INTEGER NOT NULL,
+    log_number INTEGER NOT NULL,
+    accepted INTEGER NOT NULL DEFAULT 0,
+    recorded_at REAL
+);
+CREATE TABLE IF NOT EXISTS lane_results (
+    attempt_id INTEGER NOT NULL REFERENCES attempts(id) ON DELETE CASCADE,
+    lane INTEGER NOT NULL,
+    racer_id INTEGER REFERENCES racers(id) ON DELETE SET NULL,
+    count INTEGER,
+    time REAL,
+    placement INTEGER,
+    PRIMARY KEY (attempt_id, lane)
+);
+CREATE INDEX IF NOT EXISTS racers_by_car ON racers(car_number);
+CREATE INDEX IF NOT EXISTS entries_by_racer ON race_entries(racer_id);
+CREATE INDEX IF NOT EXISTS attempts_by_plan ON attempts(plan_number);
+CREATE INDEX IF NOT EXISTS attempts_by_log ON attempts(log_number);
+CREATE INDEX IF NOT EXISTS results_by_racer ON lane_results(racer_id);
+"""
+
+
+def is_store_file(file_name):
+    return file_name is not None and file_name.lower().endswith(store_extensions)
+
+
+class EventStore:
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.db = sqlite3.connect(file_name)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(schema)
+        self.event = None
+
+    def close(self):
+        if self.event is not None:
+            self.event.remove_observer(self.on_change)
+            self.event = None
+        self.db.close()
+
+    @property
+    def is_empty(self):
+        return self.db.execute("SELECT COUNT(*) FROM heats").fetchone()[0] == 0
+
+    def get_meta(self, key, default=None):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def _set_meta(self, **values):
+        self.db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                            [(key, str(value)) for key, value in values.items()])
+
+    # WRITING
+    def attach(self, event):
+        """ Keep the store up to date with event from now on. """
+        if self.event is not None:
+            self.event.remove_observer(self.on_change)
+        self.event = event
+        event.add_observer(self.on_change)
+
+    def on_change(self, event, kind, **info):
+        if kind == 'result':
+            self.record_result(event, info['race_idx'], info['log_idx'], info['accepted'])
+        elif kind == 'race':
+            with self.db:
+                self._set_meta(current_race_idx=event.current_race_idx,
+                               current_race_log_idx=event.current_race_log_idx)
+        else:
+            self.save_plan(event)
+
+    def save_plan(self, event):
+        """ Write the heats, racers and races in one transaction. Racers keep
+        their ids (matched by heat and name) so their results stay linked. """
+        with self.db:
+            heat_ids = {}
+            for position, heat in enumerate(event.heats[:-1]):
+                self.db.execute("INSERT INTO heats (name, ability_rank, position) VALUES (?, ?, ?) "
+                                "ON CONFLICT(name) DO UPDATE SET ability_rank = excluded.ability_rank, "
+                                "position = excluded.position",
+                                (heat.name, heat.ability_rank, position))
+                heat_ids[heat.name] = self.db.execute("SELECT id FROM heats WHERE name = ?",
+                                                      (heat.name,)).fetchone()[0]
+            keep = list(heat_ids.values())
+            self.db.execute(f"DELETE FROM heats WHERE id NOT IN ({','.join('?' * len(keep))})", keep)
+
+            racer_ids = {}
+            for heat in event.heats[:-1]:
+                heat_id = heat_ids[heat.name]
+                for position, racer in enumerate(heat.racers):
+                    self.db.execute(
+                        "INSERT INTO racers (heat_id, name, rank, car_number, position, inspection, notes, "
+                        "checked_in) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT(heat_id, name) DO UPDATE SET rank = excluded.rank, "
+                        "car_number = excluded.car_number, position = excluded.position, "
+                        "inspection = excluded.inspection, notes = excluded.notes, "
+                        "checked_in = excluded.checked_in",
+                        (heat_id, racer.name, str(racer.rank), int(racer.car_number), position,
+                         int(racer.inspection.flags), racer.inspection.notes, int(racer.checked_in)))
+                    racer_ids[id(racer)] = self.db.execute(
+                        "SELECT id FROM racers WHERE heat_id = ? AND name = ?",
+                        (heat_id, racer.name)).fetchone()[0]
+            keep = list(racer_ids.values())
+            self.db.execute(f"DELETE FROM racers WHERE id NOT IN ({','.join('?' * len(keep))})", keep)
+
+            self.db.execute("DELETE FROM races")
+            for race in event.races:
+                race_id = self.db.execute("INSERT INTO races (plan_number) VALUES (?)",
+                                          (int(race.plan_number),)).lastrowid
+                self.db.executemany("INSERT INTO race_entries (race_id, lane, racer_id) VALUES (?, ?, ?)",
+                                    [(race_id, li, None if empty else racer_ids.get(id(racer)))
+                                     for li, (racer, empty) in enumerate(zip(race.racers, race.is_empty))])
+            self._set_meta(n_lanes=event.n_lanes,
+                           tie_tolerance=event.tie_tolerance,
+                           current_race_idx=event.current_race_idx,
+                           current_race_log_idx=event.current_race_log_idx)
+
+    def _racer_id(self, racer):
+        row = self.db.execute("SELECT racers.id FROM racers JOIN heats ON heats.id = racers.heat_id "
+                              "WHERE heats.name = ? AND racers.name = ?",
+                              (racer.heat_name, racer.name)).fetchone()
+        return None if row is None else row[0]
+
+    def record_result(self, event, race_idx, log_idx, accepted):
+        """ Write the latest attempt of a race in a single transaction. """
+        race = event.races[race_idx]
+        times = race.times[-1]
+        counts = race.counts[-1]
+        placements = race.placements[-1]
+        with self.db:
+            if accepted:
+                self.db.execute("UPDATE attempts SET accepted = 0 WHERE plan_number = ?",
+                                (int(race.plan_number),))
+            attempt_id = self.db.execute(
+                "INSERT INTO attempts (plan_number, log_number, accepted, recorded_at) VALUES (?, ?, ?, ?)",
+                (int(race.plan_number), int(log_idx), int(bool(accepted)), time.time())).lastrowid
+            self.db.executemany(
+                "INSERT INTO lane_results (attempt_id, lane, racer_id, count, time, placement) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(attempt_id, li, None if race.is_empty[li] else self._racer_id(race.racers[li]),
+                  int(counts[li]), float(times[li]), int(placements[li]))
+                 for li in range(event.n_lanes)])
+            self._set_meta(current_race_idx=event.current_race_idx,
+                           current_race_log_idx=log_idx + 1)
+
+    def save_event(self, event):
+        """ Write a whole event, including all of its recorded attempts. """
+        self.save_plan(event)
+        with self.db:
+            self.db.execute("DELETE FROM attempts")
+        entries = []
+        for race_idx, race in enumerate(event.races):
+            for ri, log_idx in enumerate(race.race_number):
+                entries.append((log_idx, race_idx, ri))
+        entries.sort()
+        for log_idx, race_idx, ri in entries:
+            race = event.races[race_idx]
+            with self.db:
+                attempt_id = self.db.execute(
+                    "INSERT INTO attempts (plan_number, log_number, accepted, recorded_at) VALUES (?, ?, ?, ?)",
+                    (int(race.plan_number), int(log_idx), int(ri == race.accepted_result_idx),
+                     time.time())).lastrowid
+                self.db.executemany(
+                    "INSERT INTO lane_results (attempt_id, lane, racer_id, count, time, placement) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(attempt_id, li, None if race.is_empty[li] else self._racer_id(race.racers[li]),
+                      int(race.counts[ri][li]), float(race.times[ri][li]), int(race.placements[ri][li]))
+                     for li in range(event.n_lanes)])
+        with self.db:
+            self._set_meta(current_race_idx=event.current_race_idx,
+                           current_race_log_idx=event.current_race_log_idx)
+
+    # READING
+    def load(self, event):
+        """ Fill an empty Event from the store. """
+        from race_event import Heat, Race, Racer
+
+        n_lanes = int(self.get_meta('n_lanes', event.n_lanes))
+        if n_lanes != event.n_lanes:
+            raise ValueError(f"{self.file_name} has {n_lanes} lanes and the event has {event.n_lanes}.")
+        event.tie_tolerance = float(self.get_meta('tie_tolerance', event.tie_tolerance))
+
+        racers_by_id = {}
+        for heat_id, name, ability_rank in self.db.execute(
+                "SELECT id, name, ability_rank FROM heats ORDER BY position"):
+            rows = self.db.execute("SELECT id, name, rank, car_number, inspection, notes, checked_in "
+                                   "FROM racers WHERE heat_id = ? ORDER BY position", (heat_id,)).fetchall()
+            racers = []
+            for racer_id, racer_name, rank, car_number, inspection, notes, checked_in in rows:
+                racer = Racer(car_number=car_number, name=racer_name, rank=rank,
+                              heat_name=name, n_lanes=event.n_lanes,
+                              checked_in=bool(checked_in))
+                racer.inspection.flags = inspection
+                racer.inspection.notes = notes
+                racers_by_id[racer_id] = racer
+                racers.append(racer)
+            event.add_heat(Heat(name=name, racers=racers, ability_rank=ability_rank))
+        empty_heat = event.heats[-1]
+
+        races = []
+        race_by_plan = {}
+        for race_id, plan_number in self.db.execute("SELECT id, plan_number FROM races ORDER BY plan_number"):
+            heats, racers, is_empty = [], [], []
+            empty_idx = 0
+            for li, racer_id in self.db.execute("SELECT lane, racer_id FROM race_entries "
+                                                "WHERE race_id = ? ORDER BY lane", (race_id,)):
+                racer = racers_by_id.get(racer_id)
+                if racer is None:
+                    racer = empty_heat.racers[empty_idx % event.n_lanes]
+                    empty_idx += 1
+                    heats.append(empty_heat)
+                    is_empty.append(True)
+                else:
+                    heats.append(event.heats[event.heat_index(heat_name=racer.heat_name)])
+                    is_empty.append(False)
+                racers.append(racer)
+            race = Race(heats, racers, plan_number, is_empty, n_lanes=event.n_lanes)
+            races.append(race)
+            race_by_plan[plan_number] = race
+        event.races = races
+        event.last_race = len(races) - 1
+
+        self._load_attempts(event, race_by_plan, racers_by_id)
+
+        event.current_race_log_idx = int(self.get_meta('current_race_log_idx', 0))
+        current = int(self.get_meta('current_race_idx', 0))
+        if races:
+            event.current_race_idx = min(max(current, 0), len(races) - 1)
+            event.current_race = races[event.current_race_idx]
+        return event
+
+    def _load_attempts(self, event, race_by_plan, racers_by_id):
+        rows = self.db.execute(
+            "SELECT attempts.id, attempts.plan_number, attempts.log_number, attempts.accepted, "
+            "lane_results.lane, lane_results.racer_id, lane_results.count, lane_results.time "
+            "FROM attempts JOIN lane_results ON lane_results.attempt_id = attempts.id "
+            "ORDER BY attempts.log_number, attempts.id, lane_results.lane").fetchall()
+        attempts = {}
+        for attempt_id, plan_number, log_number, accepted, li, racer_id, count, t in rows:
+            entry = attempts.setdefault(attempt_id, [plan_number, log_number, accepted,
+                                                     [None] * event.n_lanes, [0] * event.n_lanes,
+                                                     [0.0] * event.n_lanes])
+            entry[3][li] = racer_id
+            entry[4][li] = count
+            entry[5][li] = t
+        for plan_number, log_number, accepted, racer_ids, counts, times in attempts.values():
+            race = race_by_plan.get(plan_number)
+            if race is None:
+                continue
+            # Only attempts run by the racers now in the race belong to it
+            # (the same rule used when replaying a race log).
+            if any(racer_id is not None and racers_by_id.get(racer_id) is not race.racers[li]
+                   for li, racer_id in enumerate(racer_ids)):
+                continue
+            race.save_results(log_number, times, counts, tolerance=event.tie_tolerance)
+            if accepted:
+                race.post_results_to_racers()
+            while log_number >= len(event.counts):
+                event.counts.append([0] * event.n_lanes)
+            event.counts[log_number] = list(counts)
+
+    # REPORTS
+    def racer_results(self, heat_name, racer_name):
+        """ Every lane result of one racer: (log number, plan number, lane,
+        time, accepted). """
+        return self.db.execute(
+            "SELECT attempts.log_number, attempts.plan_number, lane_results.lane + 1, "
+            "lane_results.time, attempts.accepted "
+            "FROM lane_results JOIN attempts ON attempts.id = lane_results.attempt_id "
+            "JOIN racers ON racers.id = lane_results.racer_id JOIN heats ON heats.id = racers.heat_id "
+            "WHERE heats.name = ? AND racers.name = ? ORDER BY attempts.log_number",
+            (heat_name, racer_name)).fetchall()
+
+    def race_attempts(self, plan_number):
+        """ (log number, accepted) for each attempt at a race. """
+        return self.db.execute("SELECT log_number, accepted FROM attempts WHERE plan_number = ? "
+                               "ORDER BY log_number", (plan_number,)).fetchall()
+
+    def standings(self):
+        """ (name, heat, car number, average, runs) ranked by the average of
+        accepted times. """
+        return self.db.execute(
+            "SELECT racers.name, heats.name, racers.car_number, AVG(lane_results.time), "
+            "COUNT(lane_results.time) "
+            "FROM lane_results JOIN attempts ON attempts.id = lane_results.attempt_id "
+            "JOIN racers ON racers.id = lane_results.racer_id JOIN heats ON heats.id = racers.heat_id "
+            "WHERE attempts.accepted = 1 AND lane_results.time > 0 "
+            "GROUP BY racers.id ORDER BY AVG(lane_results.time)").fetchall()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print("Usage: python event_store.py <event file> <race log> <store.db>")
+        sys.exit(1)
+    from race_event import Event
+
+    imported = Event(event_file=sys.argv[1], log_file=None)
+    imported.read_log_file(sys.argv[2])
+    store = EventStore(sys.argv[3])
+    store.save_event(imported)
+    store.close()
+    print(f"Wrote {len(imported.races)} races to {sys.argv[3]}.")
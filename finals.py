@@ -0,0 +1,177 @@
+"""
+finals.py
+
+Finals rounds seeded from the standings. The standings rank racers by their
+average time over Racer.race_times, and the top n, overall or from each heat,
+go on to a finals round:
+
+    add_finals_round(event, n)                  The top n overall.
+    add_finals_round(event, n, per_heat=True)   The top n from each heat.
+    add_elimination_round(event, n)             The top n of the last round.
+
+A round is a new heat holding a copy of each finalist (same name, rank, car
+number and inspection), so the times from the heats stay where they are. Its
+races are added to the end of the plan. Every finalist runs every lane once,
+in max(finalists, lanes) races, with the runs of each car spread out.
+
+Cutting the field each round with add_elimination_round takes fewer races
+than running everyone again, round_sizes and n_round_races help plan it:
+16 finalists on 4 lanes take 16 races in one round, but 16 + 8 + 4 = 28
+over three rounds that halve the field, against 48 for three full rounds.
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from math import gcd
+from typing import List
+
+from race_event import Event, Heat, Race, Racer
+
+finals_prefix = "Finals"
+
+
+def is_finals_heat(heat: Heat):
+    return heat.name.startswith(finals_prefix)
+
+
+def standings(event: Event, heats=None, min_runs=1):
+    """ [(racer, average, best)] fastest first, for the racers with at least
+    min_runs times. heats defaults to every heat that is not a finals round. """
+    if heats is None:
+        heats = [heat for heat in event.heats[:-1] if not is_finals_heat(heat)]
+    out = []
+    for heat in heats:
+        for racer in heat.racers:
+            if (racer.race_times > 0.0).sum() >= max(min_runs, 1):
+                out.append((racer, racer.get_average(), racer.get_best()))
+    out.sort(key=lambda x: (x[1], x[2]))
+    return out
+
+
+def select_finalists(event: Event, n, per_heat=False, heats=None, min_runs=1) -> List[Racer]:
+    """ The top n racers who are checked in, overall or from each heat. """
+    if n < 1:
+        raise ValueError(f"A finals round needs at least one racer, not {n}.")
+    if heats is None:
+        heats = [heat for heat in event.heats[:-1] if not is_finals_heat(heat)]
+    groups = [[heat] for heat in heats] if per_heat else [heats]
+    out = []
+    for group in groups:
+        ranked = [racer for racer, _, _ in standings(event, group, min_runs) if racer.checked_in]
+        out.extend(ranked[:n])
+    return out
+
+
+def round_sizes(n, n_lanes=4, cut=0.5):
+    """ The field of each elimination round, cutting it by cut each round
+    until it fits in the lanes. """
+    if not 0.0 < cut < 1.0:
+        raise ValueError(f"The cut must be between 0 and 1, not {cut}.")
+    sizes = [n]
+    while sizes[-1] > n_lanes:
+        sizes.append(max(n_lanes, int(sizes[-1] * cut)))
+    return sizes
+
+
+def n_round_races(n, n_lanes=4):
+    return max(n, n_lanes)
+
+
+def lane_rotation(n_entries, n_lanes=4):
+    """ [race][lane] entry indices. Entries past the finalists are empty
+    lanes. Each entry runs each lane once, and the stride keeps a car's runs
+    apart when there are more entries than lanes. """
+    n = max(n_entries, n_lanes)
+    stride = max(1, n // n_lanes)
+    while gcd(stride, n) != 1:
+        stride -= 1
+    return [[(ri + li * stride) % n for li in range(n_lanes)] for ri in range(n)]
+
+
+def next_round_name(event: Event):
+    names = {heat.name for heat in event.heats}
+    if finals_prefix not in names:
+        return finals_prefix
+    k = 2
+    while f"{finals_prefix} {k}" in names:
+        k += 1
+    return f"{finals_prefix} {k}"
+
+
+def copy_racer(racer: Racer, heat_name, name=None):
+    out = Racer(car_number=racer.car_number, name=racer.name if name is None else name,
+                rank=racer.rank, heat_name=heat_name, n_lanes=racer.n_lanes,
+                checked_in=racer.checked_in)
+    out.inspection.flags = racer.inspection.flags
+    out.inspection.notes = racer.inspection.notes
+    return out
+
+
+def add_finals_round(event: Event, n=None, per_heat=False, finalists=None, name=None) -> Heat:
+    """ Add a round for the top n (or the given finalists) to the end of the
+    plan. Returns the new heat. """
+    if finalists is None:
+        finalists = select_finalists(event, event.n_lanes if n is None else n, per_heat)
+    if len(finalists) == 0:
+        raise ValueError("No racer has a time yet, so there is nobody to seed a finals round.")
+    if name is None:
+        name = next_round_name(event)
+    racers = []
+    names = set()
+    for racer in finalists:
+        racer_name = racer.name
+        if racer_name in names:  # Two racers of the same name from different heats
+            racer_name = f"{racer.name} ({racer.heat_name})"
+        names.add(racer_name)
+        racers.append(copy_racer(racer, name, racer_name))
+    heat = Heat(name=name, racers=racers)
+    event.add_heat(heat)
+
+    empty_heat = event.heats[-1]
+    first = len(event.races)
+    for ri, entries in enumerate(lane_rotation(len(racers), event.n_lanes)):
+        heats, lane_racers, is_empty = [], [], []
+        for li, entry in enumerate(entries):
+            if entry < len(racers):
+                heats.append(heat)
+                lane_racers.append(racers[entry])
+                is_empty.append(False)
+            else:
+                heats.append(empty_heat)
+                lane_racers.append(empty_heat.racers[li])
+                is_empty.append(True)
+        event.races.append(Race(heats, lane_racers, first + ri, is_empty, n_lanes=event.n_lanes))
+    event.last_race = len(event.races) - 1
+    if event.current_race is None:
+        event.current_race = event.races[0]
+    event.notify('plan')
+    return heat
+
+
+def last_round(event: Event):
+    rounds = [heat for heat in event.heats[:-1] if is_finals_heat(heat)]
+    return rounds[-1] if rounds else None
+
+
+def add_elimination_round(event: Event, n, min_runs=None) -> Heat:
+    """ The top n of the last finals round go on to a new round. By default
+    only racers who have run every lane of that round are ranked. """
+    previous = last_round(event)
+    if previous is None:
+        raise ValueError("There is no finals round to cut yet.")
+    if n >= len(previous.racers):
+        raise ValueError(f"{previous.name} has {len(previous.racers)} racers, so keeping {n} cuts nobody.")
+    finalists = select_finalists(event, n, heats=[previous],
+                                 min_runs=event.n_lanes if min_runs is None else min_runs)
+    return add_finals_round(event, finalists=finalists)
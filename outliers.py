@@ -0,0 +1,165 @@
+"""
+outliers.py
+
+Flags implausible lane times as they arrive so a bad run (a missed or
+double trigger at the finish) can be rerun while the cars are still at the
+start gate.
+
+OutlierDetector keeps the last window accepted times of each lane and of
+each car. A new time is flagged when it is
+
+impossible:     No count, or a time outside min_time to max_time.
+lane outlier:   More than threshold robust standard deviations
+                (1.4826 * MAD) from that lane's median.
+car outlier:    More than threshold robust standard deviations from that
+                car's median (once the car has min_car_runs runs).
+
+The MAD is never taken as less than min_mad seconds, so a handful of
+identical times does not make every small difference an outlier. Only
+accepted results are learned from; a flagged run is saved as a
+non-accepted attempt with Race.save_results and the race is run again,
+at most max_reruns times before it is held for the operator.
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from typing import Dict
+
+import numpy as np
+
+from auto_advance import max_lane_time, min_lane_time
+from race_event import Event
+
+mad_to_sigma = 1.4826
+
+
+class RobustWindow:
+    """ The last capacity values, with their median and MAD. """
+
+    def __init__(self, capacity=64):
+        self.data = np.zeros(capacity)
+        self.n = 0
+
+    def add(self, value):
+        self.data[self.n % len(self.data)] = value
+        self.n += 1
+
+    def values(self):
+        return self.data[:min(self.n, len(self.data))]
+
+    def median_mad(self):
+        values = self.values()
+        median = float(np.median(values))
+        return median, float(np.median(np.abs(values - median)))
+
+
+class OutlierDetector:
+    def __init__(self,
+                 n_lanes: int = 4,
+                 window: int = 64,
+                 threshold: float = 5.0,
+                 min_lane_runs: int = 5,
+                 min_car_runs: int = 2,
+                 min_mad: float = 0.02,
+                 min_time: float = min_lane_time,
+                 max_time: float = max_lane_time,
+                 max_reruns: int = 2):
+        self.n_lanes = n_lanes
+        self.window = window
+        self.threshold = threshold
+        self.min_lane_runs = min_lane_runs
+        self.min_car_runs = min_car_runs
+        self.min_mad = min_mad
+        self.min_time = min_time
+        self.max_time = max_time
+        self.max_reruns = max_reruns
+        self.lanes = [RobustWindow(window) for _ in range(n_lanes)]
+        self.cars = {}  # (heat name, racer name) -> RobustWindow
+        self.flagged = {}  # (plan number, log number) -> {lane_idx: reason}
+
+    def _deviation(self, stats: RobustWindow, time):
+        median, mad = stats.median_mad()
+        sigma = mad_to_sigma * max(mad, self.min_mad)
+        return (time - median) / sigma, median
+
+    def check_lane(self, lane_idx, racer, time, count=1):
+        """ Returns the reason the time is implausible, or None. """
+        if count <= 0 or time <= 0.0:
+            return "no time was reported"
+        if not self.min_time <= time <= self.max_time:
+            return f"{time:.3f} s is outside {self.min_time:.1f} to {self.max_time:.1f} s"
+        stats = self.lanes[lane_idx]
+        if stats.n >= self.min_lane_runs:
+            z, median = self._deviation(stats, time)
+            if abs(z) > self.threshold:
+                return f"{time:.3f} s is {abs(z):.1f} sigma from the lane median of {median:.3f} s"
+        stats = self.cars.get((racer.heat_name, racer.name))
+        if stats is not None and stats.n >= self.min_car_runs:
+            z, median = self._deviation(stats, time)
+            if abs(z) > self.threshold:
+                return f"{time:.3f} s is {abs(z):.1f} sigma from {racer.name}'s median of {median:.3f} s"
+        return None
+
+    def check_race(self, event: Event, counts) -> Dict[int, str]:
+        """ {lane_idx: reason} for the occupied lanes of the current race
+        whose times look wrong. """
+        race = event.current_race
+        times = event.times_from_counts(counts)
+        flags = {}
+        for li in range(self.n_lanes):
+            if race.is_empty[li]:
+                continue
+            reason = self.check_lane(li, race.racers[li], times[li], counts[li])
+            if reason is not None:
+                flags[li] = reason
+        return flags
+
+    def flag(self, race, log_number, flags):
+        """ Remember the lanes flagged in one attempt at a race. """
+        if flags:
+            self.flagged[(race.plan_number, log_number)] = dict(flags)
+
+    def n_flagged(self, race):
+        """ The number of flagged attempts at a race. """
+        return sum(1 for plan_number, _ in self.flagged if plan_number == race.plan_number)
+
+    def may_rerun(self, race):
+        return self.n_flagged(race) <= self.max_reruns
+
+    def learn(self, race, result_idx=None):
+        """ Add a race's accepted result to the lane and car statistics. """
+        if result_idx is None:
+            result_idx = race.accepted_result_idx
+        if result_idx < 0:
+            return
+        for li, racer in enumerate(race.racers):
+            time = race.times[result_idx][li]
+            if race.is_empty[li] or time <= 0.0:
+                continue
+            self.lanes[li].add(time)
+            key = (racer.heat_name, racer.name)
+            if key not in self.cars:
+                self.cars[key] = RobustWindow(self.window)
+            self.cars[key].add(time)
+
+    def attach(self, event: Event):
+        """ Learn from the results already accepted, then from each new one. """
+        for race in event.races:
+            self.learn(race)
+        event.add_observer(self.on_change)
+
+    def on_change(self, event, kind, race_idx=None, accepted=False, **info):
+        if kind == 'result' and accepted and race_idx is not None:
+            race = event.races[race_idx]
+            self.learn(race, len(race.race_number) - 1)
@@ -0,0 +1,162 @@
+"""
+plan_check.py
+
+Validation of a race plan as it appears in the plan editor (a list of rows,
+one per race, with one "name : heat" cell per lane).
+
+The plan is read once to build a (racer x lane) count matrix, and all of the
+checks are answered from it:
+
+missing_lane:   A racer never runs in a lane.
+duplicate_lane: A racer runs in the same lane more than once.
+same_race:      A racer is in two lanes of the same race.
+back_to_back:   A racer is in two races in a row. This is only a warning,
+                as small heats can not avoid it, and does not fail the plan.
+unknown_entry:  A cell that does not match a registered racer.
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from typing import List
+
+import numpy as np
+
+problem_kinds = ('missing_lane', 'duplicate_lane', 'same_race', 'back_to_back',
+                 'unknown_entry')
+warning_kinds = ('back_to_back',)
+
+
+def cell_label(racer):
+    return f"{racer.name} : {racer.heat_name}"
+
+
+class PlanProblem:
+    def __init__(self, kind, message, racer=None, lanes=(), races=()):
+        self.kind = kind
+        self.message = message
+        self.racer = racer
+        self.lanes = list(lanes)  # 1 indexed
+        self.races = list(races)  # 1 indexed, as shown in the editor
+
+    def __repr__(self):
+        return f"PlanProblem({self.kind!r}, {self.message!r})"
+
+
+class PlanReport:
+    def __init__(self, lane_counts, racers, problems: List[PlanProblem]):
+        self.lane_counts = lane_counts  # n_racers x n_lanes
+        self.racers = racers
+        self.problems = problems
+
+    @property
+    def errors(self):
+        return [p for p in self.problems if p.kind not in warning_kinds]
+
+    @property
+    def warnings(self):
+        return [p for p in self.problems if p.kind in warning_kinds]
+
+    @property
+    def passed(self):
+        return len(self.errors) == 0
+
+    def by_kind(self, kind):
+        return [p for p in self.problems if p.kind == kind]
+
+    def summary(self, max_lines=12):
+        lines = []
+        if self.passed:
+            lines.append("No problems were found with the plan.")
+        messages = [p.message for p in self.errors] + \
+                   ["Warning: " + p.message for p in self.warnings]
+        lines.extend(messages[:max_lines])
+        if len(messages) > max_lines:
+            lines.append(f"... and {len(messages) - max_lines} more.")
+        return '\n'.join(lines)
+
+
+def validate_plan(plan, event, check_back_to_back=True) -> PlanReport:
+    n_lanes = event.n_lanes
+    racers = [racer for heat in event.heats[:-1] for racer in heat.racers]
+    racer_ids = {cell_label(racer): ri for ri, racer in enumerate(racers)}
+
+    # One pass over the cells. Each appearance becomes a (racer, lane, race) triple.
+    ids = []
+    lanes = []
+    rows = []
+    problems = []
+    for row_idx, row in enumerate(plan):
+        for lane_idx, entry in enumerate(row):
+            text = '' if entry is None else str(entry).strip()
+            if text == '':
+                continue
+            if lane_idx >= n_lanes:
+                problems.append(PlanProblem('unknown_entry',
+                                            f"Race {row_idx + 1} has an entry past lane {n_lanes}: {text}",
+                                            races=[row_idx + 1]))
+                continue
+            try:
+                ids.append(racer_ids[text])
+            except KeyError:
+                problems.append(PlanProblem('unknown_entry',
+                                            f"Race {row_idx + 1}, lane {lane_idx + 1}: "
+                                            f"'{text}' is not a registered racer.",
+                                            lanes=[lane_idx + 1], races=[row_idx + 1]))
+                continue
+            lanes.append(lane_idx)
+            rows.append(row_idx)
+    ids = np.array(ids, dtype=np.int64)
+    lanes = np.array(lanes, dtype=np.int64)
+    rows = np.array(rows, dtype=np.int64)
+
+    lane_counts = np.zeros((len(racers), n_lanes), dtype=np.int64)
+    np.add.at(lane_counts, (ids, lanes), 1)
+
+    for ri in np.flatnonzero((lane_counts == 0).any(axis=1)):
+        racer = racers[ri]
+        missing = np.flatnonzero(lane_counts[ri] == 0) + 1
+        problems.append(PlanProblem('missing_lane',
+                                    f"{racer.name} from {racer.heat_name} never races in lane(s) "
+                                    f"{', '.join(str(x) for x in missing)}.",
+                                    racer=racer, lanes=missing))
+    for ri in np.flatnonzero((lane_counts > 1).any(axis=1)):
+        racer = racers[ri]
+        extra = np.flatnonzero(lane_counts[ri] > 1) + 1
+        problems.append(PlanProblem('duplicate_lane',
+                                    f"{racer.name} from {racer.heat_name} races more than once in lane(s) "
+                                    f"{', '.join(str(x) for x in extra)}.",
+                                    racer=racer, lanes=extra))
+
+    if len(ids) > 0:
+        # Sort appearances by racer, then race, so repeated races and
+        # consecutive races are neighbours.
+        order = np.lexsort((rows, ids))
+        sid = ids[order]
+        srow = rows[order]
+        same_racer = sid[1:] == sid[:-1]
+        gap = srow[1:] - srow[:-1]
+        for i in np.flatnonzero(same_racer & (gap == 0)):
+            racer = racers[sid[i]]
+            problems.append(PlanProblem('same_race',
+                                        f"{racer.name} from {racer.heat_name} is in race {srow[i] + 1} twice.",
+                                        racer=racer, races=[srow[i] + 1]))
+        if check_back_to_back:
+            for i in np.flatnonzero(same_racer & (gap == 1)):
+                racer = racers[sid[i]]
+                problems.append(PlanProblem('back_to_back',
+                                            f"{racer.name} from {racer.heat_name} races back to back in races "
+                                            f"{srow[i] + 1} and {srow[i + 1] + 1}.",
+                                            racer=racer, races=[srow[i] + 1, srow[i + 1] + 1]))
+
+    return PlanReport(lane_counts, racers, problems)
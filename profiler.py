@@ -0,0 +1,226 @@
+"""
+profiler.py
+
+Opt-in profiling for the race manager. Nothing here is imported or installed
+unless race_manager.py is started with --profile.
+
+Functions are wrapped in lightweight timers (Profiler.wrap, Profiler.section)
+that keep the nested call path, so the time of every wrapped call is charged
+to a stack like "main_loop;socket;record_race_results". Main loop passes are
+framed with frame_start/frame_end, and any frame slower than slow_frame_ms is
+remembered along with the wrapped calls that ran in it.
+
+In addition, one sampler can be run for a bounded window after start up:
+
+cprofile:       cProfile, reduced to caller;callee stacks.
+tracemalloc:    Memory allocation tracebacks, in bytes.
+
+On exit, write_reports() writes "folded" stack files (one "a;b;c value" line
+per stack), which flamegraph.pl, speedscope and inferno read directly.
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import functools
+import time
+from collections import deque
+
+profile_modes = ('timers', 'cprofile', 'tracemalloc')
+
+
+class _Section:
+    __slots__ = ('profiler', 'name')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.enter(self.name)
+
+    def __exit__(self, *args):
+        self.profiler.exit()
+
+
+class Profiler:
+    def __init__(self,
+                 mode: str = 'timers',
+                 window_s: float = 60.0,
+                 slow_frame_ms: float = 100.0,
+                 max_slow_frames: int = 200):
+        if mode not in profile_modes:
+            raise ValueError(f"Unknown profile mode '{mode}'. Options are {list(profile_modes)}.")
+        self.mode = mode
+        self.window_s = window_s
+        self.slow_frame_ms = slow_frame_ms
+        self.stack = []
+        self.starts = []
+        self.child_ns = []
+        self.folded = {}  # stack -> self time in ns
+        self.calls = {}  # name -> [count, total ns, max ns]
+        self.frame_calls = []
+        self.frame_start_ns = 0
+        self.slow_frames = deque(maxlen=max_slow_frames)
+        self.sampler = None
+        self.sample_end_ns = 0
+        self.sample_result = None
+
+    # Timers
+    def enter(self, name):
+        self.stack.append(name)
+        self.starts.append(time.perf_counter_ns())
+        self.child_ns.append(0)
+
+    def exit(self):
+        elapsed = time.perf_counter_ns() - self.starts.pop()
+        children = self.child_ns.pop()
+        key = ';'.join(self.stack)
+        name = self.stack.pop()
+        self.folded[key] = self.folded.get(key, 0) + elapsed - children
+        if self.child_ns:
+            self.child_ns[-1] += elapsed
+        entry = self.calls.setdefault(name, [0, 0, 0])
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = max(entry[2], elapsed)
+        self.frame_calls.append((key, elapsed))
+
+    def section(self, name):
+        return _Section(self, name)
+
+    def wrap(self, func, name=None):
+        name = func.__qualname__ if name is None else name
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            self.enter(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.exit()
+        timed.profiled = func
+        return timed
+
+    def wrap_method(self, cls, method_name):
+        setattr(cls, method_name, self.wrap(getattr(cls, method_name)))
+
+    def frame_start(self):
+        self.frame_calls = []
+        self.frame_start_ns = time.perf_counter_ns()
+        if self.sampler is not None and self.frame_start_ns >= self.sample_end_ns:
+            self.stop_sampler()
+
+    def frame_end(self):
+        elapsed = time.perf_counter_ns() - self.frame_start_ns
+        if elapsed >= self.slow_frame_ms * 1e6:
+            slowest = sorted(self.frame_calls, key=lambda x: -x[1])[:5]
+            self.slow_frames.append((time.time(), elapsed, slowest))
+
+    # Samplers
+    def start_sampler(self):
+        if self.mode == 'cprofile':
+            import cProfile
+            self.sampler = cProfile.Profile()
+            self.sampler.enable()
+        elif self.mode == 'tracemalloc':
+            import tracemalloc
+            tracemalloc.start(16)
+            self.sampler = tracemalloc
+        else:
+            return
+        self.sample_end_ns = time.perf_counter_ns() + int(self.window_s * 1e9)
+        print(f"Profiling with {self.mode} for {self.window_s} seconds.")
+
+    def stop_sampler(self):
+        if self.sampler is None:
+            return
+        if self.mode == 'cprofile':
+            self.sampler.disable()
+            self.sample_result = cprofile_folded(self.sampler)
+        else:
+            snapshot = self.sampler.take_snapshot()
+            self.sampler.stop()
+            self.sample_result = tracemalloc_folded(snapshot)
+        self.sampler = None
+        print(f"{self.mode} profiling window finished.")
+
+    # Reports
+    def summary(self):
+        lines = ["function, calls, total ms, mean ms, max ms"]
+        for name, (count, total, most) in sorted(self.calls.items(), key=lambda x: -x[1][1]):
+            lines.append(f"{name}, {count}, {total / 1e6:.3f}, {total / count / 1e6:.3f}, {most / 1e6:.3f}")
+        if self.slow_frames:
+            lines.append("")
+            lines.append(f"Frames slower than {self.slow_frame_ms} ms:")
+        for when, elapsed, slowest in self.slow_frames:
+            stamp = time.strftime('%H:%M:%S', time.localtime(when))
+            calls = '; '.join(f"{key} {ns / 1e6:.1f} ms" for key, ns in slowest)
+            lines.append(f"{stamp} {elapsed / 1e6:.1f} ms: {calls}")
+        return '\n'.join(lines)
+
+    def write_reports(self, base_name):
+        """ Write <base>.folded (timers, in microseconds), <base>.txt and
+        <base>.<mode>.folded when a sampler was run. """
+        self.stop_sampler()
+        written = [base_name + '.folded', base_name + '.txt']
+        write_folded(written[0], {k: v // 1000 for k, v in self.folded.items()})
+        with open(written[1], 'w') as outfile:
+            outfile.write(self.summary() + '\n')
+        if self.sample_result is not None:
+            written.append(f"{base_name}.{self.mode}.folded")
+            write_folded(written[-1], self.sample_result)
+        return written
+
+
+def write_folded(file_name, stacks):
+    with open(file_name, 'w') as outfile:
+        for stack, value in sorted(stacks.items()):
+            value = int(value)
+            if value > 0:
+                outfile.write(f"{stack} {value}\n")
+
+
+def _frame_name(func):
+    file_name, line, name = func
+    if file_name == '~':
+        return name  # Built in
+    return f"{name} ({file_name.split('/')[-1]}:{line})"
+
+
+def cprofile_folded(profile):
+    """ caller;callee stacks weighted by the callee's own time (microseconds)
+    under that caller. cProfile only keeps one level of callers, so deeper
+    stacks can not be rebuilt. """
+    import pstats
+    stats = pstats.Stats(profile).stats
+    folded = {}
+    for func, (cc, nc, tt, ct, callers) in stats.items():
+        callee = _frame_name(func)
+        if not callers:
+            folded[callee] = folded.get(callee, 0) + tt * 1e6
+        for caller, caller_stats in callers.items():
+            key = f"{_frame_name(caller)};{callee}"
+            folded[key] = folded.get(key, 0) + caller_stats[2] * 1e6
+    return folded
+
+
+def tracemalloc_folded(snapshot):
+    """ Allocation tracebacks (outermost frame first), in bytes. """
+    folded = {}
+    for stat in snapshot.statistics('traceback'):
+        frames = [f"{frame.filename.split('/')[-1]}:{frame.lineno}"
+                  for frame in stat.traceback]
+        key = ';'.join(frames)
+        folded[key] = folded.get(key, 0) + stat.size
+    return folded
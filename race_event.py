@@ -34,10 +34,10 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 import numpy as np
-import yaml
+from types import MappingProxyType
 from typing import List
-from pdflatex import PDFLaTeX
 from typing import Iterable
+from timer_clock import TimerCalibration
 
 default_heat_name = "No_Heat"
 
@@ -57,6 +57,23 @@ mc_table_footer = r"""\end{tabular}
 current_car_number = 1
 
 
+def rank_counts(counts, is_empty=None, tolerance=0.0):
+    """
+    Rank race results. counts may be a single race (n_lanes) or a batch of
+    races (n_races x n_lanes) of times or timer counts. Lanes within
+    tolerance of each other tie and share a place (1, 1, 3, ...). Lanes that
+    are empty, or have no count, get a place of 0.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    valid = counts > 0
+    if is_empty is not None:
+        valid &= ~np.asarray(is_empty, dtype=bool)
+    # beats[..., i, j] is True when lane j finished clearly ahead of lane i
+    beats = (counts[..., None, :] < counts[..., :, None] - tolerance) & valid[..., None, :]
+    ranks = beats.sum(axis=-1) + 1
+    return np.where(valid, ranks, 0)
+
+
 def next_car_number():
     global current_car_number
     out = current_car_number
@@ -67,9 +84,106 @@ def next_car_number():
     return out
 
 
+# Car inspection items. These tables are shared by every racer; each racer
+# only keeps a bit per item (see CarInspection).
+inspection_measurements = (
+    ('passed_weight', 'less than 5 oz.'),
+    ('passed_length', 'less than 7"'),
+    ('passed_height', 'less than 3 1/2"'),
+    ('passed_underbody_clearance', 'greater than 3/8"'),
+    ('passed_width', 'less than 2 3/4"'),
+    ('wheel_diameter', 'greater than 1.170"'),
+    ('wheel_base', 'less than 4 3/4" (axle to axle)'),
+    ('passed_nose', 'no notch'),
+)
+
+inspection_questions = (
+    'made_this_year',
+    'use_kit_nail',
+    'use_official_wheel',
+    'no_liquid_lubricant',
+    'no_loose_materials',
+    'no_wheel_bearings',
+    'no_wheel_washers',
+    'no_solid_axles',
+    'no_springs_or_shocks',
+    'no_removal_of_wheel_tread',
+    'no_rounding_of_outside_wheel_edge',
+    'no_rounding_of_inside_wheel_edge',
+    'no_rounding_of_the_inside_wheel_hub',
+    'no_bore_or_cone_for_the_wheel_hub',
+    'no_dome_on_outside_hub',
+    'no_wheel_reshaping',
+    'no_nail_groove',
+    'no_graphite_paint_on_nail',
+)
+
+inspection_bits = {key: 1 << bit for bit, key in
+                   enumerate([x[0] for x in inspection_measurements] + list(inspection_questions))}
+inspection_descriptions = dict(inspection_measurements)
+inspection_mask = (1 << len(inspection_bits)) - 1
+measurement_mask = (1 << len(inspection_measurements)) - 1
+
+
+class CarInspection:
+    """
+    The inspection results for one car, stored as one bit per inspection
+    item plus free-form notes. Use to_dict/from_dict to convert to and from
+    the nested car_status dictionary used in event files.
+    """
+    __slots__ = ('flags', 'notes')
+
+    def __init__(self, flags=0, notes=''):
+        self.flags = flags
+        self.notes = notes
+
+    def passed(self, key):
+        return bool(self.flags & inspection_bits[key])
+
+    def set(self, key, value):
+        if value:
+            self.flags |= inspection_bits[key]
+        else:
+            self.flags &= ~inspection_bits[key]
+
+    def clear_measurements(self):
+        self.flags &= ~measurement_mask
+
+    def passed_all(self):
+        return self.flags & inspection_mask == inspection_mask
+
+    def to_dict(self):
+        out = {}
+        for key, description in inspection_measurements:
+            out[key] = [self.passed(key), description]
+        out['questions'] = {key: self.passed(key) for key in inspection_questions}
+        out['notes'] = self.notes
+        return out
+
+    def from_dict(self, car_status: dict):
+        """ Merge a car_status dictionary. Measurement entries may be given
+        as [passed, description] or as a plain bool. """
+        for key, value in car_status.items():
+            if key == 'questions':
+                for q_key, q_value in value.items():
+                    if q_key in inspection_bits:
+                        self.set(q_key, q_value)
+            elif key == 'notes':
+                self.notes = value
+            elif key in inspection_bits:
+                if isinstance(value, (list, tuple)):
+                    value = value[0]
+                self.set(key, value)
+        return self
+
+
 # CLASS STUFF
 class Racer:
     global default_heat_name
+    __slots__ = ('name', 'rank', 'n_lanes', 'heat_name', 'index_in_heat',
+                 'heat_index', 'race_times', 'race_counts', 'race_plan_nums',
+                 'race_log_nums', 'race_positions', 'car_number', 'hist',
+                 'inspection', 'checked_in')
 
     def __init__(self,
                  car_number=0,
@@ -78,12 +192,14 @@ class Racer:
                  heat_name=default_heat_name,
                  heat_index=-1,
                  n_lanes=4,
-                 car_status=None):
+                 car_status=None,
+                 checked_in=True):
         self.name = name
         self.rank = rank
         self.n_lanes = n_lanes
         self.heat_name = heat_name
         self.index_in_heat = heat_index
+        self.heat_index = heat_index
         self.race_times = np.zeros(self.n_lanes)
         self.race_counts = np.zeros(self.n_lanes)
         self.race_plan_nums = np.zeros(self.n_lanes)
@@ -95,47 +211,32 @@ class Racer:
             self.car_number = 0
         else:
             self.car_number = next_car_number()
-        self.hist = {}
-        if car_status is None:
-            self.car_status = {
-                'passed_weight': [False, 'less than 5 oz.'],
-                'passed_length': [False, 'less than 7"'],
-                'passed_height': [False, 'less than 3 1/2"'],
-                'passed_underbody_clearance': [False, 'greater than 3/8"'],
-                'passed_width': [False, 'less than 2 3/4"'],
-                'wheel_diameter': [False, 'greater than 1.170"'],
-                'wheel_base': [False, 'less than 4 3/4" (axle to axle)'],
-                'passed_nose': [False, 'no notch'],
-                'questions': {
-                    'made_this_year': False,
-                    'use_kit_nail': False,
-                    'use_official_wheel': False,
-                    'no_liquid_lubricant': False,
-                    'no_loose_materials': False,
-                    'no_wheel_bearings': False,
-                    'no_wheel_washers': False,
-                    'no_solid_axles': False,
-                    'no_springs_or_shocks': False,
-                    'no_removal_of_wheel_tread': False,
-                    'no_rounding_of_outside_wheel_edge': False,
-                    'no_rounding_of_inside_wheel_edge': False,
-                    'no_rounding_of_the_inside_wheel_hub': False,
-                    'no_bore_or_cone_for_the_wheel_hub': False,
-                    'no_dome_on_outside_hub': False,
-                    'no_wheel_reshaping': False,
-                    'no_nail_groove': False,
-                    'no_graphite_paint_on_nail': False
-                },
-                'notes': ''
-            }
-        else:
-            self.car_status = car_status
+        self.hist = None  # Results from earlier heats, created when needed
+        self.inspection = CarInspection()
+        if car_status is not None:
+            self.inspection.from_dict(car_status)
+        self.checked_in = checked_in  # False while the racer is not at the event
+
+    @property
+    def car_status(self):
+        """ A read only copy, so that editing it fails instead of being
+        lost. Change racer.inspection, or assign a whole car_status. """
+        status = self.inspection.to_dict()
+        for key, _ in inspection_measurements:
+            status[key] = tuple(status[key])
+        status['questions'] = MappingProxyType(status['questions'])
+        return MappingProxyType(status)
+
+    @car_status.setter
+    def car_status(self, car_status):
+        self.inspection = CarInspection().from_dict(car_status)
 
     def to_dict(self):
         return {
             'name': self.name,
             'rank': self.rank,
-            'car_number': self.car_number
+            'car_number': self.car_number,
+            'checked_in': bool(self.checked_in)
         }
 
     def from_dict(self, dict):
@@ -161,6 +262,8 @@ class Racer:
             self.index_in_heat = dict['heat_index']
         if 'car_status' in dict.keys():
             self.car_status = dict['car_status']
+        if 'checked_in' in dict.keys():
+            self.checked_in = bool(dict['checked_in'])
 
     def chip(self):
         chip = {"text": "{}\n#{}:{}".format(self.name, self.car_number, self.heat_name),
@@ -199,6 +302,8 @@ class Racer:
             return 0.0
 
     def save_heat(self):
+        if self.hist is None:
+            self.hist = {}
         self.hist[self.heat_name] = [self.race_log_nums, self.race_plan_nums,
                                      self.race_times, self.race_positions]
 
@@ -211,18 +316,12 @@ class Racer:
         self.race_positions = np.zeros(self.n_lanes)
 
     def passed_inspection(self):
-        for key in self.car_status.keys():
-            if key == 'questions' or key == 'notes' or self.car_status[key]:
-                continue
-            return False
-        for key in self.car_status['questions'].keys():
-            if self.car_status['questions'][key]:
-                continue
-            return False
-        return True
+        return self.inspection.passed_all()
 
 
 class Heat:
+    __slots__ = ('name', 'racers', 'ability_rank')
+
     def __init__(self,
                  name=default_heat_name,
                  racers: List[Racer] = [],
@@ -312,6 +411,10 @@ class Heat:
 
 
 class Race:
+    __slots__ = ('heats', 'racers', 'plan_number', 'race_number', 'times',
+                 'counts', 'placements', 'current_race', 'is_empty',
+                 'accepted_result_idx', 'n_lanes')
+
     def __init__(self,
                  heats: Iterable[Heat],
                  racers: Iterable[Racer],
@@ -331,22 +434,22 @@ class Race:
         self.n_lanes = n_lanes
         # was accepted or -1 if none have been.
 
-    def get_placements(self, times):
-        return np.argsort(times) + 1
+    def get_placements(self, times, tolerance=0.0):
+        return rank_counts(times, self.is_empty, tolerance)
 
-    def save_results(self, race_number, race_times, counts):
-        # Post results to the current race number
+    def save_results(self, race_number, race_times, counts, tolerance=0.0):
+        # Post results to the current race number. tolerance is in seconds.
         self.race_number.append(race_number)
         self.times.append(race_times)
         self.counts.append(counts)
-        self.placements.append(self.get_placements(race_times))
+        self.placements.append(self.get_placements(race_times, tolerance))
         self.current_race = len(self.race_number) - 1
 
     def set_current_race(self, idx):
         if idx <= 0:
             self.current_race = 0
-        elif idx >= len(self.race_times):
-            self.current_race = len(self.race_times) - 1
+        elif idx >= len(self.race_number):
+            self.current_race = len(self.race_number) - 1
         else:
             self.current_race = idx
 
@@ -364,7 +467,7 @@ class Race:
         for heat, racer, is_empty in zip(self.heats, self.racers, self.is_empty):
             entries.append({'racer': racer.name,
                             'heat': heat.name,
-                            'empty_lane': is_empty})
+                            'empty_lane': bool(is_empty)})
         if self.accepted_result_idx < 0:
             out = {'planned_number': self.plan_number,
                    'entries': entries,
@@ -374,10 +477,10 @@ class Race:
             out = {'planned_number': self.plan_number,
                    'entries': entries,
                    'accepted_result_idx': self.accepted_result_idx,
-                   'times': self.times,
-                   'counts': self.counts,
-                   'index_of_race(s)_in_log': self.race_number,
-                   'placements': self.placements}
+                   'times': [[float(x) for x in times] for times in self.times],
+                   'counts': [[int(x) for x in counts] for counts in self.counts],
+                   'index_of_race(s)_in_log': [int(x) for x in self.race_number],
+                   'placements': [[int(x) for x in places] for places in self.placements]}
         return out
 
     def get_racer_list(self, out=[]):
@@ -421,7 +524,8 @@ class Event:
                  event_file: str = None,
                  log_file: str = None,
                  n_lanes: int = 4,
-                 verbose: bool = False):
+                 verbose: bool = False,
+                 calibration: TimerCalibration = None):
         """
         Event holds all the information for the race day.
 
@@ -429,10 +533,13 @@ class Event:
         :param log_file:
         :param n_lanes:
         :param verbose:
-        :param check_log_file:
+        :param calibration: Converts lane timer counts to times.
         """
         self.verbose = verbose
         self.n_lanes = n_lanes
+        self.observers = []
+        self.snapshots = None  # A SnapshotCache once snapshot() is used
+        self.views = None  # A RaceViewCache once race_view() is used
 
         # Load the race data
         self.heats = [self.create_empty_lane_heat(), ]
@@ -442,13 +549,21 @@ class Event:
         self.current_race_log_idx = 0  # Race log race number
         self.last_race = 0
         self.plan_dictionary = None
+        if calibration is None:
+            calibration = TimerCalibration(n_lanes)
+        self.calibration = calibration
+        self.tie_tolerance = 0.0  # seconds
+        self.dynamic_schedule = False  # Skip and fill in for racers who are not checked in
+        self.store = None  # An EventStore when the event file is a database
         if event_file is not None:
             self.load_races_from_file(event_file)
 
         # Load the log file that gives what part of the race has
-        # already run
+        # already run. Results replayed from the log are not written back.
+        self.race_log_file = None
         if log_file is not None:
-            self.read_log_file(log_file)
+            if self.store is None:  # A store already holds every result
+                self.read_log_file(log_file)
 
             # we will be recording race data as it comes in, so open
             # the logfile for appending.
@@ -461,6 +576,38 @@ class Event:
             print("Logging disabled")
             self.race_log_file = open("/dev/null", "w")
             self.log_file_name = "/dev/null"
+        if self.store is not None:
+            self.store.attach(self)
+
+    def add_observer(self, callback):
+        """ Register callback(event, kind, **info) to be called after the
+        event changes. kind is one of 'result', 'race', 'plan', or 'racer'
+        (a racer or heat was edited). """
+        self.observers.append(callback)
+
+    def remove_observer(self, callback):
+        if callback in self.observers:
+            self.observers.remove(callback)
+
+    def notify(self, kind, **info):
+        for callback in self.observers:
+            callback(self, kind, **info)
+
+    def snapshot(self):
+        """ An immutable view of the event that other threads can read while
+        results keep coming in. Unchanged racers, heats and races are shared
+        with the previous snapshot. """
+        if self.snapshots is None:
+            from event_snapshot import SnapshotCache
+            self.snapshots = SnapshotCache(self)
+        return self.snapshots.snapshot()
+
+    def race_view(self, race_idx):
+        """ The prepared display record (chips, labels, attempts) of a race. """
+        if self.views is None:
+            from race_views import RaceViewCache
+            self.views = RaceViewCache(self)
+        return self.views.view(race_idx)
 
     def create_empty_lane_heat(self,
                                ability_rank=100000000000000):
@@ -471,6 +618,13 @@ class Event:
                     ability_rank=ability_rank)
 
     def load_races_from_file(self, file_name):
+        from event_store import EventStore, is_store_file
+        if is_store_file(file_name):
+            self.store = EventStore(file_name)
+            if not self.store.is_empty:
+                self.store.load(self)
+            return
+
         try:
             f = open(file_name)
         except FileNotFoundError:
@@ -498,6 +652,7 @@ class Event:
         self.last_race = len(self.races) - 1
 
     def load_races_from_yaml(self, file_name):
+        import yaml
         with open(file_name, 'r') as infile:
             self.plan_dictionary = yaml.safe_load(infile)
         for heat in self.plan_dictionary['heats']:
@@ -621,7 +776,14 @@ class Event:
             removed = True
         return removed
 
+    def times_from_counts(self, counts):
+        return [float(x) for x in self.calibration.to_seconds(counts)]
+
     def record_race_results(self, times, counts, accept):
+        """ Record a result for the current race. If times is None they
+        are derived from the counts. """
+        if times is None:
+            times = self.times_from_counts(counts)
         race = self.current_race
         racers = self.current_race.racers
         if self.race_log_file:
@@ -635,7 +797,9 @@ class Event:
                 self.race_log_file.write(",Accepted\n");
             else:
                 self.race_log_file.write(",NA\n");
-        race.save_results(self.current_race_log_idx, times, counts)
+        race.save_results(self.current_race_log_idx, times, counts,
+                          tolerance=self.tie_tolerance)
+        race_idx = self.current_race_idx
         if accept:
             self.accept_results()
         # TODO Here were are saving counts in a second data array (they are also saved in the races). This was a bug fix
@@ -645,8 +809,23 @@ class Event:
             self.counts.append([0] * self.n_lanes)
         for li in range(self.n_lanes):
             self.counts[self.current_race_log_idx][li] = counts[li]
+        self.notify('result', race_idx=race_idx,
+                    log_idx=self.current_race_log_idx, accepted=accept)
         self.current_race_log_idx += 1
 
+    def rank_accepted_races(self):
+        """ Rank the accepted result of every race in one call. Returns the
+        indices of the races that have accepted results and an
+        (n_races x n_lanes) array of places. """
+        race_idx = [ri for ri, race in enumerate(self.races)
+                    if race.accepted_result_idx >= 0]
+        if len(race_idx) == 0:
+            return race_idx, np.zeros((0, self.n_lanes), dtype=np.int64)
+        times = np.array([self.races[ri].times[self.races[ri].accepted_result_idx]
+                          for ri in race_idx], dtype=np.float64)
+        is_empty = np.array([self.races[ri].is_empty for ri in race_idx], dtype=bool)
+        return race_idx, rank_counts(times, is_empty, self.tie_tolerance)
+
     def get_counts_for_race(self, race_idx):
         if race_idx >= len(self.counts):
             return [0] * self.n_lanes
@@ -667,10 +846,11 @@ class Event:
         return out
 
     def print_plan_mc_sheet(self, file_name):
+        from pdflatex import PDFLaTeX
         with open('mc_sheet.tex', 'w') as tempfile:
             tempfile.write(mc_sheet_header + self.mc_table_header())
-            for idx, race in enumerate(self.races):
-                tempfile.write(race.as_mc_sheet(idx + 1))
+            for idx in range(len(self.races)):
+                tempfile.write(str(idx + 1) + self.race_view(idx).mc_row + "\\\\\n")
             tempfile.write(mc_table_footer)
         pdfl = PDFLaTeX.from_texfile('mc_sheet.tex')
         pdf, log, complete = pdfl.create_pdf()
@@ -721,9 +901,15 @@ class Event:
 
     def get_results_from_line(self, line):
         fields = line.split(',')
-        racer_names = [x for x in fields[2::3]]
-        times = [float(x) for x in fields[3::3]]
-        counts = [int(x) for x in fields[4::3]]
+        end = 2 + 3 * self.n_lanes  # The accepted flag follows the lanes
+        racer_names = [x for x in fields[2:end:3]]
+        # The log keeps the raw counts. Times are re-derived so that a
+        # change in calibration applies to earlier races as well.
+        try:
+            counts = [int(x) for x in fields[4:end:3]]
+        except ValueError:
+            return
+        times = self.times_from_counts(counts)
 
         try:
             race = self.races[int(fields[1])]
@@ -738,12 +924,29 @@ class Event:
             else:
                 self.record_race_results(times, counts, False)
 
+    def write_race_log(self, file_name):
+        """ Rewrite a race log holding every recorded result, in log order. """
+        entries = []
+        for race_idx, race in enumerate(self.races):
+            for ri, log_idx in enumerate(race.race_number):
+                entries.append((log_idx, race_idx, race, ri))
+        entries.sort(key=lambda x: x[:2])
+        with open(file_name, 'w') as outfile:
+            for log_idx, race_idx, race, ri in entries:
+                outfile.write("{},{}".format(log_idx, race_idx))
+                for li in range(self.n_lanes):
+                    outfile.write(",{},{},{}".format(
+                        race.racers[li].name, race.times[ri][li], race.counts[ri][li]))
+                if ri == race.accepted_result_idx:
+                    outfile.write(",Accepted\n")
+                else:
+                    outfile.write(",NA\n")
+
     def close_log_file(self):
         if self.race_log_file:
             self.race_log_file.close()
 
     def get_chips_for_race(self, race_number):
-        chips = [[], [], [], []]
         if race_number < 0:
             print("""illegal race number, {}, requested. Returning
                   race[0]""".format(race_number))
@@ -752,13 +955,18 @@ class Event:
             print("""illegal race number, {}, requested. Returning the last race,
                   race[{}]""".format(race_number, self.last_race))
             race_number = self.last_race
-        race = self.races[race_number]
-        for i in range(self.n_lanes):
-            chips[i] = race.racers[i].chip()
-        return chips
+        return list(self.race_view(race_number).chips)
 
     def goto_next_race(self):
-        self.goto_race(self.current_race_idx + 1)
+        if self.dynamic_schedule:
+            from scheduler import next_race_idx
+            self.goto_race(next_race_idx(self, self.current_race_idx + 1))
+        else:
+            self.goto_race(self.current_race_idx + 1)
+
+    def check_in(self, racer, present=True):
+        racer.checked_in = present
+        self.notify('racer', racer=racer)
 
     def goto_prev_race(self):
         self.goto_race(self.current_race_idx - 1)
@@ -773,6 +981,7 @@ class Event:
         else:
             self.current_race_idx = idx
             self.current_race = self.races[idx]
+            self.notify('race', race_idx=idx)
 
     def accept_results(self):
         self.current_race.post_results_to_racers()
@@ -786,6 +995,22 @@ class Event:
         else:
             self.adopt_revised_plan(revised_plan)
 
+        from event_store import EventStore, is_store_file
+        if is_store_file(file_name):
+            if self.store is not None and self.store.file_name == file_name:
+                self.store.save_plan(self)
+            else:
+                store = EventStore(file_name)
+                store.save_event(self)
+                store.close()
+            return
+
+        self.write_plan_yaml(file_name)
+
+    def write_plan_yaml(self, file_name, results=True):
+        """ Write the heats and races as they are. Leave the results out
+        when the plan is read back along with its race log, which would
+        record them a second time. """
         plan_dict = {
             'heats': [],
             'races': []
@@ -794,8 +1019,14 @@ class Event:
             plan_dict['heats'].append(heat.to_dict())
 
         for race in self.races:
-            plan_dict['races'].append(race.to_dict())
-
+            race_dict = race.to_dict()
+            if not results:
+                race_dict = {'planned_number': race_dict['planned_number'],
+                             'entries': race_dict['entries'],
+                             'accepted_result_idx': -1}
+            plan_dict['races'].append(race_dict)
+
+        import yaml
         with open(file_name, 'w') as outfile:
             yaml.safe_dump(plan_dict, outfile, indent=2)
 
@@ -892,6 +1123,7 @@ class Event:
                 self.current_race = None
 
         self.last_race = len(self.races) - 1
+        self.notify('plan')
 
     def parse_cell_text(self, text):
         try:
@@ -943,13 +1175,16 @@ class Event:
                 self.current_race = self.races[0]
             except IndexError:
                 self.current_race = None
+        self.last_race = len(self.races) - 1
+        self.notify('plan')
 
-    def get_race_plan(self):
-        self.generate_race_plan()
+    def get_race_plan(self, regenerate=True):
+        if regenerate:
+            self.generate_race_plan()
 
         out_list = []
-        for idx, race in enumerate(self.races):
-            out_list.append(race.get_racer_list([]))
+        for idx in range(len(self.races)):
+            out_list.append(list(self.race_view(idx).labels))
 
         return out_list
 
@@ -974,9 +1209,8 @@ def create_racer_from_dict(rcr_dict, heat_name):
                 car_number=next_car_number(),
                 heat_name=heat_name)
     if 'car_status' in rcr_dict.keys():
-        car_status = rcr_dict['car_status']
-        for key in car_status:
-            out.car_status[key] = car_status[key]
+        out.inspection.from_dict(rcr_dict['car_status'])
+    out.checked_in = bool(rcr_dict.get('checked_in', True))
     return out
 
 
@@ -1028,7 +1262,7 @@ def create_race_from_dict(race, available_heats):
     race_num = race['planned_number']
     heats = []
     racers = []
-    is_empty = np.zeros(len(race['entries']), dtype=np.bool)
+    is_empty = np.zeros(len(race['entries']), dtype=bool)
     for li, ent in enumerate(race['entries']):
         if ent['empty_lane']:
             heats.append(available_heats[-1])
@@ -1045,11 +1279,10 @@ def create_race_from_dict(race, available_heats):
                             racers.append(available_racer)
                             break
                     break
+    out = Race(heats, racers, race_num, is_empty)
     if race['accepted_result_idx'] >= 0:
-        print("Write code to load the rest!")
-
-    out_str = str(race_num)
-    for racer, heat in zip(racers, heats):
-        out_str += " {}:{}".format(racer.name, heat.name)
-    print(out_str)
-    return Race(heats, racers, race_num, is_empty)
+        for log_number, times, counts in zip(race['index_of_race(s)_in_log'],
+                                             race['times'], race['counts']):
+            out.save_results(log_number, times, counts)
+        out.post_results_to_racers(i=race['accepted_result_idx'])
+    return out
@@ -0,0 +1,335 @@
+"""
+race_export.py
+
+Streaming export of event results so that a scoreboard PC or a spreadsheet can
+follow the event without re-parsing the text report. Three tables are
+available:
+
+standings:      One row per racer, ranked by average time.
+
+results:        One row per lane of every accepted race.
+
+lane_stats:     One row per lane with the count, mean, spread and extremes of
+the accepted times in that lane.
+
+Rows are produced by generators and written straight through to a sink (CSV,
+JSON Lines, or Parquet when pyarrow is installed). In incremental mode only the
+accepted results that have not been exported yet are appended. When a race is
+run again and a different attempt accepted the results are written again in
+full, so the replaced attempt does not stay behind.
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import csv
+import glob
+import json
+import os
+from typing import Iterable, Iterator
+
+import numpy as np
+
+standings_fields = ['rank', 'name', 'heat', 'car_number', 'average', 'best',
+                    'worst', 'n_runs']
+results_fields = ['log_number', 'plan_number', 'lane', 'racer', 'heat',
+                  'car_number', 'time', 'count', 'placement']
+lane_stats_fields = ['lane', 'n_runs', 'mean', 'std', 'min', 'max']
+
+export_formats = {'csv': '.csv',
+                  'jsonl': '.jsonl',
+                  'parquet': '.parquet'}
+
+
+# ROW GENERATORS
+def iter_standings(event, by_heat=False) -> Iterator[dict]:
+    """ Yield one row per racer with a posted time, best average first. """
+    racers = []
+    for heat in event.heats[:-1]:
+        racers.extend(heat.racers)
+    if len(racers) == 0:
+        return
+    averages = np.array([racer.get_average() for racer in racers])
+    order = np.argsort(averages, kind='stable')
+
+    ranks = {}
+    for idx in order:
+        if averages[idx] <= 0.0:
+            continue
+        racer = racers[idx]
+        key = racer.heat_name if by_heat else None
+        ranks[key] = ranks.get(key, 0) + 1
+        posted = racer.race_times[racer.race_times > 0.0]
+        yield {'rank': ranks[key],
+               'name': racer.name,
+               'heat': racer.heat_name,
+               'car_number': racer.car_number,
+               'average': float(averages[idx]),
+               'best': float(racer.get_best()),
+               'worst': float(racer.get_worst()),
+               'n_runs': int(len(posted))}
+
+
+def iter_results(event, exclude: set = None) -> Iterator[dict]:
+    """ Yield one row per occupied lane of each accepted race. Races whose
+    (plan number, log number) key is in exclude are skipped. """
+    race_idx, places = event.rank_accepted_races()
+    for race, race_places in zip((event.races[ri] for ri in race_idx), places):
+        ai = race.accepted_result_idx
+        log_number = int(race.race_number[ai])
+        if exclude is not None and (race.plan_number, log_number) in exclude:
+            continue
+        for lane_idx, racer in enumerate(race.racers):
+            if race.is_empty[lane_idx]:
+                continue
+            yield {'log_number': log_number,
+                   'plan_number': int(race.plan_number),
+                   'lane': lane_idx + 1,
+                   'racer': racer.name,
+                   'heat': racer.heat_name,
+                   'car_number': racer.car_number,
+                   'time': float(race.times[ai][lane_idx]),
+                   'count': int(race.counts[ai][lane_idx]),
+                   'placement': int(race_places[lane_idx])}
+
+
+def accepted_attempts(event) -> dict:
+    """ {plan number: log number} of the accepted result of each race. """
+    out = {}
+    for race in event.races:
+        if race.accepted_result_idx >= 0:
+            out[int(race.plan_number)] = int(race.race_number[race.accepted_result_idx])
+    return out
+
+
+def iter_lane_stats(event, results: Iterable[dict] = None) -> Iterator[dict]:
+    """ Yield running statistics for each lane. The statistics are gathered
+    in a single pass over the results (Welford's method) so nothing is
+    materialized. """
+    if results is None:
+        results = iter_results(event)
+    n = np.zeros(event.n_lanes, dtype=np.int64)
+    mean = np.zeros(event.n_lanes)
+    m2 = np.zeros(event.n_lanes)
+    low = np.full(event.n_lanes, np.inf)
+    high = np.zeros(event.n_lanes)
+    for row in results:
+        li = row['lane'] - 1
+        t = row['time']
+        if t <= 0.0:
+            continue
+        n[li] += 1
+        delta = t - mean[li]
+        mean[li] += delta / n[li]
+        m2[li] += delta * (t - mean[li])
+        low[li] = min(low[li], t)
+        high[li] = max(high[li], t)
+    for li in range(event.n_lanes):
+        if n[li] == 0:
+            yield {'lane': li + 1, 'n_runs': 0, 'mean': 0.0, 'std': 0.0,
+                   'min': 0.0, 'max': 0.0}
+        else:
+            yield {'lane': li + 1,
+                   'n_runs': int(n[li]),
+                   'mean': float(mean[li]),
+                   'std': float(np.sqrt(m2[li] / n[li])),
+                   'min': float(low[li]),
+                   'max': float(high[li])}
+
+
+# SINKS
+class CsvSink:
+    def __init__(self, file_name, fields, append=False):
+        write_header = not (append and os.path.isfile(file_name)
+                            and os.path.getsize(file_name) > 0)
+        self._file = open(file_name, 'a' if append else 'w', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=fields)
+        if write_header:
+            self._writer.writeheader()
+
+    def write_rows(self, rows: Iterable[dict]):
+        count = 0
+        for row in rows:
+            self._writer.writerow(row)
+            count += 1
+        return count
+
+    def close(self):
+        self._file.close()
+
+
+class JsonLinesSink:
+    def __init__(self, file_name, fields, append=False):
+        self.fields = fields
+        self._file = open(file_name, 'a' if append else 'w')
+
+    def write_rows(self, rows: Iterable[dict]):
+        count = 0
+        for row in rows:
+            self._file.write(json.dumps(row) + '\n')
+            count += 1
+        return count
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink:
+    """ Parquet files can not be appended to, so in append mode each export
+    is written to a new numbered part next to the requested file. Rows are
+    written in row groups of batch_size. """
+
+    def __init__(self, file_name, fields, append=False, batch_size=1024):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("Parquet export requires pyarrow to be installed.")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.fields = fields
+        self.batch_size = batch_size
+        if append:
+            base, ext = os.path.splitext(file_name)
+            part = 0
+            while os.path.isfile(f"{base}-{part:04d}{ext}"):
+                part += 1
+            file_name = f"{base}-{part:04d}{ext}"
+        self.file_name = file_name
+        self._writer = None
+
+    def _flush(self, batch):
+        table = self._pa.Table.from_pylist(batch)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self.file_name, table.schema)
+        self._writer.write_table(table)
+
+    def write_rows(self, rows: Iterable[dict]):
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            count += 1
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if len(batch) > 0:
+            self._flush(batch)
+        return count
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def open_sink(file_name, fields, fmt='csv', append=False):
+    if fmt == 'csv':
+        return CsvSink(file_name, fields, append=append)
+    elif fmt == 'jsonl':
+        return JsonLinesSink(file_name, fields, append=append)
+    elif fmt == 'parquet':
+        return ParquetSink(file_name, fields, append=append)
+    raise ValueError(f"Unknown export format '{fmt}'. Options are {list(export_formats.keys())}.")
+
+
+class ResultsExporter:
+    """
+    Writes standings.<ext>, results.<ext> and lane_stats.<ext> into a
+    directory. With incremental=True the results table is appended to and a
+    small state file remembers which attempt of each race was written, so
+    the exporter can be called after every accepted race (or after a restart)
+    at the cost of only the new rows. If a written attempt is no longer the
+    accepted one the results table is written again from scratch.
+    """
+    state_file_name = '.export_state.json'
+
+    def __init__(self,
+                 directory: str,
+                 fmt: str = 'csv',
+                 incremental: bool = True,
+                 by_heat: bool = False):
+        if fmt not in export_formats:
+            raise ValueError(f"Unknown export format '{fmt}'. Options are {list(export_formats.keys())}.")
+        self.directory = directory
+        self.fmt = fmt
+        self.incremental = incremental
+        self.by_heat = by_heat
+        self.exported = {}  # plan number -> log number written
+        os.makedirs(directory, exist_ok=True)
+        if incremental:
+            self.load_state()
+
+    def path(self, table):
+        return os.path.join(self.directory, table + export_formats[self.fmt])
+
+    def load_state(self):
+        try:
+            with open(os.path.join(self.directory, self.state_file_name)) as infile:
+                state = json.load(infile)
+        except (OSError, ValueError):
+            return
+        if state.get('format') == self.fmt:
+            self.exported = dict(tuple(x) for x in state.get('exported', []))
+
+    def save_state(self):
+        with open(os.path.join(self.directory, self.state_file_name), 'w') as outfile:
+            json.dump({'format': self.fmt,
+                       'exported': sorted(self.exported.items())}, outfile)
+
+    def clear_results(self):
+        """ Remove the results table, including any Parquet parts. """
+        base, ext = os.path.splitext(self.path('results'))
+        parts = glob.glob(glob.escape(base) + '-[0-9][0-9][0-9][0-9]' + ext)
+        for file_name in [self.path('results')] + parts:
+            try:
+                os.remove(file_name)
+            except FileNotFoundError:
+                pass
+
+    def export(self, event):
+        """ Write all three tables. Returns the number of result rows written. """
+        sink = open_sink(self.path('standings'), standings_fields, self.fmt)
+        try:
+            sink.write_rows(iter_standings(event, by_heat=self.by_heat))
+        finally:
+            sink.close()
+
+        sink = open_sink(self.path('lane_stats'), lane_stats_fields, self.fmt)
+        try:
+            sink.write_rows(iter_lane_stats(event))
+        finally:
+            sink.close()
+
+        exclude = None
+        if self.incremental:
+            accepted = accepted_attempts(event)
+            if any(accepted.get(plan_number) != log_number
+                   for plan_number, log_number in self.exported.items()):
+                # Another attempt was accepted since these rows were written
+                self.clear_results()
+                self.exported = {}
+            exclude = set(self.exported.items())
+        sink = open_sink(self.path('results'), results_fields, self.fmt,
+                         append=self.incremental)
+        try:
+            n_rows = sink.write_rows(self._track(iter_results(event, exclude=exclude)))
+        finally:
+            sink.close()
+        if self.incremental:
+            self.save_state()
+        return n_rows
+
+    def _track(self, rows):
+        for row in rows:
+            self.exported[row['plan_number']] = row['log_number']
+            yield row
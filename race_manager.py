@@ -22,14 +22,20 @@ limitations under the License.
 """
 
 from typing import List
-import numpy as np
 import tkinter as tk
 from tkinter import filedialog, IntVar
 import tkinter.messagebox
-from race_event import Event
+from race_event import Event, rank_counts
 import argparse
+import threading
+import time
 from rm_socket import TimerComs
-import registration
+from race_export import ResultsExporter, export_formats
+from timer_clock import TimerCalibration, default_rate
+from auto_advance import AutoAdvance
+from outliers import OutlierDetector
+from race_timeline import RaceTimeline
+from profiler import profile_modes
 
 description = "A Graphical Interface for managing Pinewood Derby Races"
 
@@ -40,6 +46,45 @@ parser.add_argument('--event_file', help='A file with the event plan listed.',
                     default='demo_race.yaml')
 parser.add_argument('--log_file', help='The name of a file to save race times to.',
                     default='log_file.yaml')
+parser.add_argument('--export_dir', help='A directory to stream standings and results to as races are accepted.',
+                    default=None)
+parser.add_argument('--export_format', help='The format used for exported results.',
+                    choices=list(export_formats.keys()), default='csv')
+parser.add_argument('--clock_rate', help='Lane timer counts per second.',
+                    type=int, default=default_rate)
+parser.add_argument('--calibration_file',
+                    help='A file with lane,rate,offset,drift_ppb lines giving the calibration of each lane timer.',
+                    default=None)
+parser.add_argument('--feed_port', help='Serve a live results feed (HTTP + WebSocket) on this port.',
+                    type=int, default=None)
+parser.add_argument('--feed_host', help='The address the results feed listens on.',
+                    default='0.0.0.0')
+parser.add_argument('--gateway', help='Reach the lane timers through a timer_gateway.py at host:port or unix:/path.',
+                    default=None)
+parser.add_argument('--replication_listen',
+                    help='Publish every event change to standby managers at host:port or unix:/path.',
+                    default=None)
+parser.add_argument('--standby', help='Follow the primary manager at host:port or unix:/path until taking over.',
+                    default=None)
+parser.add_argument('--auto_advance',
+                    help='Accept results that pass the sanity checks, advance and reset the track this many '
+                         'seconds after the last lane finishes.',
+                    type=float, default=None)
+parser.add_argument('--dynamic_schedule',
+                    help='Skip racers who are not checked in and fill their lanes from later races.',
+                    action='store_true')
+parser.add_argument('--timeline_dir', help='Export the race day timeline to this directory on exit.',
+                    default=None)
+parser.add_argument('--metrics_file', help='Append lane timer latency and GUI timing statistics to this file.',
+                    default=None)
+parser.add_argument('--profile', help='Time the race day hot path, and optionally sample it, writing reports on exit.',
+                    choices=profile_modes, default=None)
+parser.add_argument('--profile_window', help='Seconds to run the cprofile or tracemalloc sampler after start up.',
+                    type=float, default=60.0)
+parser.add_argument('--profile_output', help='The base name of the profile reports.',
+                    default='race_manager_profile')
+parser.add_argument('--metrics_interval', help='Seconds between writes to the metrics file.',
+                    type=float, default=60.0)
 
 host = ['', '', '', '']
 port = [0, 0, 0, 0]
@@ -146,26 +191,21 @@ class RaceSelector:
         # Grab the embeded menu and change the choices
         race = self.event.current_race
 
-        for child in self.selector_frame.winfo_children():
-            child.destroy()
-        self.current_race_str = tk.StringVar(self.base_frame)
-
         # Create a new list
-        if len(race.race_number):
-            self.option_list = [str(x) for x in race.race_number]
-            self.option_list.append(str(self.event.current_race_log_idx))
+        option_list = list(self.event.race_view(self.event.current_race_idx).attempts)
+        option_list.append(str(self.event.current_race_log_idx))
+        if race.accepted_result_idx >= 0 and show_accepted_race:
+            selected = option_list[race.accepted_result_idx]
         else:
-            self.option_list = [str(self.event.current_race_log_idx), ]
+            selected = str(self.active_race_idx)
+        if option_list == self.option_list and self.current_race_str.get() == selected:
+            return  # The menu already shows this
 
-        if race.accepted_result_idx >= 0:
-            idx = race.accepted_result_idx
-            self.option_list[idx] += ' < ACC'
-            if show_accepted_race:
-                self.current_race_str.set(self.option_list[idx])
-            else:
-                self.current_race_str.set(str(self.active_race_idx))
-        else:
-            self.current_race_str.set(str(self.active_race_idx))
+        for child in self.selector_frame.winfo_children():
+            child.destroy()
+        self.current_race_str = tk.StringVar(self.base_frame)
+        self.option_list = option_list
+        self.current_race_str.set(selected)
 
         self.race_menu = tk.OptionMenu(self.selector_frame,
                                        self.current_race_str,
@@ -385,7 +425,7 @@ class RaceTimes:
         updated_counts = rm_gui.event.get_counts_for_race(race_idx)
         race_count[self.idx] = updated_counts[self.idx]
         if race_count[self.idx]:
-            final_time = race_count[self.idx] / self.parent.parent.clock_rate
+            final_time = rm_gui.event.calibration.lane_seconds(self.idx, race_count[self.idx])
             self.race_time_display.config(text="{0:.3f}".format(final_time), fg='#000000')
             return True
         else:
@@ -475,18 +515,28 @@ class RaceColumn:
         for j in range(parent.n_lanes):
             self.racer_id.append(tk.Label(rc, bg=parent.lane_colors[j], **chips[j]))
             self.racer_id[j].pack(fill=tk.BOTH, expand=1)
+        self.shown = list(chips)
+        self.race_number = None
         self.mf = rc
 
     def update(self, chips, race_number):
+        # The chips come from the event's view cache, so a lane that shows
+        # the same chip object is already up to date.
         for idx, rid in enumerate(self.racer_id):
-            rid.config(**chips[idx])
-        self.column_label.config(text="#{}".format(race_number))
+            if chips[idx] is not self.shown[idx]:
+                rid.config(**chips[idx])
+        self.shown = list(chips)
+        if race_number != self.race_number:
+            self.column_label.config(text="#{}".format(race_number))
+            self.race_number = race_number
 
 
 class ControlsRow:
     navigation_buttons: dict = {}
     accept_button: tk.Button = None
     autoReset: IntVar = None
+    autoAdvance: IntVar = None
+    status_label: tk.Label = None
 
     def __init__(self,
                  parent):
@@ -504,6 +554,11 @@ class ControlsRow:
         ta = tk.Checkbutton(cr, text="Auto Reset", variable=self.autoReset, onvalue=1, offvalue=0)
         ta.pack(side=tk.LEFT)
         self.navigation_buttons['Auto Reset'] = ta
+        self.autoAdvance = IntVar()
+        tb = tk.Checkbutton(cr, text="Auto Advance", variable=self.autoAdvance, onvalue=1, offvalue=0)
+        tb.pack(side=tk.LEFT)
+        self.status_label = tk.Label(cr, text="", font=small_font)
+        self.status_label.pack(side=tk.LEFT)
         cr.pack()
 
     def disable_navigation(self):
@@ -528,23 +583,81 @@ class RaceManagerGUI:
     next_up_column1: RaceColumn = None
     controls_row: ControlsRow = None
     event: Event = None
-    clock_rate = 2000.0
     event_file_name: str = None
     log_file_name: str = None
+    exporter: ResultsExporter = None
+    export_thread: threading.Thread = None
+    export_pending = None  # (exporter, snapshot) waiting for the export thread
+    feed: 'ResultsFeed' = None
+    feed_publisher: 'FeedPublisher' = None
+    replication: 'ReplicationPrimary' = None
+    standby: 'ReplicationStandby' = None
+    plan_editor: 'RegistrationWindow' = None
+    auto_advance: AutoAdvance = None
+    outliers: OutlierDetector = None
+    timeline: RaceTimeline = None
+    timeline_dir: str = None
+    auto_pending = None  # (plan race, log race) waiting to be accepted automatically
 
     def __init__(self,
                  hosts_file_name: str = None,
                  event_file_name: str = None,
-                 log_file_name: str = None):
-
+                 log_file_name: str = None,
+                 export_dir: str = None,
+                 export_format: str = 'csv',
+                 feed_port: int = None,
+                 feed_host: str = '0.0.0.0',
+                 clock_rate: int = default_rate,
+                 calibration_file: str = None,
+                 replication_listen: str = None,
+                 standby: str = None,
+                 auto_advance: float = None,
+                 timeline_dir: str = None,
+                 dynamic_schedule: bool = False):
+
+        calibration = TimerCalibration(self.n_lanes, rate=clock_rate)
+        if calibration_file is not None:
+            calibration.load(calibration_file)
         self.event_file_name = event_file_name
-        self.event = Event(event_file_name, log_file_name, self.n_lanes)
+        # A standby gets its state from the primary and only writes the log
+        # once it takes over.
+        self.event = Event(event_file_name, None if standby else log_file_name,
+                           self.n_lanes, calibration=calibration)
         self.log_file_name = log_file_name
+        self.export_format = export_format
+        self.export_lock = threading.Lock()
+        self.auto_advance = AutoAdvance(3.0 if auto_advance is None else auto_advance)
+        self.outliers = OutlierDetector(self.n_lanes, min_time=self.auto_advance.min_time,
+                                        max_time=self.auto_advance.max_time)
+        self.outliers.attach(self.event)
+        self.timeline = RaceTimeline(self.n_lanes)
+        self.timeline.attach(self.event)
+        self.timeline_dir = timeline_dir
+        self.event.dynamic_schedule = dynamic_schedule
+        self.event.add_observer(self.on_plan_change)
+        if export_dir is not None:
+            self.exporter = ResultsExporter(export_dir, fmt=export_format)
 
         self.window = tk.Tk()
         self.window.title("Pack 402 Pinewood Derby")
         self.window.geometry(self.window_size)
 
+        if feed_port is not None:
+            from results_feed import ResultsFeed, FeedPublisher
+            self.feed = ResultsFeed(host=feed_host, port=feed_port)
+            self.feed.start()
+            self.feed_publisher = FeedPublisher(self.event, self.feed,
+                                                schedule=self.window.after_idle)
+
+        if replication_listen is not None:
+            from replication import ReplicationPrimary
+            self.replication = ReplicationPrimary(self.event, replication_listen,
+                                                  schedule=self.window.after_idle)
+        if standby is not None:
+            from replication import ReplicationStandby
+            self.standby = ReplicationStandby(self.event, standby)
+            self.window.title("Pack 402 Pinewood Derby (STANDBY)")
+
         if hosts_file_name is not None:
             self.timer_coms = TimerComs(
                 parent=self.window,
@@ -557,6 +670,8 @@ class RaceManagerGUI:
         self.load_main_frame()
         self.main_frame.pack(fill=tk.BOTH, expand=1)
         self.controls_row = ControlsRow(self.window)
+        if auto_advance is not None:
+            self.controls_row.autoAdvance.set(1)
         # Add window delete callback
         self.window.protocol("WM_DELETE_WINDOW", self.close_manager)
 
@@ -568,6 +683,9 @@ class RaceManagerGUI:
         self.window.config(menu=menu)
         file_menu = tk.Menu(menu)
         file_menu.add_command(label="Generate Report", command=generate_report)
+        file_menu.add_command(label="Export Results", command=self.export_results)
+        if self.standby is not None:
+            file_menu.add_command(label="Take Over", command=self.take_over)
         open_menu = tk.Menu(file_menu)
         open_menu.add_command(label="Event File", command=self.load_event_file)
         open_menu.add_command(label="Race Log", command=self.load_race_log)
@@ -585,6 +703,10 @@ class RaceManagerGUI:
         settings_menu.add_command(label="Plan", command=self.edit_race_plan)
         settings_menu.add_command(label="Frequency", command=self.set_counter_frequency)
         settings_menu.add_command(label="Lanes", command=self.edit_lanes)
+        settings_menu.add_command(label="Diagnostics", command=self.show_diagnostics)
+        settings_menu.add_command(label="Timeline", command=self.show_timeline)
+        settings_menu.add_command(label="Check In", command=self.show_check_in)
+        settings_menu.add_command(label="Finals", command=self.show_finals)
         menu.add_cascade(label="Settings", menu=settings_menu)
 
     def close_manager(self):
@@ -596,7 +718,18 @@ class RaceManagerGUI:
             race_needs_written = False
         print("Final race written to file.")
         self.event.close_log_file()
+        if self.timeline_dir is not None:
+            self.export_timeline(self.timeline_dir)
         self.timer_coms.shutdown()
+        if self.feed is not None:
+            self.feed.shutdown()
+        if self.replication is not None:
+            self.replication.shutdown()
+        if self.standby is not None:
+            self.standby.active = False
+        export_thread = self.export_thread
+        if export_thread is not None:
+            export_thread.join(timeout=5.0)
         self.running = False
         program_running = False
 
@@ -649,6 +782,7 @@ class RaceManagerGUI:
         file_name = filedialog.askopenfilename(
             title="Select Race Plan",
             filetypes=(("YAML (preferred)", "*.yaml"),
+                       ("SQLite event store", "*.db *.sqlite"),
                        ("comma separated variables", "*.csv")))
         if len(file_name) > 0:
             self.event_file_name = file_name
@@ -667,30 +801,136 @@ class RaceManagerGUI:
             print("Unable to save file.")
 
     def reload_event(self):
+        calibration = self.event.calibration
+        dynamic_schedule = self.event.dynamic_schedule
+        if self.event.store is not None:
+            self.event.store.close()
         if self.log_file_name == '/dev/null':
             self.event.close_log_file()
             self.event = Event(event_file=self.event_file_name, log_file=None,
-                               n_lanes=self.n_lanes)
+                               n_lanes=self.n_lanes, calibration=calibration)
         else:
             self.event = Event(event_file=self.event_file_name,
                                log_file=self.log_file_name,
-                               n_lanes=self.n_lanes)
+                               n_lanes=self.n_lanes, calibration=calibration)
+        if self.feed_publisher is not None:
+            self.feed_publisher.attach(self.event)
+        if self.replication is not None:
+            self.replication.attach(self.event)
+        self.outliers = OutlierDetector(self.n_lanes, min_time=self.auto_advance.min_time,
+                                        max_time=self.auto_advance.max_time)
+        self.outliers.attach(self.event)
+        self.timeline.attach(self.event)
+        self.event.dynamic_schedule = dynamic_schedule
+        self.event.add_observer(self.on_plan_change)
         self.set_active_race_idx(0)
         self.update_race_display(new_race=False)
 
     def edit_race_plan(self, *args):
+        # The editor runs on the main Tk loop, so the timers are still
+        # handled while it is open.
+        if self.plan_editor is not None:
+            self.plan_editor.top.lift()
+            return
+        import registration  # Loads tksheet, so only when the editor is opened
         popup = tk.Toplevel(self.window)
         popup.wm_title("Race Plan Editor")
-        edit_window = registration.RegistrationWindow(
-            popup, self.event_file_name, self.event)
+        self.plan_editor = registration.RegistrationWindow(
+            popup, self.event_file_name, self.event, on_close=self.plan_editor_closed)
 
-        while edit_window.running:
-            popup.update_idletasks()
-            popup.update()
+    def plan_editor_closed(self):
+        self.plan_editor = None
+        self.update_race_display(new_race=False)
 
-        popup.destroy()
+    def race_finished(self):
+        """ Called once every lane has finished. A run with an implausible
+        time is flagged, and with auto advance on it is saved as a
+        non-accepted attempt and the race is run again straight away, up to
+        outliers.max_reruns times. """
+        flags = self.outliers.check_race(self.event, race_count)
+        if not flags:
+            self.schedule_auto_advance()
+            return
+        self.outliers.flag(self.event.current_race, self.event.current_race_log_idx, flags)
+        for li, reason in flags.items():
+            print(f"Lane {li + 1} looks wrong: {reason}.")
+        lanes = ', '.join(str(li + 1) for li in flags)
+        n_flagged = self.outliers.n_flagged(self.event.current_race)
+        if self.controls_row.autoAdvance.get() and not self.outliers.may_rerun(self.event.current_race):
+            self.controls_row.status_label.config(
+                text=f"Held after {n_flagged} flagged runs: lane(s) {lanes}")
+        elif self.controls_row.autoAdvance.get():
+            self.controls_row.status_label.config(text=f"Rerunning: lane(s) {lanes} flagged")
+            send_reset_to_track(accept=False, send_reset=True)
+            self.update_race_display(new_race=True)
+        else:
+            self.controls_row.status_label.config(text=f"Rerun? Lane(s) {lanes} flagged")
 
-        self.update_race_display(new_race=False)
+    def schedule_auto_advance(self):
+        """ Called once every lane has finished. Clean results are accepted
+        after the auto advance delay; anything odd is held for the operator. """
+        if not self.controls_row.autoAdvance.get():
+            return
+        problems = self.auto_advance.check(self.event, race_count)
+        if problems:
+            print("Auto advance held: " + ' '.join(problems))
+            self.controls_row.status_label.config(text="Held: " + problems[0])
+            return
+        self.auto_pending = (self.event.current_race_idx, self.event.current_race_log_idx)
+        self.controls_row.status_label.config(
+            text=f"Accepting in {self.auto_advance.delay_s:.1f} s")
+        self.window.after(int(1000 * self.auto_advance.delay_s), self.auto_accept, self.auto_pending)
+
+    def auto_accept(self, pending):
+        global race_needs_written
+        if pending != self.auto_pending:
+            return
+        self.auto_pending = None
+        # The operator may have accepted, moved or switched auto advance off meanwhile
+        if not self.controls_row.autoAdvance.get() or not all(race_complete) or \
+                pending != (self.event.current_race_idx, self.event.current_race_log_idx) or \
+                self.event.current_race.accepted_result_idx >= 0:
+            self.controls_row.status_label.config(text="")
+            return
+        race_needs_written = True
+        send_reset_to_track(accept=True, send_reset=True)
+        self.update_race_display(new_race=True)
+        self.auto_advance.accepted()
+        self.controls_row.status_label.config(text=self.auto_advance.status())
+
+    def export_results(self, *args):
+        directory = filedialog.askdirectory(title="Select a Directory to Export Results To")
+        if len(directory) > 0:
+            self.exporter = ResultsExporter(directory, fmt=self.export_format)
+            self.export_live()
+        else:
+            print("Export canceled.")
+
+    def export_live(self):
+        # The files are written from a snapshot on another thread so the
+        # timers are never held up by the export.
+        if self.exporter is None:
+            return
+        with self.export_lock:
+            self.export_pending = (self.exporter, self.event.snapshot())
+            if self.export_thread is None:
+                self.export_thread = threading.Thread(target=self._export_worker, daemon=True)
+                self.export_thread.start()
+
+    def _export_worker(self):
+        while True:
+            with self.export_lock:
+                if self.export_pending is None:
+                    self.export_thread = None
+                    return
+                exporter, snapshot = self.export_pending
+                self.export_pending = None
+            try:
+                n_rows = exporter.export(snapshot)
+            except (OSError, ValueError) as e:
+                print(f"Unable to export results: {e}")
+            else:
+                print(f"Exported {n_rows} new result rows to {exporter.directory}.")
 
     def load_timer_hosts(self, *args):
         file_name = filedialog.askopenfilename(
@@ -737,15 +977,315 @@ class RaceManagerGUI:
             print("Unable to save file.")
 
     def set_counter_frequency(self, *args):
-        popup = tk.Toplevel(self.window)
-        tk.Label(popup, text="Dynamically setting the frequency is not supported yet.\n" +
-                             " Try changing clock_rate in RaceManagerGUI").pack()
+        ClockSettings(self)
+
+    def take_over(self, *args):
+        if self.standby is None or not self.standby.active:
+            return
+        self.standby.take_over(self.log_file_name)
+        print(f"Took over from the primary. Recording to {self.log_file_name}.")
+        self.window.title("Pack 402 Pinewood Derby")
+        self.set_active_race_idx(self.event.current_race_log_idx)
+        self.update_race_display(new_race=False)
+
+    def show_diagnostics(self, *args):
+        TimerDiagnostics(self)
+
+    def show_timeline(self, *args):
+        TimelinePanel(self)
+
+    def export_timeline(self, directory):
+        try:
+            file_names = self.timeline.export(directory, fmt=self.export_format)
+        except (OSError, ValueError) as e:
+            print(f"Unable to export the timeline: {e}")
+        else:
+            print(f"Wrote {', '.join(file_names)}")
+
+    def show_check_in(self, *args):
+        CheckInWindow(self)
+
+    def check_in(self, racer, present=True):
+        self.event.check_in(racer, present)
+        self.compact_current_race()
+        self.save_schedule()
+
+    def compact_current_race(self):
+        """ With the dynamic schedule on, the current race is compacted
+        straight away unless it has started. """
+        if self.event.dynamic_schedule and not race_needs_written:
+            from scheduler import compact_race
+            if compact_race(self.event, self.event.current_race_idx):
+                self.update_race_display(new_race=False)
+
+    def show_finals(self, *args):
+        FinalsDialog(self)
+
+    def add_finals(self, n, per_heat=False, eliminate=False):
+        import finals
+        try:
+            if eliminate:
+                heat = finals.add_elimination_round(self.event, n)
+            else:
+                heat = finals.add_finals_round(self.event, n, per_heat=per_heat)
+        except ValueError as e:
+            print(e)
+            return None
+        print(f"Added {heat.name} with {len(heat.racers)} racers in "
+              f"{finals.n_round_races(len(heat.racers), self.n_lanes)} races.")
+        self.save_schedule()
+        self.update_race_selector(True)
+        self.update_race_display(new_race=False)
+        return heat
+
+    def on_plan_change(self, event, kind, **info):
+        if kind == 'plan' and event.dynamic_schedule:
+            self.save_schedule()
+
+    def save_schedule(self):
+        # A store saves itself, a yaml plan is rewritten with the check ins
+        # and the compacted races. The results are left to the race log.
+        if self.event.store is None and self.event_file_name is not None and \
+                self.event_file_name.lower().endswith(('.yaml', '.yml')):
+            self.event.write_plan_yaml(self.event_file_name, results=False)
+
+    def occupied_lanes(self):
+        return [li for li in range(self.n_lanes) if not self.event.current_race.is_empty[li]]
 
     def edit_lanes(self, *args):
         popup = tk.Toplevel(self.window)
         tk.Label(popup, text="Editing the number of lanes and lane characteristics is not supported yet.\n").pack()
 
 
+class ClockSettings:
+    """ A dialog for the lane timer calibration and the tie tolerance. """
+
+    def __init__(self, parent):
+        self.parent = parent
+        calibration = parent.event.calibration
+        self._window = tk.Toplevel(parent.window)
+        self._window.wm_title("Timer Calibration")
+        table = tk.Frame(self._window)
+        table.pack(fill=tk.BOTH, expand=1)
+        for ci, text in enumerate(("Lane", "Counts / second", "Offset (counts)", "Drift (ppb)")):
+            tk.Label(table, text=text, font=small_font).grid(row=0, column=ci)
+        self.entries = []
+        for li in range(calibration.n_lanes):
+            tk.Label(table, text=str(li + 1), bg=parent.lane_colors[li],
+                     font=small_font).grid(row=li + 1, column=0, sticky=tk.NSEW)
+            row = []
+            for ci, value in enumerate((calibration.rates[li], calibration.offsets[li],
+                                        calibration.drift_ppb[li])):
+                entry = tk.Entry(table, width=12)
+                entry.insert(0, str(value))
+                entry.grid(row=li + 1, column=ci + 1)
+                row.append(entry)
+            self.entries.append(row)
+        tol_frame = tk.Frame(self._window)
+        tol_frame.pack(fill=tk.X)
+        tk.Label(tol_frame, text="Tie tolerance (s)", font=small_font).pack(side=tk.LEFT)
+        self.tolerance = tk.Entry(tol_frame, width=10)
+        self.tolerance.insert(0, str(parent.event.tie_tolerance))
+        self.tolerance.pack(side=tk.LEFT)
+        self.message = tk.Label(self._window, text="", fg="red")
+        self.message.pack(fill=tk.X)
+        buttons = tk.Frame(self._window)
+        buttons.pack(fill=tk.X)
+        tk.Button(buttons, text="Apply", command=self.apply).pack(side=tk.LEFT)
+        tk.Button(buttons, text="Save", command=self.save).pack(side=tk.LEFT)
+        tk.Button(buttons, text="Load", command=self.load).pack(side=tk.LEFT)
+        tk.Button(buttons, text="Close", command=self._window.destroy).pack(side=tk.RIGHT)
+
+    def apply(self):
+        calibration = self.parent.event.calibration
+        try:
+            for li, (rate, offset, drift) in enumerate(self.entries):
+                calibration.set_lane(li, rate=rate.get(), offset=offset.get(),
+                                     drift_ppb=drift.get())
+            self.parent.event.tie_tolerance = float(self.tolerance.get())
+        except ValueError as e:
+            self.message.config(text=str(e))
+            return False
+        self.message.config(text="")
+        show_results()
+        return True
+
+    def save(self):
+        if not self.apply():
+            return
+        file_name = filedialog.asksaveasfilename(title="Save Calibration",
+                                                 defaultextension=".csv")
+        if len(file_name) > 0:
+            self.parent.event.calibration.save(file_name)
+
+    def load(self):
+        file_name = filedialog.askopenfilename(title="Load Calibration",
+                                               defaultextension=".csv")
+        if len(file_name) == 0:
+            return
+        calibration = self.parent.event.calibration
+        try:
+            calibration.load(file_name)
+        except (OSError, ValueError) as e:
+            self.message.config(text=str(e))
+            return
+        for li, row in enumerate(self.entries):
+            for entry, value in zip(row, (calibration.rates[li], calibration.offsets[li],
+                                          calibration.drift_ppb[li])):
+                entry.delete(0, tk.END)
+                entry.insert(0, str(value))
+        show_results()
+
+
+class TimerDiagnostics:
+    """ Lane timer latency and GUI timing, refreshed once a second. """
+    refresh_ms = 1000
+
+    def __init__(self, parent):
+        self.parent = parent
+        self._window = tk.Toplevel(parent.window)
+        self._window.wm_title("Timer Diagnostics")
+        self.text = tk.Text(self._window, width=84, height=20, font=("Courier", 10))
+        self.text.pack(fill=tk.BOTH, expand=1)
+        buttons = tk.Frame(self._window)
+        buttons.pack(fill=tk.X)
+        tk.Button(buttons, text="Save", command=self.save).pack(side=tk.LEFT)
+        tk.Button(buttons, text="Close", command=self._window.destroy).pack(side=tk.RIGHT)
+        self.refresh()
+
+    @property
+    def metrics(self):
+        timer_coms = getattr(self.parent, 'timer_coms', None)
+        if timer_coms is None:
+            return None
+        return timer_coms.metrics
+
+    def refresh(self):
+        if not self._window.winfo_exists():
+            return
+        self.text.delete('1.0', tk.END)
+        if self.metrics is None:
+            self.text.insert(tk.END, "Not connected to the lane timers.")
+        else:
+            self.text.insert(tk.END, self.parent.timer_coms.connection_report() + '\n\n')
+            self.text.insert(tk.END, self.metrics.report())
+        self._window.after(self.refresh_ms, self.refresh)
+
+    def save(self):
+        if self.metrics is None:
+            return
+        file_name = filedialog.asksaveasfilename(title="Save Timer Metrics",
+                                                 defaultextension=".jsonl")
+        if len(file_name) > 0:
+            self.metrics.dump(file_name)
+
+
+class TimelinePanel:
+    """ Races per hour, where the time goes and the projected finish. """
+    refresh_ms = 1000
+
+    def __init__(self, parent):
+        self.parent = parent
+        self._window = tk.Toplevel(parent.window)
+        self._window.wm_title("Race Timeline")
+        self.text = tk.Text(self._window, width=60, height=12, font=("Courier", 10))
+        self.text.pack(fill=tk.BOTH, expand=1)
+        buttons = tk.Frame(self._window)
+        buttons.pack(fill=tk.X)
+        tk.Button(buttons, text="Export", command=self.export).pack(side=tk.LEFT)
+        tk.Button(buttons, text="Close", command=self._window.destroy).pack(side=tk.RIGHT)
+        self.refresh()
+
+    def refresh(self):
+        if not self._window.winfo_exists():
+            return
+        self.text.delete('1.0', tk.END)
+        self.text.insert(tk.END, self.parent.timeline.report(self.parent.event))
+        self._window.after(self.refresh_ms, self.refresh)
+
+    def export(self):
+        directory = filedialog.askdirectory(title="Select a Directory to Export the Timeline To")
+        if len(directory) > 0:
+            self.parent.export_timeline(directory)
+
+
+class CheckInWindow:
+    """ A check box for each racer, ticked once they are at the event. """
+
+    def __init__(self, parent):
+        self.parent = parent
+        self._window = tk.Toplevel(parent.window)
+        self._window.wm_title("Check In")
+        self.dynamic = tk.IntVar(self._window, value=int(parent.event.dynamic_schedule))
+        tk.Checkbutton(self._window, text="Schedule around absent racers", variable=self.dynamic,
+                       command=self.set_dynamic).pack(anchor=tk.W)
+        table = tk.Frame(self._window)
+        table.pack(fill=tk.BOTH, expand=1)
+        self.present = {}
+        for col, heat in enumerate(parent.event.heats[:-1]):
+            tk.Label(table, text=heat.name, font=("Serif", 12, "bold")).grid(row=0, column=col, sticky=tk.W)
+            for row, racer in enumerate(heat.racers):
+                present = tk.IntVar(table, value=int(racer.checked_in))
+                self.present[id(racer)] = present
+                tk.Checkbutton(table, text=f"#{racer.car_number} {racer.name}", variable=present,
+                               command=lambda r=racer, v=present: parent.check_in(r, bool(v.get()))
+                               ).grid(row=row + 1, column=col, sticky=tk.W)
+        tk.Button(self._window, text="Close", command=self._window.destroy).pack(side=tk.RIGHT)
+
+    def set_dynamic(self):
+        self.parent.event.dynamic_schedule = bool(self.dynamic.get())
+        self.parent.compact_current_race()
+
+
+class FinalsDialog:
+    """ Seed a finals round from the standings, or cut the last one. """
+
+    def __init__(self, parent):
+        self.parent = parent
+        self._window = tk.Toplevel(parent.window)
+        self._window.wm_title("Finals")
+        row = tk.Frame(self._window)
+        row.pack(fill=tk.X)
+        tk.Label(row, text="Finalists").pack(side=tk.LEFT)
+        self.n_field = tk.Entry(row, width=6)
+        self.n_field.pack(side=tk.LEFT, padx=4, pady=4)
+        self.n_field.insert(0, str(parent.n_lanes))
+        self.per_heat = tk.IntVar(self._window, value=0)
+        tk.Checkbutton(self._window, text="Top finalists from each heat",
+                       variable=self.per_heat).pack(anchor=tk.W)
+        self.status = tk.Label(self._window, text="")
+        self.status.pack(fill=tk.X)
+        buttons = tk.Frame(self._window)
+        buttons.pack(fill=tk.X)
+        tk.Button(buttons, text="Seed From Standings", command=self.seed).pack(side=tk.LEFT)
+        tk.Button(buttons, text="Cut Last Round", command=self.cut).pack(side=tk.LEFT)
+        tk.Button(buttons, text="Close", command=self._window.destroy).pack(side=tk.RIGHT)
+
+    def get_n(self):
+        try:
+            return int(self.n_field.get())
+        except ValueError:
+            self.status.config(text="The number of finalists must be a whole number.", fg='red')
+            return None
+
+    def seed(self):
+        n = self.get_n()
+        if n is not None:
+            self.show(self.parent.add_finals(n, per_heat=bool(self.per_heat.get())))
+
+    def cut(self):
+        n = self.get_n()
+        if n is not None:
+            self.show(self.parent.add_finals(n, eliminate=True))
+
+    def show(self, heat):
+        if heat is None:
+            self.status.config(text="No round was added, see the console.", fg='red')
+        else:
+            self.status.config(text=f"Added {heat.name}: " + ', '.join(r.name for r in heat.racers),
+                               fg='black')
+
+
 class RaceManager:
     event: Event = None
     rm_gui: RaceManagerGUI = None
@@ -758,6 +1298,12 @@ class RaceManager:
 
 def request_to_post_results():
     global req_win
+    try:
+        if req_win.winfo_exists():  # Already asking
+            req_win.lift()
+            return
+    except (NameError, tk.TclError):
+        pass
     req_win = tk.Toplevel()
     req_win.title("Post Results?")
 
@@ -771,7 +1317,6 @@ def request_to_post_results():
     ans2 = tk.Button(fm, text="Just Move On", command=just_move_on)
     ans2.pack(side=tk.LEFT)
     fm.pack()
-    req_win.update()
 
 
 # RACE Functions
@@ -854,11 +1399,13 @@ def accept_results():
         rm_gui.update_race_display(new_race=False)
 
 
-def find_race_count(data):
+def find_race_count(data, lane_idx=0):
+    global rm_gui
     print(data)
     num = data.decode('utf-8').split(":")[1][:-1]
     count = int(num)
-    print("Count = {}, Seconds = {}".format(count, float(count) / 2000.0))
+    print("Count = {}, Seconds = {}".format(
+        count, rm_gui.event.calibration.lane_seconds(lane_idx, count)))
     return count
 
 
@@ -869,20 +1416,12 @@ def show_results():
     for li in range(rm_gui.n_lanes):
         race_count[li] = updated_counts[li]
 
-    # Find which lanes were 1st, 2nd, 3rd, and 4th
-    ranks = np.argsort(race_count)
-    place = 0
-    # TODO We need to handle ties.
-    for i in range(rm_gui.event.n_lanes):
-        if race_count[ranks[i]] <= 0:
-            placements[ranks[i]] = -1
-        elif rm_gui.event.current_race.is_empty[ranks[i]]:
-            placements[ranks[i]] = -1
-        elif race_count[ranks[i]] == 0:
-            placements[ranks[i]] = -1
-        else:
-            placements[ranks[i]] = place
-            place += 1
+    # Find which lanes were 1st, 2nd, 3rd, and 4th. Tied lanes share a place.
+    ranks = rank_counts(rm_gui.event.times_from_counts(race_count),
+                        rm_gui.event.current_race.is_empty,
+                        rm_gui.event.tie_tolerance)
+    for li in range(rm_gui.event.n_lanes):
+        placements[li] = int(ranks[li]) - 1
     rm_gui.update_race_display(new_race=False)
 
 
@@ -906,28 +1445,32 @@ def record_race_results(accept=False):
                 idx = -1
             print("idx={},copying results".format(idx))
             rm_gui.event.current_race.post_results_to_racers(i=idx)
-            times = [np.float(x) / rm_gui.clock_rate for x in race_count]
+            times = rm_gui.event.times_from_counts(race_count)
             tmp_idx = rm_gui.event.current_race_log_idx
             rm_gui.event.current_race_log_idx = active_race_idx
             rm_gui.event.record_race_results(times, race_count, accept)
             rm_gui.event.current_race_log_idx = tmp_idx
             rm_gui.update_race_selector(show_accepted_race=False)
+            rm_gui.export_live()
             return
         # else:i
         #    # These results were not recorded yet
-        #    times = [np.float(x) / rm_gui.clock_rate for x in race_count]
+        #    times = rm_gui.event.times_from_counts(race_count)
         #    rm_gui.event.record_race_results(times, race_count, accept)
         #    return
     if any(race_count):
-        times = [np.float(x) / rm_gui.clock_rate for x in race_count]
+        times = rm_gui.event.times_from_counts(race_count)
         rm_gui.event.record_race_results(times, race_count, accept)
         rm_gui.set_active_race_idx(rm_gui.event.current_race_log_idx)
+        if accept:
+            rm_gui.export_live()
 
 
 def send_reset_to_track(accept=False, send_reset=True):
     global timer_coms, race_needs_written, rm_gui, race_running
     if send_reset:
         timer_coms.send_reset_to_track(accept=accept)
+        rm_gui.timeline.reset_sent()
     if race_needs_written:
         record_race_results(accept=accept)
         race_needs_written = False
@@ -939,87 +1482,169 @@ if __name__ == "__main__":
     post_placements = True
     cli_args = parser.parse_args()
 
+    profiler = None
+    if cli_args.profile is not None:
+        from profiler import Profiler
+        profiler = Profiler(cli_args.profile, window_s=cli_args.profile_window)
+        record_race_results = profiler.wrap(record_race_results)
+        show_results = profiler.wrap(show_results)
+        profiler.wrap_method(RaceManagerGUI, 'update_race_display')
+        profiler.wrap_method(RaceSelector, 'update')
+        profiler.start_sampler()
+
     rm_gui = RaceManagerGUI(
         event_file_name=cli_args.event_file,
         log_file_name=cli_args.log_file,
-        hosts_file_name=cli_args.hosts_file
+        hosts_file_name=cli_args.hosts_file,
+        export_dir=cli_args.export_dir,
+        export_format=cli_args.export_format,
+        feed_port=cli_args.feed_port,
+        feed_host=cli_args.feed_host,
+        clock_rate=cli_args.clock_rate,
+        calibration_file=cli_args.calibration_file,
+        replication_listen=cli_args.replication_listen,
+        standby=cli_args.standby,
+        auto_advance=cli_args.auto_advance,
+        timeline_dir=cli_args.timeline_dir,
+        dynamic_schedule=cli_args.dynamic_schedule
     )
 
-    timer_coms = TimerComs(rm_gui.window,
-                           hosts_file=cli_args.hosts_file,
-                           reset_lane=reset_lane)
-
-    timer_coms.connect_to_track_hosts(autoclose=True)
+    poll_interval_ms = 5  # Between checks of the lane timers
+
+    def follow_primary():
+        # A standby mirrors the primary, without the lane timers, until it takes over.
+        if not program_running:
+            rm_gui.window.quit()
+        elif rm_gui.standby is not None and rm_gui.standby.active:
+            if rm_gui.standby.apply() > 0:
+                rm_gui.update_race_selector(True)
+                rm_gui.update_race_display(new_race=False)
+            rm_gui.window.after(50, follow_primary)
+        else:
+            rm_gui.window.quit()
+
+    if rm_gui.standby is not None:
+        rm_gui.window.after(50, follow_primary)
+        rm_gui.window.mainloop()
+    if not program_running:
+        raise SystemExit(0)
+
+    if cli_args.gateway is not None:
+        from timer_gateway import GatewayComs
+        timer_coms = GatewayComs(cli_args.gateway, n_lanes=rm_gui.n_lanes,
+                                 reset_lane=reset_lane)
+    else:
+        timer_coms = TimerComs(rm_gui.window,
+                               hosts_file=cli_args.hosts_file,
+                               reset_lane=reset_lane)
+        timer_coms.connect_to_track_hosts(autoclose=True)
 
     rm_gui.timer_coms = timer_coms
 
-    while program_running:
-        "Waiting for data from track hosts."
-        ready_sockets, open_sockets, error_sockets = timer_coms.select(0.05)
-        open_conn = [4]
-        if len(open_sockets) != 4:
-            print("Socket disconnection detected.")
-            open_conn = timer_coms.sockets_are_in_list(open_sockets)
-            rm_gui.update_race_display(new_race=False)
-            tk.messagebox.showinfo("Connection Dropped", "A socket connection appears to have failed.")
-            timer_coms.connect_to_track_hosts(autoclose=True, reset=True)
-        for ready_socket in ready_sockets:
-            try:
-                s_idx = timer_coms.socket_index(ready_socket)
-            except ValueError:
-                break
-            if not timer_coms.is_conn[s_idx]:
-                continue
-            data = timer_coms.get_data_from_socket(ready_socket)
-            if 'Ready to Race'.encode('utf-8') in data:
-                if race_needs_written:
-                    record_race_results()
-                    race_needs_written = False
-                print("Track {} ready.".format(s_idx + 1))
-                rm_gui.set_active_race_idx(rm_gui.event.current_race_log_idx)
-                race_ready[s_idx] = True
-                race_running[s_idx] = False
-                race_complete[s_idx] = (False or
-                                        rm_gui.event.current_race.is_empty[s_idx])
-                placements[s_idx] = -1
-                race_count[s_idx] = 0
-                post_placements = True
-            elif 'GO!'.encode('utf-8') in data:
-                race_needs_written = True
-                rm_gui.set_active_race_idx(
-                    rm_gui.event.current_race_log_idx)  # Force a jump to the new race when started
-                rm_gui.update_race_display(new_race=True)
-                print("Track {} racing!".format(s_idx + 1))
-                race_ready[s_idx] = False
-                race_running[s_idx] = True
-            elif 'Track count:'.encode('utf-8') in data:
-                # This if statement makes debugging easier because the 
-                # empty lanes will be ignored
-                if not rm_gui.event.current_race.is_empty[s_idx]:
-                    race_count[s_idx] = find_race_count(data)
-                    # TODO We shouldn't have to copy this both places, but we reset
-                    # race count in order to allow for things to be loaded. We should
-                    # fix this. LRB Oct 10, 2020
-                    rm_gui.event.set_counts_for_race(s_idx, race_count[s_idx])
-                race_ready[s_idx] = False
-                race_running[s_idx] = False
-                race_complete[s_idx] = True
-                rm_gui.times_column.update_race_time_display(s_idx)
-                if all(race_complete):
-                    rm_gui.controls_row.enable_navigation()
-            else:
-                if len(data) == 0:  # indicative of socket failure
-                    tk.messagebox.showinfo("Connection Dropped", "A socket connection appears to have failed.")
-                    timer_coms.connect_to_track_hosts(autoclose=True, reset=True)
-                else:
-                    print(data)
-
-        if all(race_complete) and post_placements:
-            show_results()
-            post_placements = False
-
-        if len(ready_sockets) > 0:
-            rm_gui.update_race_display(new_race=False)
-
-        rm_gui.window.update_idletasks()
-        rm_gui.window.update()
+    metrics = timer_coms.metrics
+    last_tick_end = time.monotonic_ns()
+
+    def handle_lane_message(s_idx, data):
+        global post_placements, race_needs_written
+        if 'Ready to Race'.encode('utf-8') in data:
+            if race_needs_written:
+                record_race_results()
+                race_needs_written = False
+            print("Track {} ready.".format(s_idx + 1))
+            rm_gui.timeline.lane_ready(s_idx, rm_gui.occupied_lanes())
+            rm_gui.set_active_race_idx(rm_gui.event.current_race_log_idx)
+            race_ready[s_idx] = True
+            race_running[s_idx] = False
+            race_complete[s_idx] = (False or
+                                    rm_gui.event.current_race.is_empty[s_idx])
+            placements[s_idx] = -1
+            race_count[s_idx] = 0
+            post_placements = True
+        elif 'GO!'.encode('utf-8') in data:
+            race_needs_written = True
+            rm_gui.set_active_race_idx(
+                rm_gui.event.current_race_log_idx)  # Force a jump to the new race when started
+            rm_gui.update_race_display(new_race=True)
+            print("Track {} racing!".format(s_idx + 1))
+            rm_gui.timeline.go(s_idx, rm_gui.event.current_race_idx)
+            race_ready[s_idx] = False
+            race_running[s_idx] = True
+        elif 'Track count:'.encode('utf-8') in data:
+            # This if statement makes debugging easier because the 
+            # empty lanes will be ignored
+            if not rm_gui.event.current_race.is_empty[s_idx]:
+                race_count[s_idx] = find_race_count(data, s_idx)
+                # TODO We shouldn't have to copy this both places, but we reset
+                # race count in order to allow for things to be loaded. We should
+                # fix this. LRB Oct 10, 2020
+                rm_gui.event.set_counts_for_race(s_idx, race_count[s_idx])
+                reason = rm_gui.outliers.check_lane(
+                    s_idx, rm_gui.event.current_race.racers[s_idx],
+                    rm_gui.event.times_from_counts(race_count)[s_idx], race_count[s_idx])
+                if reason is not None:
+                    print(f"Lane {s_idx + 1} looks wrong: {reason}.")
+            race_ready[s_idx] = False
+            race_running[s_idx] = False
+            race_complete[s_idx] = True
+            rm_gui.timeline.lane_finished(s_idx, rm_gui.occupied_lanes(),
+                                          rm_gui.event.current_race_idx)
+            rm_gui.times_column.update_race_time_display(s_idx)
+            metrics.time_displayed(s_idx)
+            if all(race_complete):
+                rm_gui.controls_row.enable_navigation()
+        else:
+            print(data)
+        metrics.message_processed(s_idx)
+
+    def handle_timers():
+        """ One pass over the lane timers, scheduled on the Tk loop so that
+        every window (the plan editor, connection and other dialogs) shares
+        it with the timers. """
+        global post_placements, last_tick_end
+        if not program_running:
+            rm_gui.window.quit()
+            return
+        loop_start = time.monotonic_ns()
+        # The time Tk spent on the windows since the last pass
+        metrics.record('ui_update', last_tick_end)
+        if profiler is not None:
+            profiler.frame_start()
+        try:
+            lane_events = timer_coms.poll(0)
+            for kind, s_idx, data in lane_events:
+                if kind != 'data':
+                    # A dropped lane is reconnected in the background by timer_coms
+                    print(f"Lane {s_idx + 1} {kind}.")
+                    continue
+                if profiler is not None:
+                    profiler.enter('socket')
+                try:
+                    handle_lane_message(s_idx, data)
+                finally:
+                    if profiler is not None:
+                        profiler.exit()
+
+            if all(race_complete) and post_placements:
+                show_results()
+                post_placements = False
+                if race_needs_written:  # Only a race that has started since its reset
+                    rm_gui.race_finished()
+
+            if len(lane_events) > 0:
+                rm_gui.update_race_display(new_race=False)
+
+            metrics.record('loop', loop_start)
+            metrics.maybe_dump(cli_args.metrics_file, cli_args.metrics_interval)
+        finally:
+            # A bad message must not stop the lanes from being polled
+            if profiler is not None:
+                profiler.frame_end()
+            last_tick_end = time.monotonic_ns()
+            rm_gui.window.after(poll_interval_ms, handle_timers)
+
+    rm_gui.window.after(0, handle_timers)
+    rm_gui.window.mainloop()
+
+    if profiler is not None:
+        for file_name in profiler.write_reports(cli_args.profile_output):
+            print(f"Wrote {file_name}")
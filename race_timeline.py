@@ -0,0 +1,219 @@
+"""
+race_timeline.py
+
+A timeline of the race day for planning. Every step of the race cycle is
+stamped with the wall clock time:
+
+reset:          The reset was sent to the track.
+ready:          A lane reported ready (all_ready once every occupied lane has).
+go:             The race started.
+finish:         A lane reported its count (all_finished once every occupied
+                lane has).
+accept:         The result was accepted.
+
+From the timeline each race is split into four steps, and the one that
+takes longest is where the day is lost:
+
+race:           go to all_finished.
+decide:         all_finished to the accept or reset, whichever came first.
+track_reset:    reset to all_ready.
+staging:        all_ready to the next go (loading the cars).
+
+RaceTimeline also gives the rolling races per hour, the reset latency of
+each lane and a projected finish time for the races that remain. The
+events and the per race steps can be exported with the race_export sinks.
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import time
+
+import numpy as np
+
+from race_export import export_formats, open_sink
+
+event_fields = ['time', 'kind', 'lane', 'race_idx']
+cycle_fields = ['race_idx', 'go_time', 'cycle_s', 'race', 'decide', 'track_reset', 'staging']
+steps = ('race', 'decide', 'track_reset', 'staging')
+
+
+class RaceTimeline:
+    def __init__(self, n_lanes=4, clock=time.time):
+        self.n_lanes = n_lanes
+        self.clock = clock
+        self.events = []  # (time, kind, lane_idx or -1, race_idx or -1)
+        self.ready = set()
+        self.finished = set()
+        self.racing = False
+        self.last_reset = 0.0
+        self.reset_latency = [[] for _ in range(n_lanes)]
+
+    def record(self, kind, lane_idx=-1, race_idx=-1):
+        t = self.clock()
+        self.events.append((t, kind, lane_idx, race_idx))
+        return t
+
+    # State transitions
+    def reset_sent(self):
+        self.last_reset = self.record('reset')
+        self.ready = set()
+        # A reset ends the race even if a lane never reported its count
+        self.racing = False
+        self.finished = set()
+
+    def lane_ready(self, lane_idx, lanes):
+        """ lanes are the occupied lanes of the race being staged. """
+        t = self.record('ready', lane_idx)
+        if self.last_reset > 0.0 and lane_idx not in self.ready:
+            self.reset_latency[lane_idx].append(t - self.last_reset)
+        self.ready.add(lane_idx)
+        if set(lanes) <= self.ready:
+            self.record('all_ready')
+            self.last_reset = 0.0
+            self.ready = set(range(self.n_lanes))  # Only once per reset
+
+    def go(self, lane_idx, race_idx):
+        if self.racing:
+            return
+        self.racing = True
+        self.finished = set()
+        self.record('go', lane_idx, race_idx)
+
+    def lane_finished(self, lane_idx, lanes, race_idx=-1):
+        self.record('finish', lane_idx, race_idx)
+        self.finished.add(lane_idx)
+        if self.racing and set(lanes) <= self.finished:
+            self.racing = False
+            self.record('all_finished', -1, race_idx)
+
+    def accepted(self, race_idx):
+        self.record('accept', -1, race_idx)
+
+    def attach(self, event):
+        event.add_observer(self.on_change)
+
+    def on_change(self, event, kind, race_idx=-1, accepted=False, **info):
+        if kind == 'result' and accepted:
+            self.accepted(race_idx)
+
+    # Analysis
+    def cycles(self):
+        """ One dict per started race with the seconds spent in each step.
+        Steps that have not happened (yet) are None. """
+        out = []
+        current = None
+        for t, kind, lane_idx, race_idx in self.events:
+            if kind == 'go':
+                if current is not None:
+                    out.append(self._close_cycle(current, t))
+                current = {'race_idx': race_idx, 'go': t}
+            elif current is not None and kind not in current:
+                if kind == 'all_ready' and 'reset' not in current:
+                    continue  # Ready from before this race's reset
+                current[kind] = t
+        if current is not None:
+            out.append(self._close_cycle(current, None))
+        return out
+
+    @staticmethod
+    def _close_cycle(cycle, next_go):
+        def span(start, end):
+            if start is None or end is None:
+                return None
+            return end - start
+
+        decided = [cycle[k] for k in ('accept', 'reset') if k in cycle]
+        return {'race_idx': cycle['race_idx'],
+                'go_time': cycle['go'],
+                'cycle_s': span(cycle['go'], next_go),
+                'race': span(cycle['go'], cycle.get('all_finished')),
+                'decide': span(cycle.get('all_finished'), min(decided) if decided else None),
+                'track_reset': span(cycle.get('reset'), cycle.get('all_ready')),
+                'staging': span(cycle.get('all_ready'), next_go)}
+
+    def races_per_hour(self, n_recent=10):
+        accepts = [t for t, kind, _, _ in self.events if kind == 'accept'][-(n_recent + 1):]
+        if len(accepts) < 2 or accepts[-1] <= accepts[0]:
+            return 0.0
+        return 3600.0 * (len(accepts) - 1) / (accepts[-1] - accepts[0])
+
+    def step_medians(self, n_recent=10):
+        cycles = self.cycles()[-n_recent:]
+        out = {}
+        for name in ('cycle_s',) + steps:
+            values = [c[name] for c in cycles if c[name] is not None]
+            out[name] = float(np.median(values)) if values else None
+        return out
+
+    def projected_finish(self, event, n_recent=10):
+        """ (races left, projected wall clock finish or None). """
+        remaining = sum(1 for race in event.races if race.accepted_result_idx < 0)
+        cycle_s = self.step_medians(n_recent)['cycle_s']
+        if cycle_s is None:
+            return remaining, None
+        return remaining, self.clock() + remaining * cycle_s
+
+    def summary(self, event=None):
+        medians = self.step_medians()
+        known = {name: medians[name] for name in steps if medians[name] is not None}
+        out = {'races_per_hour': self.races_per_hour(),
+               'median_s': medians,
+               'slowest_step': max(known, key=known.get) if known else None,
+               'reset_latency_p50_s': [float(np.median(x)) if x else None
+                                       for x in self.reset_latency]}
+        if event is not None:
+            out['races_left'], out['projected_finish'] = self.projected_finish(event)
+        return out
+
+    def report(self, event=None):
+        """ A few lines of text for the timeline panel. """
+        s = self.summary(event)
+        lines = [f"Races per hour (last 10): {s['races_per_hour']:.1f}"]
+        medians = s['median_s']
+        if medians['cycle_s'] is not None:
+            lines.append(f"Median time between races: {medians['cycle_s']:.1f} s")
+        for name in steps:
+            if medians[name] is not None:
+                lines.append(f"  {name:12s}{medians[name]:7.1f} s")
+        if s['slowest_step'] is not None:
+            lines.append(f"Slowest step: {s['slowest_step']}")
+        latency = ', '.join('-' if x is None else f"{x:.2f}" for x in s['reset_latency_p50_s'])
+        lines.append(f"Reset latency by lane (s): {latency}")
+        if event is not None:
+            if s['projected_finish'] is None:
+                lines.append(f"Races left: {s['races_left']}")
+            else:
+                finish = time.strftime('%H:%M', time.localtime(s['projected_finish']))
+                lines.append(f"Races left: {s['races_left']}, projected finish {finish}")
+        return '\n'.join(lines)
+
+    def export(self, directory, fmt='csv'):
+        """ Write timeline.<ext> (every event) and race_cycles.<ext> (the steps
+        of each race) into directory. Returns the file names. """
+        os.makedirs(directory, exist_ok=True)
+        file_names = []
+        for table, fields, rows in (
+                ('timeline', event_fields,
+                 ({'time': t, 'kind': kind, 'lane': lane_idx + 1 if lane_idx >= 0 else 0,
+                   'race_idx': race_idx} for t, kind, lane_idx, race_idx in self.events)),
+                ('race_cycles', cycle_fields, self.cycles())):
+            file_name = os.path.join(directory, table + export_formats[fmt])
+            sink = open_sink(file_name, fields, fmt)
+            try:
+                sink.write_rows(rows)
+            finally:
+                sink.close()
+            file_names.append(file_name)
+        return file_names
@@ -0,0 +1,132 @@
+"""
+race_views.py
+
+What the race day screens show for each race, worked out once and kept
+until it changes. Moving between races then reads a prepared record instead
+of walking the races and racers again:
+
+RaceDisplay:    The lane chips, plan editor labels, MC sheet row and
+                attempt list (the race log numbers, '< ACC' on the accepted
+                one) of one race.
+RaceViewCache:  A RaceDisplay for every race of an event, plus an
+                (n_races x n_lanes) empty lane mask and car number array.
+
+The cache follows the event's notifications. A result rebuilds its race, a
+racer change rebuilds the races that racer is in and a new plan rebuilds
+everything, when the race is next asked for. A race whose racers were
+swapped without a notification is caught by checking the racers in each
+lane, which is cheap.
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+from race_event import Race
+
+
+class RaceDisplay(NamedTuple):
+    race: Race
+    racers: tuple
+    chips: Tuple[dict, ...]
+    labels: Tuple[str, ...]
+    mc_row: str  # as_mc_sheet without the race number
+    attempts: Tuple[str, ...]
+
+
+def race_display(race: Race) -> RaceDisplay:
+    attempts = [str(x) for x in race.race_number]
+    if race.accepted_result_idx >= 0:
+        attempts[race.accepted_result_idx] += ' < ACC'
+    return RaceDisplay(race=race,
+                       racers=tuple(race.racers),
+                       chips=tuple(racer.chip() for racer in race.racers),
+                       labels=tuple(race.get_racer_list([])),
+                       mc_row=''.join(" & " + racer.mc_sheet_label() for racer in race.racers),
+                       attempts=tuple(attempts))
+
+
+class RaceViewCache:
+    def __init__(self, event):
+        self.event = event
+        self.views = []
+        self.is_empty = np.zeros((0, event.n_lanes), dtype=bool)
+        self.car_numbers = np.zeros((0, event.n_lanes), dtype=np.int64)
+        self.by_racer = {}  # id(racer) -> set of race indices
+        self.dirty = set()
+        self.stale = True
+        self.n_builds = 0
+        event.add_observer(self.on_change)
+
+    def detach(self):
+        self.event.remove_observer(self.on_change)
+
+    def on_change(self, event, kind, race_idx=None, racer=None, heat=None, **info):
+        if kind == 'result' and race_idx is not None:
+            self.dirty.add(race_idx)
+        elif kind == 'racer':
+            racers = [] if racer is None else [racer]
+            if heat is not None:
+                racers.extend(heat.racers)
+            for changed in racers:
+                self.dirty.update(self.by_racer.get(id(changed), ()))
+        elif kind == 'plan':
+            self.stale = True
+
+    def compile(self):
+        races = self.event.races
+        self.views = [None] * len(races)
+        self.is_empty = np.zeros((len(races), self.event.n_lanes), dtype=bool)
+        self.car_numbers = np.zeros((len(races), self.event.n_lanes), dtype=np.int64)
+        self.by_racer = {}
+        for ri in range(len(races)):
+            self._build(ri)
+        self.dirty = set()
+        self.stale = False
+
+    def _build(self, race_idx):
+        race = self.event.races[race_idx]
+        old = self.views[race_idx]
+        if old is not None:
+            for racer in old.racers:
+                self.by_racer.get(id(racer), set()).discard(race_idx)
+        view = race_display(race)
+        self.views[race_idx] = view
+        self.is_empty[race_idx] = race.is_empty
+        self.car_numbers[race_idx] = [racer.car_number for racer in race.racers]
+        for racer in race.racers:
+            self.by_racer.setdefault(id(racer), set()).add(race_idx)
+        self.n_builds += 1
+        return view
+
+    def refresh(self):
+        """ Bring every race up to date, before reading the arrays. """
+        if self.stale or len(self.views) != len(self.event.races):
+            self.compile()
+        for race_idx in sorted(self.dirty):
+            self.view(race_idx)
+
+    def view(self, race_idx) -> RaceDisplay:
+        races = self.event.races
+        if self.stale or len(self.views) != len(races):
+            self.compile()
+        view = self.views[race_idx]
+        race = races[race_idx]
+        if race_idx in self.dirty or view.race is not race or \
+                any(a is not b for a, b in zip(view.racers, race.racers)):
+            self.dirty.discard(race_idx)
+            view = self._build(race_idx)
+        return view
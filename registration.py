@@ -21,12 +21,15 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 import tkinter as tk
-from race_event import Event, Heat, Racer
+from race_event import Event, Heat, Racer, inspection_measurements, inspection_questions
 import argparse
 import datetime
 from tkinter import messagebox, filedialog, ttk
 import os
-import tksheet
+import queue
+import threading
+from roster_import import import_roster
+from plan_check import validate_plan
 
 description = "A Graphical Interface for setting up Pinewood Derby Races"
 
@@ -37,6 +40,11 @@ parser.add_argument('--save_action',
                     help="Define what to do when we close. Options are ask, overwrite, new_file, and no_save.",
                     default='None')
 
+# The race plan edits after which the cell index is rebuilt
+sheet_edit_bindings = ["end_edit_cell", "end_paste", "end_delete", "end_delete_key",
+                       "end_insert_rows", "end_delete_rows", "end_rc_insert_row",
+                       "end_rc_delete_row", "end_move_rows", "end_undo", "end_ctrl_z"]
+
 
 def new_fname(old_name):
     now = datetime.datetime.now()
@@ -57,8 +65,10 @@ class RegistrationWindow:
     def __init__(self,
                  top: tk.Tk,
                  event_file: str = None,
-                 event: Event = None):
+                 event: Event = None,
+                 on_close=None):
         self.top = top
+        self.on_close = on_close  # Called after the window is closed
 
         self.in_file_name = event_file
 
@@ -86,12 +96,16 @@ class RegistrationWindow:
 
         self.set_heat_pane()
 
+        self.heat_list.list_box.bind("<<ListboxSelect>>", self.check_racer_pane)
+        self.racer_list.list_box.bind("<<ListboxSelect>>", self.check_racer_pane)
+
         self.check_racer_pane()
 
     def create_menubar(self, top):
         menubar = tk.Menu(top)
         filemenu = tk.Menu(menubar, tearoff=0)
         filemenu.add_command(label="Open", command=self.open_event)
+        filemenu.add_command(label="Import Roster", command=self.import_roster)
         filemenu.add_command(label="Save", command=self.save)
         filemenu.add_command(label="Save As", command=self.save_as)
         filemenu.add_command(label="Print", command=self.print)
@@ -105,11 +119,31 @@ class RegistrationWindow:
     def open_event(self):
         self.in_file_name = filedialog.askopenfilename()
         self.event = Event(event_file=self.in_file_name)
-        self.active_heat = None
         self.set_heat_pane()
-        self.check_racer_pane()
+        self.refresh_pane()
         self.race_list.load_race_plan()
 
+    def import_roster(self):
+        file_name = filedialog.askopenfilename(
+            title="Select Roster",
+            filetypes=(("comma separated variables", "*.csv"),
+                       ("Excel", "*.xlsx"),
+                       ("All Files", "*.*")))
+        if len(file_name) == 0:
+            return
+        try:
+            new_racers = import_roster(self.event, file_name,
+                                       regenerate=bool(self.autogenerate_race_plan.get()))
+        except (OSError, ValueError) as e:
+            messagebox.showerror(title="Roster Not Imported", message=str(e))
+            return
+        self.set_heat_pane()
+        self.refresh_pane()
+        if self.autogenerate_race_plan.get():
+            self.race_list.load_race_plan(regenerate=False)
+        messagebox.showinfo(title="Roster Imported",
+                            message=f"Added {len(new_racers)} racers.")
+
     def save_as(self):
         self.out_file_name = filedialog.asksaveasfilename()
         self.save()
@@ -124,66 +158,51 @@ class RegistrationWindow:
                                    revised_plan=self.race_list.sheet_data)
 
     def check_revised_plan(self):
-        problems = []
-        for heat in self.event.heats[:-1]:
-            for racer in heat.racers:
-                race_count = self.race_list.count_races(racer)
-                if race_count != self.event.n_lanes:
-                    problems.append({
-                        "Racer": racer,
-                        "race_count": race_count
-                    })
-        if len(problems) == 0:
-            messagebox.showinfo(title="Passed",
-                                message="No problems were found with the plan.")
+        report = validate_plan(self.race_list.sheet_data, self.event)
+        if report.passed:
+            messagebox.showinfo(title="Passed", message=report.summary())
         else:
-            ec = self.event.n_lanes
-            if ec == 1:
-                tail = f"but should race once."
-            else:
-                tail = f"but should race {ec} times."
-            for pi, problem in enumerate(problems):
-                name = problem['Racer'].name
-                heat = problem['Racer'].heat_name
-                count = problem['race_count']
-                if count == 1:
-                    message = f"{name} from {heat} races {count} time {tail}"
-                else:
-                    message = f"{name} from {heat} races {count} times {tail}"
-                messagebox.showerror(title=f"Error {pi + 1} of {len(problems)}",
-                                     message=message)
-                if pi > 10:
-                    messagebox.showerror(title="More Errors",
-                                         message="Not showing any more errors")
+            messagebox.showerror(title=f"{len(report.errors)} Problems Found",
+                                 message=report.summary())
+        return report
 
     def on_closing(self):
         self.running = False
+        self.race_list.regenerator.cancel()  # Before the sheet is destroyed
+        self.top.destroy()
+        if self.on_close is not None:
+            self.on_close()
 
     def mainloop(self):
         self.top.mainloop()
         return self.event, self.out_file_name, self.race_list.sheet_data
 
-    def check_racer_pane(self):
+    def check_racer_pane(self, *args):
+        """ Called when the heat or racer selection changes. """
         cur_idx = self.heat_list.get_selected_heat_index()
         racer_idx = self.racer_list.get_selected_racer_index()
         if cur_idx != self.active_heat:
             self.active_heat = cur_idx
+            self.active_racer = -1
             self.racer_list.set_racers_from_heat(self.active_heat)
             self.race_list.remove_highlighting()
         elif racer_idx != self.active_racer:
             self.active_racer = racer_idx
+            self.race_list.remove_highlighting()
             if racer_idx >= 0:
                 racer = self.get_racer_by_index(racer_idx)
-                self.race_list.remove_highlighting()
                 self.race_list.highlight_racer(racer)
-        if self.running:
-            self.top.after(50, self.check_racer_pane)
-        else:
-            self.top.destroy()
 
     def set_heat_pane(self):
         self.heat_list.update_heat_list()
 
+    def refresh_pane(self):
+        """ Follow the lists again after they were changed from code, which
+        does not raise <<ListboxSelect>>. """
+        self.active_heat = None
+        self.active_racer = None
+        self.check_racer_pane()
+
     def get_racer_by_index(self, index):
         heat_index = self.heat_list.get_selected_heat_index()
         if heat_index == -1:
@@ -235,12 +254,17 @@ class RacerDialog:
             self.rank_field = self.text_input("Rank", 25, racer.rank)
             self.car_number_field = self.text_input("Car Number", 15, str(racer.car_number))
 
-            self.car_status = self.car_status_list(racer.car_status)
+            self.car_status = self.car_status_list(racer.inspection)
+
+            self.checked_in = tk.IntVar(self.frame, value=int(racer.checked_in))
+            check_in = tk.Checkbutton(self.frame, text="Checked in", variable=self.checked_in)
+            check_in.pack(anchor=tk.W, padx=2)
 
             text = tk.Label(self.frame, text="Notes")
             text.pack()
             self.notes = tk.Text(self.frame)
             self.notes.pack(expand=True, fill=tk.BOTH)
+            self.notes.insert(1.0, racer.inspection.notes)
 
             bottom_frame = tk.Frame(self.frame)
             bottom_frame.pack(fill=tk.BOTH, expand=True)
@@ -282,15 +306,13 @@ class RacerDialog:
                                     command=self.set_heat)
         return option_menu
 
-    def car_status_list(self, status_dict: dict):
-        out_dict = status_dict.copy()
+    def car_status_list(self, inspection):
+        out_dict = {}
 
-        for key in status_dict.keys():
-            if key == 'questions' or key == 'notes':
-                continue
+        for key, description in inspection_measurements:
             frame = tk.Frame(self.frame)
             frame.pack(expand=True, anchor=tk.W)
-            out_dict[key] = tk.IntVar(frame, value=status_dict[key][0])
+            out_dict[key] = tk.IntVar(frame, value=inspection.passed(key))
             text = ' '.join(key.split('_'))
             gap = tk.Label(frame, width=9)
             gap.pack(side=tk.LEFT, expand=False)
@@ -299,12 +321,12 @@ class RacerDialog:
                                           variable=out_dict[key]
                                           )
             check_button.pack(padx=2, anchor=tk.W, side=tk.LEFT)
-            label = tk.Label(frame, text=status_dict[key][1])
+            label = tk.Label(frame, text=description)
             label.pack(side=tk.LEFT)
-        for key in status_dict['questions'].keys():
+        for key in inspection_questions:
             frame = tk.Frame(self.frame)
             frame.pack(expand=True, anchor=tk.W)
-            out_dict[key] = tk.IntVar(frame, value=status_dict['questions'][key])
+            out_dict[key] = tk.IntVar(frame, value=inspection.passed(key))
             text = ' '.join(key.split('_'))
             gap = tk.Label(frame, width=9)
             gap.pack(side=tk.LEFT, expand=False)
@@ -316,9 +338,7 @@ class RacerDialog:
         return out_dict
 
     def clear_inspection(self):
-        for key in self.car_status.keys():
-            if key == 'questions' or key == 'notes':
-                continue
+        for key, _ in inspection_measurements:
             self.car_status[key].set(0)
 
     def accept(self):
@@ -332,23 +352,20 @@ class RacerDialog:
                                   fg='red',
                                   bg='black')
             return
-        self.car_status['notes'] = self.notes.get(1.0, tk.END)
-        for key in self.racer.car_status.keys():
-            if key == 'questions' or key == 'notes':
-                continue
-            self.racer.car_status[key][0] = bool(self.car_status[key].get())
-        for key in self.racer.car_status['questions'].keys():
-            self.racer.car_status['questions'][key] = bool(self.car_status[key].get())
+        self.racer.inspection.notes = self.notes.get(1.0, tk.END).rstrip('\n')
+        for key, variable in self.car_status.items():
+            self.racer.inspection.set(key, variable.get())
+        self.racer.checked_in = bool(self.checked_in.get())
 
         if self.heat is not self.original_heat:
             self.original_heat.remove_racer(racer=self.racer)
             self.racer.heat_name = self.heat.name
             self.heat.add_racer(self.racer)
 
-        heat_idx = self.event.heat_index(heat=self.original_heat)
-        self.parent.racer_list.set_racers_from_heat(heat_idx)
+        self.parent.refresh_pane()
+        self.event.notify('racer', racer=self.racer)
         if self.parent.autogenerate_race_plan.get():
-            self.parent.race_list.load_race_plan()
+            self.parent.race_list.request_regeneration()
         self._window.destroy()
 
     def set_heat(self, value):
@@ -417,6 +434,7 @@ class HeatDialog:
                 return
 
         self.event.sort_heats()
+        self.event.notify('racer', heat=self.heat)
 
         self.parent.heat_list.update_heat_list()
 
@@ -489,8 +507,6 @@ class RacerList:
         racer_idx = self.get_selected_racer_index()
         if racer_idx >= 0:
             racer = self.parent.get_racer_by_index(racer_idx)
-            heat_idx_a = self.parent.event.heat_index(heat_name=racer.heat_name)
-            heat_idx_b = self.parent.heat_list.get_selected_heat_index()
             title = f"Delete {racer.name}"
             message = f"Do you want to permanently delete the racer {racer.name}?"
             if messagebox.askyesno(title, message):
@@ -500,10 +516,9 @@ class RacerList:
                     print("Unable to remove racer.")
                     return
                 else:
-                    if heat_idx_a == heat_idx_b:
-                        self.parent.racer_list.set_racers_from_heat(heat_idx_a)
-                        if self.parent.autogenerate_race_plan.get():
-                            self.parent.race_list.load_race_plan()
+                    self.parent.refresh_pane()
+                    if self.parent.autogenerate_race_plan.get():
+                        self.parent.race_list.request_regeneration()
 
     def edit_selected_racer(self):
         idx = self.get_selected_racer_index()
@@ -580,8 +595,9 @@ class HeatList:
                         return
                     else:
                         self.parent.heat_list.update_heat_list()
+                        self.parent.refresh_pane()
                         if self.parent.autogenerate_race_plan.get():
-                            self.parent.race_list.load_race_plan()
+                            self.parent.race_list.request_regeneration()
             else:
                 try:
                     self.parent.event.remove_heat(heat=self.parent.event.heats[idx])
@@ -590,8 +606,9 @@ class HeatList:
                     return
                 else:
                     self.parent.heat_list.update_heat_list()
+                    self.parent.refresh_pane()
                     if self.parent.autogenerate_race_plan.get():
-                        self.parent.race_list.load_race_plan()
+                        self.parent.race_list.request_regeneration()
 
     def edit_selected_heat(self):
         idx = self.get_selected_heat_index()
@@ -600,6 +617,106 @@ class HeatList:
             HeatDialog(self.parent, heat=heat)
 
 
+def copy_for_planning(event: Event) -> Event:
+    """ The heats and racers of event in a new Event with no observers, store
+    or log, so a plan can be built from it off the Tk thread. """
+    out = Event(n_lanes=event.n_lanes)
+    out.close_log_file()
+    for heat in event.heats[:-1]:
+        racers = [Racer(car_number=racer.car_number, name=racer.name, rank=racer.rank,
+                        heat_name=heat.name, n_lanes=event.n_lanes)
+                  for racer in heat.racers]
+        out.add_heat(Heat(name=heat.name, racers=racers, ability_rank=heat.ability_rank))
+    return out
+
+
+class PlanRegenerator:
+    """
+    Rebuilds the race plan in the background once edits settle. Each call to
+    mark_stale restarts the debounce timer; when it expires a worker thread
+    plans from a copy of the heats, and the plan is adopted by the event and
+    shown on the Tk thread. If more edits arrive while the worker is busy,
+    its result is thrown away and the plan is rebuilt again. cancel stops
+    it for good when the window closes.
+    """
+    poll_ms = 25
+
+    def __init__(self,
+                 race_list,
+                 delay_ms: int = 400):
+        self.race_list = race_list
+        self.top = race_list.top
+        self.delay_ms = delay_ms
+        self.generation = 0
+        self._after_id = None
+        self._poll_id = None
+        self._worker = None
+        self._results = queue.Queue()
+        self.cancelled = False
+
+    def mark_stale(self):
+        if self.cancelled:
+            return
+        self.generation += 1
+        if self._after_id is not None:
+            self.top.after_cancel(self._after_id)
+        self._after_id = self.top.after(self.delay_ms, self._start)
+
+    def _start(self):
+        self._after_id = None
+        if self._worker is not None and self._worker.is_alive():
+            # _poll will restart us once the running build finishes.
+            return
+        # The live event is only read here and changed in _poll, both on the
+        # Tk thread, so its observers never run on the worker.
+        source = copy_for_planning(self.race_list.parent.event)
+        self._worker = threading.Thread(target=self._build,
+                                        args=(source, self.generation),
+                                        daemon=True)
+        self._worker.start()
+        self._poll_id = self.top.after(self.poll_ms, self._poll)
+
+    def cancel(self):
+        """ Stop planning. A build that is still running is left to finish
+        and its plan thrown away. """
+        self.cancelled = True
+        for after_id in (self._after_id, self._poll_id):
+            if after_id is not None:
+                self.top.after_cancel(after_id)
+        self._after_id = None
+        self._poll_id = None
+
+    def _build(self, source, generation):
+        plan = None
+        try:
+            plan = source.get_race_plan()
+        except (IndexError, ValueError, RuntimeError) as e:
+            print(f"Plan regeneration failed: {e}")
+        finally:
+            self._results.put((generation, plan))
+
+    def _poll(self):
+        self._poll_id = None
+        if self.cancelled:
+            return
+        try:
+            generation, plan = self._results.get_nowait()
+        except queue.Empty:
+            self._poll_id = self.top.after(self.poll_ms, self._poll)
+            return
+        if generation != self.generation:
+            # Edited while the worker was busy, so plan again
+            if self._after_id is None:
+                self._start()
+            return
+        if plan is None:
+            return  # The next edit tries again
+        event = self.race_list.parent.event
+        event.sort_heats()
+        event.adopt_revised_plan(plan)
+        self.race_list.set_plan(plan)
+
+
 class RaceList:
     def __init__(self,
                  parent: RegistrationWindow):
@@ -610,6 +727,7 @@ class RaceList:
 
         headers = ["Lane 1", "Lane 2", "Lane 3", "Lane 4"]
 
+        import tksheet
         self.sheet = tksheet.Sheet(self._outer_frame,
                                    headers=headers,
                                    column_width=240,
@@ -639,31 +757,61 @@ class RaceList:
         )
 
         self.highlighted_cells = []
+        self.cell_index = {}
+        self.index_is_stale = True
+        self.sheet.extra_bindings(sheet_edit_bindings, func=self.mark_index_stale)
 
-    def load_race_plan(self):
-        race_plan = self.parent.event.get_race_plan()
-        self.sheet_data = self.sheet.set_sheet_data(race_plan)
+        self.regenerator = PlanRegenerator(self)
 
-    def remove_highlighting(self):
-        self.sheet.dehighlight_cells(row='all')
+    def load_race_plan(self, regenerate=True):
+        race_plan = self.parent.event.get_race_plan(regenerate=regenerate)
+        self.set_plan(race_plan)
 
-    def highlight_racer(self, racer):
-        cell_str = f"{racer.name} : {racer.heat_name}"
+    def set_plan(self, race_plan):
+        self.highlighted_cells = []
+        self.sheet_data = self.sheet.set_sheet_data(race_plan, reset_highlights=True)
+        self.index_is_stale = True
+
+    def request_regeneration(self):
+        self.regenerator.mark_stale()
+
+    def mark_index_stale(self, *args):
+        # Moving rows gives the sheet a new data list, so take it up again
+        self.sheet_data = self.sheet.get_sheet_data()
+        self.index_is_stale = True
+
+    def build_cell_index(self):
+        """ Map each cell's text to the (row, column) positions it occupies. """
+        self.cell_index = {}
         for ri, row in enumerate(self.sheet_data):
             for ci, entry in enumerate(row):
-                if entry == cell_str:
-                    self.sheet.highlight_cells(row=ri, column=ci,
-                                               bg="#ed4337", fg="white")
+                self.cell_index.setdefault(entry, []).append((ri, ci))
+        self.index_is_stale = False
+
+    def cells_for_racer(self, racer):
+        if self.index_is_stale:
+            self.build_cell_index()
+        cell_str = f"{racer.name} : {racer.heat_name}"
+        return self.cell_index.get(cell_str, [])
+
+    def remove_highlighting(self):
+        if len(self.highlighted_cells) == 0:
+            return
+        self.sheet.dehighlight_cells(cells=self.highlighted_cells, redraw=False)
+        self.highlighted_cells = []
+        self.sheet.redraw()
+
+    def highlight_racer(self, racer):
+        cells = self.cells_for_racer(racer)
+        if len(cells) == 0:
+            return
+        self.sheet.highlight_cells(cells=cells, bg="#ed4337", fg="white",
+                                   redraw=False)
+        self.highlighted_cells = list(cells)
         self.sheet.redraw()
 
     def count_races(self, racer):
-        count = 0
-        cell_str = f"{racer.name} : {racer.heat_name}"
-        for ri, row in enumerate(self.sheet_data):
-            for ci, entry in enumerate(row):
-                if entry == cell_str:
-                    count += 1
-        return count
+        return len(self.cells_for_racer(racer))
 
 
 class SaveWindow:
@@ -0,0 +1,396 @@
+"""
+replication.py
+
+Hot-standby replication of an Event to a second race manager.
+
+The primary observes its Event and turns every change into an operation in an
+ordered log:
+
+result:     A race result was recorded (and possibly accepted).
+race:       The current race changed.
+snapshot:   The whole event state. Sent when a standby connects, and after
+            plan or racer edits, which are rare and touch many objects.
+
+Operations are sent as JSON lines, each with a sequence number, over TCP
+(host:port) or a Unix socket (unix:/path) to every connected standby. A
+standby applies them to its own Event in order. If it sees a gap in the
+sequence it reconnects and starts again from a fresh snapshot. When the
+primary is gone, take_over() writes the replicated results to the standby's
+race log and the standby carries on as the primary.
+
+    python race_manager.py --replication_listen 127.0.0.1:5060
+    python race_manager.py --standby 127.0.0.1:5060 --log_file standby_log.csv
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from typing import Callable
+
+from race_event import Event, Heat, Race, Racer
+from timer_gateway import open_stream, parse_address
+
+racer_arrays = ('race_times', 'race_counts', 'race_plan_nums', 'race_log_nums',
+                'race_positions')
+
+
+# EVENT STATE
+def racer_state(racer: Racer):
+    out = {'name': racer.name,
+           'rank': racer.rank,
+           'car_number': int(racer.car_number),
+           'inspection': int(racer.inspection.flags),
+           'notes': racer.inspection.notes,
+           'checked_in': bool(racer.checked_in)}
+    for key in racer_arrays:
+        out[key] = [float(x) for x in getattr(racer, key)]
+    if racer.hist is not None:
+        out['hist'] = {heat: [[float(x) for x in values] for values in entry]
+                       for heat, entry in racer.hist.items()}
+    return out
+
+
+def event_state(event: Event) -> dict:
+    """ Everything a standby needs to carry on with the event. """
+    heats = [{'name': heat.name,
+              'ability_rank': heat.ability_rank,
+              'racers': [racer_state(racer) for racer in heat.racers]}
+             for heat in event.heats[:-1]]
+    races = []
+    for race in event.races:
+        races.append({'plan_number': race.plan_number,
+                      'entries': [[heat.name, racer.name, bool(empty)] for heat, racer, empty
+                                  in zip(race.heats, race.racers, race.is_empty)],
+                      'race_number': [int(x) for x in race.race_number],
+                      'times': [[float(x) for x in times] for times in race.times],
+                      'counts': [[int(x) for x in counts] for counts in race.counts],
+                      'accepted_result_idx': race.accepted_result_idx,
+                      'current_race': race.current_race})
+    return {'n_lanes': event.n_lanes,
+            'tie_tolerance': event.tie_tolerance,
+            'heats': heats,
+            'races': races,
+            'current_race_idx': event.current_race_idx,
+            'current_race_log_idx': event.current_race_log_idx,
+            'counts': [[int(x) for x in counts] for counts in event.counts]}
+
+
+def restore_event_state(event: Event, state: dict):
+    import numpy as np
+
+    if state['n_lanes'] != event.n_lanes:
+        raise ValueError(f"The primary has {state['n_lanes']} lanes and this event has {event.n_lanes}.")
+    heats = []
+    for heat_state in state['heats']:
+        racers = [Racer(car_number=rs['car_number'], name=rs['name'], rank=rs['rank'],
+                        heat_name=heat_state['name'], n_lanes=event.n_lanes)
+                  for rs in heat_state['racers']]
+        heats.append(Heat(name=heat_state['name'], racers=racers,
+                          ability_rank=heat_state['ability_rank']))
+        # Heat() clears the racers' results, so restore them afterwards
+        for racer, rs in zip(racers, heat_state['racers']):
+            for key in racer_arrays:
+                setattr(racer, key, np.array(rs[key]))
+            racer.inspection.flags = rs['inspection']
+            racer.inspection.notes = rs['notes']
+            racer.checked_in = rs.get('checked_in', True)
+            if 'hist' in rs:
+                racer.hist = {heat: [np.array(values) for values in entry]
+                              for heat, entry in rs['hist'].items()}
+    heats.append(event.create_empty_lane_heat())
+    by_name = {(heat.name, racer.name): (heat, racer) for heat in heats for racer in heat.racers}
+
+    races = []
+    for race_state in state['races']:
+        entries = [by_name[(heat_name, racer_name)] for heat_name, racer_name, _ in race_state['entries']]
+        race = Race([heat for heat, _ in entries], [racer for _, racer in entries],
+                    race_state['plan_number'], [e[2] for e in race_state['entries']],
+                    n_lanes=event.n_lanes)
+        race.race_number = list(race_state['race_number'])
+        race.times = [list(times) for times in race_state['times']]
+        race.counts = [list(counts) for counts in race_state['counts']]
+        race.placements = [race.get_placements(times, state['tie_tolerance']) for times in race.times]
+        race.accepted_result_idx = race_state['accepted_result_idx']
+        race.current_race = race_state['current_race']
+        races.append(race)
+
+    event.heats = heats
+    event.races = races
+    event.last_race = len(races) - 1
+    event.current_race_idx = state['current_race_idx']
+    event.current_race = races[event.current_race_idx] if races else None
+    event.current_race_log_idx = state['current_race_log_idx']
+    event.counts = [list(counts) for counts in state['counts']]
+    event.tie_tolerance = state['tie_tolerance']
+
+
+# PRIMARY
+class _Subscriber:
+    def __init__(self, sckt):
+        self.socket = sckt
+        self.queue = queue.Queue()
+        self.alive = True
+        threading.Thread(target=self._send, daemon=True).start()
+
+    def _send(self):
+        while self.alive:
+            line = self.queue.get()
+            if line is None:
+                break
+            try:
+                self.socket.sendall(line)
+            except OSError:
+                break
+        self.alive = False
+        self.socket.close()
+
+    def close(self):
+        self.alive = False
+        self.queue.put(None)
+
+
+class ReplicationPrimary:
+    """
+    Publishes the op log of an Event. Changes are turned into ops on the
+    thread that made them (the Tk thread), and each standby has its own
+    sender thread so a slow standby never blocks the race. New standbys are
+    given their snapshot through schedule (e.g. tk.Tk.after_idle) so it is
+    taken on the same thread as the changes.
+    """
+
+    def __init__(self,
+                 event: Event,
+                 listen: str,
+                 schedule: Callable = None):
+        self.schedule = schedule
+        self.seq = 0
+        self.subscribers = []
+        self.joining = queue.Queue()
+        family, addr = parse_address(listen)
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.unlink(addr)
+        self.family = family
+        self.listener = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(addr)
+        self.listener.listen(4)
+        self.event = None
+        self.attach(event)
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    @property
+    def address(self):
+        return self.listener.getsockname()
+
+    def attach(self, event):
+        """ Follow a new Event (e.g. after reloading). Standbys are sent a
+        fresh snapshot. """
+        if self.event is not None:
+            self.event.remove_observer(self.on_change)
+        self.event = event
+        event.add_observer(self.on_change)
+        self.publish_snapshot()
+
+    def _accept(self):
+        while True:
+            try:
+                sckt, _ = self.listener.accept()
+            except OSError:
+                return
+            self.joining.put(sckt)
+            if self.schedule is not None:
+                self.schedule(self.admit)
+
+    def admit(self):
+        """ Add waiting standbys, starting each with a snapshot. """
+        while True:
+            try:
+                sckt = self.joining.get_nowait()
+            except queue.Empty:
+                return
+            subscriber = _Subscriber(sckt)
+            subscriber.queue.put(self.encode({'op': 'snapshot', 'state': event_state(self.event)},
+                                             seq=self.seq))
+            self.subscribers.append(subscriber)
+            print(f"Standby connected ({len(self.subscribers)} following).")
+
+    def encode(self, op, seq=None):
+        op['seq'] = self.seq if seq is None else seq
+        return (json.dumps(op) + '\n').encode('utf-8')
+
+    def publish(self, op):
+        self.seq += 1
+        line = self.encode(op)
+        alive = []
+        for subscriber in self.subscribers:
+            if subscriber.alive:
+                subscriber.queue.put(line)
+                alive.append(subscriber)
+        self.subscribers = alive
+
+    def publish_snapshot(self):
+        self.publish({'op': 'snapshot', 'state': event_state(self.event)})
+
+    def on_change(self, event, kind, **info):
+        if self.schedule is None:
+            self.admit()
+        if kind == 'result':
+            race = event.races[info['race_idx']]
+            self.publish({'op': 'result',
+                          'race_idx': info['race_idx'],
+                          'log_idx': info['log_idx'],
+                          'times': [float(x) for x in race.times[-1]],
+                          'counts': [int(x) for x in race.counts[-1]],
+                          'accepted': bool(info['accepted'])})
+        elif kind == 'race':
+            self.publish({'op': 'race', 'race_idx': info['race_idx']})
+        else:
+            self.publish_snapshot()
+
+    def shutdown(self):
+        if self.event is not None:
+            self.event.remove_observer(self.on_change)
+        try:
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.listener.close()
+        for subscriber in self.subscribers:
+            subscriber.close()
+        self.subscribers = []
+
+
+# STANDBY
+class ReplicationStandby:
+    """ Follows a primary. Call apply() from the Tk thread; it returns the
+    number of ops applied. """
+    reconnect_delay: float = 1.0
+
+    def __init__(self,
+                 event: Event,
+                 address: str):
+        self.event = event
+        self.address = address
+        self.seq = -1  # -1 until the first snapshot
+        self.ops = queue.Queue()
+        self.connected = False
+        self.last_heard = 0.0
+        self.active = True
+        self.stream = None
+        self._lock = threading.Lock()
+        threading.Thread(target=self._follow, daemon=True).start()
+
+    def _follow(self):
+        while self.active:
+            try:
+                stream = open_stream(self.address)
+            except OSError:
+                time.sleep(self.reconnect_delay)
+                continue
+            with self._lock:
+                if not self.active:
+                    stream.close()
+                    return
+                self.stream = stream
+            self.connected = True
+            print(f"Following the primary at {self.address}.")
+            buffer = b''
+            while self.active:
+                try:
+                    data = stream.recv(65536)
+                except OSError:
+                    data = b''
+                if len(data) == 0:
+                    break
+                self.last_heard = time.monotonic()
+                buffer += data
+                *lines, buffer = buffer.split(b'\n')
+                for line in lines:
+                    self.ops.put(json.loads(line))
+            self.connected = False
+            stream.close()
+            self.ops.put({'op': 'disconnected'})
+            if self.active:
+                print(f"Lost the primary at {self.address}. Reconnecting.")
+                time.sleep(self.reconnect_delay)
+
+    def resync(self):
+        """ Drop the connection so the primary sends a new snapshot. """
+        self.seq = -1
+        with self._lock:
+            if self.stream is not None:
+                try:
+                    self.stream.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def apply(self):
+        n_applied = 0
+        while True:
+            try:
+                op = self.ops.get_nowait()
+            except queue.Empty:
+                return n_applied
+            if op['op'] == 'disconnected':
+                self.seq = -1
+                continue
+            if op['op'] == 'snapshot':
+                restore_event_state(self.event, op['state'])
+                self.seq = op['seq']
+                n_applied += 1
+                continue
+            if self.seq < 0:
+                continue  # Waiting for a snapshot
+            if op['seq'] != self.seq + 1:
+                print(f"Replication gap (expected op {self.seq + 1}, got {op['seq']}). Resynchronizing.")
+                self.resync()
+                continue
+            self.seq = op['seq']
+            self.apply_op(op)
+            n_applied += 1
+
+    def apply_op(self, op):
+        event = self.event
+        if op['op'] == 'result':
+            if op['log_idx'] in event.races[op['race_idx']].race_number:
+                # Already in a snapshot sent before it, e.g. when accepting
+                # with the dynamic schedule changed the plan.
+                return
+            event.current_race_log_idx = op['log_idx']
+            event.goto_race(op['race_idx'])
+            event.record_race_results(op['times'], op['counts'], op['accepted'])
+        elif op['op'] == 'race':
+            event.goto_race(op['race_idx'])
+
+    def take_over(self, log_file_name=None):
+        """ Stop following and become the primary. The replicated results are
+        written to log_file_name, which is then kept open for new races. """
+        self.active = False
+        self.apply()
+        with self._lock:
+            if self.stream is not None:
+                try:
+                    self.stream.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        if log_file_name is not None:
+            self.event.close_log_file()
+            self.event.write_race_log(log_file_name)
+            self.event.race_log_file = open(log_file_name, "a+")
@@ -0,0 +1,347 @@
+"""
+results_feed.py
+
+An optional HTTP + WebSocket feed of the race so that parents and the MC's
+second screen can follow along from a browser. The server runs its own asyncio
+loop on a background thread so it never blocks the Tk thread that handles the
+timers.
+
+FeedPublisher:  Watches an Event and, once per change, takes a snapshot of
+it (see event_snapshot.py). The payload (racing, on deck and next up lanes
+plus standings changes) is built from the snapshot on the feed's thread, so
+the Tk thread only pays for the snapshot.
+
+ResultsFeed:    The server. The same pre-encoded frame is queued to every
+client; nothing is recomputed per client.
+
+Endpoints:
+    /        A minimal page that renders the feed.
+    /state   The latest full state as JSON.
+    /ws      WebSocket stream. A 'snapshot' message is sent on connect, and
+             'update' messages follow on every change.
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import threading
+from typing import Callable
+
+from race_export import iter_standings
+
+ws_magic = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+client_queue_len = 16
+
+index_page = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Pinewood Derby</title>
+<style>body{font-family:serif;background:#000;color:#fff}
+td,th{padding:4px 12px;font-size:20px;white-space:pre-line}</style></head>
+<body><div id="races"></div><table id="standings"></table>
+<script>
+var standings = {};
+// Names come from the roster, so they are only ever set as text
+function add(parent, tag, text) {
+  var node = document.createElement(tag);
+  if (text !== undefined) { node.textContent = text; }
+  parent.appendChild(node);
+  return node;
+}
+function show(msg) {
+  var races = document.getElementById("races");
+  races.textContent = "";
+  msg.races.forEach(function(race) {
+    add(races, "h2", race.title + " #" + race.race_idx);
+    var tr = add(add(races, "table"), "tr");
+    race.lanes.forEach(function(lane) {
+      add(tr, "td", "Lane " + lane.lane +
+          (lane.empty ? "" : "\n" + lane.racer + "\n#" + lane.car_number + ":" + lane.heat));
+    });
+  });
+  if (msg.type == "snapshot") { standings = {}; }
+  msg.standings.forEach(function(row) { standings[row.name + ":" + row.heat] = row; });
+  msg.removed.forEach(function(key) { delete standings[key]; });
+  var rows = Object.values(standings).sort(function(a, b) { return a.average - b.average; });
+  var table = document.getElementById("standings");
+  table.textContent = "";
+  var head = add(table, "tr");
+  ["Rank", "Name", "Heat", "Time"].forEach(function(title) { add(head, "th", title); });
+  rows.forEach(function(row) {
+    var tr = add(table, "tr");
+    [row.rank, row.name, row.heat, row.average.toFixed(3)].forEach(function(text) { add(tr, "td", text); });
+  });
+}
+var ws = new WebSocket("ws://" + location.host + "/ws");
+ws.onmessage = function(e) { show(JSON.parse(e.data)); };
+</script></body></html>
+"""
+
+
+def race_lanes(snapshot, race_idx):
+    """ The lane assignments behind Event.get_chips_for_race, read from an
+    EventSnapshot. """
+    last_race = len(snapshot.races) - 1
+    if race_idx < 0:
+        race_idx = 0
+    elif race_idx > last_race:
+        race_idx = last_race
+    race = snapshot.races[race_idx]
+    out = []
+    for li, racer in enumerate(race.racers):
+        out.append({'lane': li + 1,
+                    'racer': racer.name,
+                    'car_number': racer.car_number,
+                    'heat': racer.heat_name,
+                    'empty': race.is_empty[li]})
+    return race_idx, out
+
+
+def ws_frame(text: str, opcode=0x1):
+    """ Encode an unmasked (server to client) WebSocket frame. """
+    data = text.encode('utf-8')
+    n = len(data)
+    if n < 126:
+        header = struct.pack('!BB', 0x80 | opcode, n)
+    elif n < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+    return header + data
+
+
+class ResultsFeed:
+    def __init__(self,
+                 host: str = '0.0.0.0',
+                 port: int = 8080):
+        self.host = host
+        self.port = port
+        self.loop = None
+        self.clients = set()
+        self.state_body = b'{}'
+        self.snapshot_frame = ws_frame('{}')
+        self._server = None
+        self._thread = None
+        self._started = threading.Event()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._started.wait(5.0)
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self._server = self.loop.run_until_complete(
+                asyncio.start_server(self._handle_client, self.host, self.port))
+        except OSError as e:
+            print(f"Unable to start the results feed on {self.host}:{self.port}. {e}")
+            self._started.set()
+            return
+        self.port = self._server.sockets[0].getsockname()[1]  # When port 0 was asked for
+        print(f"Results feed available at http://{self.host}:{self.port}/")
+        self._started.set()
+        self.loop.run_forever()
+        self._server.close()
+        # Let the client handlers clean up instead of being dropped mid await
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.run_until_complete(self._server.wait_closed())
+        self.loop.close()
+
+    def shutdown(self):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def call_soon(self, func, *args):
+        """ Run func(*args) on the feed's loop. Called from any thread. """
+        if self.loop is None or not self.loop.is_running():
+            return
+        self.loop.call_soon_threadsafe(func, *args)
+
+    def publish(self, snapshot: str, update: str):
+        """ Called from any thread. snapshot is the full state for new
+        clients, update is the message for clients that are already
+        connected. Both are encoded once here. """
+        if self.loop is None or not self.loop.is_running():
+            return
+        frames = (snapshot.encode('utf-8'), ws_frame(snapshot), ws_frame(update))
+        self.loop.call_soon_threadsafe(self._broadcast, *frames)
+
+    def _broadcast(self, state_body, snapshot_frame, update_frame):
+        self.state_body = state_body
+        self.snapshot_frame = snapshot_frame
+        for queue in self.clients:
+            if queue.full():  # A slow client loses its oldest message
+                queue.get_nowait()
+            queue.put_nowait(update_frame)
+
+    async def _handle_client(self, reader, writer):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = request.decode('latin-1').split('\r\n')
+        try:
+            method, path, _ = lines[0].split(' ')
+        except ValueError:
+            writer.close()
+            return
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+
+        if path == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+            await self._serve_websocket(reader, writer, headers)
+        elif path == '/state':
+            self._respond(writer, '200 OK', 'application/json', self.state_body)
+        elif path == '/':
+            self._respond(writer, '200 OK', 'text/html', index_page.encode('utf-8'))
+        else:
+            self._respond(writer, '404 Not Found', 'text/plain', b'Not found')
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    @staticmethod
+    def _respond(writer, status, content_type, body):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n"
+                     f"Access-Control-Allow-Origin: *\r\n\r\n".encode('latin-1') + body)
+
+    async def _serve_websocket(self, reader, writer, headers):
+        key = headers.get('sec-websocket-key', '')
+        accept = base64.b64encode(hashlib.sha1((key + ws_magic).encode('latin-1')).digest())
+        writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                     b"Connection: Upgrade\r\nSec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        queue = asyncio.Queue(maxsize=client_queue_len)
+        queue.put_nowait(self.snapshot_frame)
+        self.clients.add(queue)
+        listener = asyncio.ensure_future(self._read_frames(reader))
+        try:
+            while not listener.done():
+                sender = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({sender, listener},
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if sender not in done:
+                    sender.cancel()
+                    break
+                writer.write(sender.result())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(queue)
+            listener.cancel()
+            writer.close()
+
+    @staticmethod
+    async def _read_frames(reader):
+        """ Read (and discard) client frames until a close frame arrives or
+        the connection drops. """
+        try:
+            while True:
+                head = await reader.readexactly(2)
+                opcode = head[0] & 0x0f
+                n = head[1] & 0x7f
+                if n == 126:
+                    n = struct.unpack('!H', await reader.readexactly(2))[0]
+                elif n == 127:
+                    n = struct.unpack('!Q', await reader.readexactly(8))[0]
+                if head[1] & 0x80:
+                    n += 4  # mask key
+                await reader.readexactly(n)
+                if opcode == 0x8:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+
+
+class FeedPublisher:
+    """
+    Observes an Event and publishes to a ResultsFeed. Several notifications
+    in a row (e.g. a result followed by the move to the next race) are
+    coalesced into one snapshot when a schedule function such as
+    tk.Tk.after_idle is provided. build and self.standings belong to the
+    feed's thread.
+    """
+
+    def __init__(self,
+                 event,
+                 feed: ResultsFeed,
+                 schedule: Callable = None):
+        self.feed = feed
+        self.schedule = schedule
+        self.pending = False
+        self.standings = {}
+        self.event = None
+        self.attach(event)
+
+    def attach(self, event):
+        if self.event is not None:
+            self.event.remove_observer(self.on_change)
+        self.event = event
+        self.feed.call_soon(self.forget_standings)
+        event.snapshot()  # Its cache then hears of each change before we do
+        event.add_observer(self.on_change)
+        self.flush()
+
+    def forget_standings(self):
+        self.standings = {}
+
+    def on_change(self, event, kind, **info):
+        if self.schedule is None:
+            self.flush()
+        elif not self.pending:
+            self.pending = True
+            self.schedule(self.flush)
+
+    def flush(self):
+        """ On the thread that changes the event. """
+        self.pending = False
+        self.feed.call_soon(self.build, self.event.snapshot())
+
+    def build(self, event):
+        """ On the feed's thread, from a snapshot. """
+        races = []
+        if len(event.races) > 0:
+            for offset, title in enumerate(("Racing", "On Deck", "Next Up")):
+                race_idx, lanes = race_lanes(event, event.current_race_idx + offset)
+                races.append({'title': title, 'race_idx': race_idx, 'lanes': lanes})
+
+        standings = {}
+        for row in iter_standings(event):
+            standings[f"{row['name']}:{row['heat']}"] = row
+        changed = [row for key, row in standings.items()
+                   if self.standings.get(key) != row]
+        removed = [key for key in self.standings if key not in standings]
+        self.standings = standings
+
+        base = {'current_race_idx': event.current_race_idx,
+                'current_race_log_idx': event.current_race_log_idx,
+                'races': races}
+        snapshot = json.dumps(dict(base, type='snapshot',
+                                   standings=list(standings.values()), removed=[]))
+        update = json.dumps(dict(base, type='update', standings=changed, removed=removed))
+        self.feed.publish(snapshot, update)
@@ -20,18 +20,43 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 from typing import List
+import queue
 import socket
+import threading
 import tkinter as tk
 import time
 import select
 import string
 
+from timer_metrics import TimerMetrics
+
+
+heartbeat_msg = "<counts>".encode('utf-8')
+heartbeat_reply = b'<Counts:'  # The firmware answers <counts> with <Counts:nnn>
+
+
+def enable_keepalive(sckt, idle_s=5, interval_s=2, n_probes=3):
+    """ Have the OS notice a dead peer within about idle + interval*probes
+    seconds, even when no application data is flowing. """
+    sckt.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for name, value in (('TCP_KEEPIDLE', idle_s), ('TCP_KEEPINTVL', interval_s),
+                        ('TCP_KEEPCNT', n_probes)):
+        if hasattr(socket, name):
+            try:
+                sckt.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), value)
+            except OSError:
+                pass
+
 
 class TimerComs:
     n_lanes: int = 0
     hosts: list = []
     ports: list = []
     sockets: list = []
+    heartbeat_interval: float = 5.0  # Seconds of silence before a lane is pinged
+    heartbeat_timeout: float = 3.0  # Seconds to wait for the answer
+    connect_timeout: float = 2.0
+    max_retry_delay: float = 5.0
 
     def __init__(self,
                  parent: tk.Tk,
@@ -52,6 +77,18 @@ class TimerComs:
         self.reset_lane = reset_lane
         self.all_connected = False
         self.connection_window_open = False
+        self.connection_window = None
+        self.metrics = TimerMetrics(n_lanes)
+        # Connection supervision. Reconnect threads only open sockets; the
+        # sockets are swapped in by poll() on the main thread.
+        self.last_heard = [0.0] * n_lanes
+        self.heartbeat_sent = [0.0] * n_lanes
+        self.lane_racing = [False] * n_lanes
+        self.reconnect_attempts = [0] * n_lanes
+        self.reconnecting = [False] * n_lanes
+        self.pending_reset = False
+        self._reconnected = queue.Queue()
+        self._stopping = threading.Event()
 
         if addresses is not None:
             for li, address in enumerate(addresses):
@@ -60,6 +97,7 @@ class TimerComs:
             self.get_hosts_and_ports(hosts_file)
 
     def shutdown(self):
+        self._stopping.set()
         for i in range(self.n_lanes):
             try:
                 self.sockets[i].shutdown(socket.SHUT_RDWR)
@@ -104,124 +142,235 @@ class TimerComs:
         self.connection_window_open=False
 
     def connect_to_track_hosts(self, autoclose=False, reset=False):
-        self.connection_window_open = True
-
+        """ Open the connection window and return. The lanes are connected by
+        the background reconnect threads; the window only shows their state
+        and applies edited addresses, so poll() keeps running meanwhile. """
         if reset:
             self.reset_sockets()
+        for i in range(self.n_lanes):
+            self.start_reconnect(i)
+        if self.connection_window_open:
+            return
+        self.connection_window_open = True
 
         rb = self.entry_widgets
-        port_text = [[]] * self.n_lanes
+        port_text = [tk.StringVar() for _ in range(self.n_lanes)]
 
         popup = tk.Toplevel(self.parent)
         popup.wm_title("Connection To Track")
         popup.protocol("WM_DELETE_WINDOW", self.close_conn_window)
+        self.connection_window = popup
         db = tk.Label(popup, width=45)
         db.pack()
         for i in range(self.n_lanes):
-            port_text[i] = tk.StringVar()
             port_text[i].set(f"{self.hosts[i]}:{self.ports[i]}")
-            #rb[i] = tk.Label(popup, tex="{}:{}".format(
-            #    self.hosts[i], self.ports[i], fg='#050505'))
             rb[i] = tk.Entry(popup, textvariable=port_text[i])
+            rb[i].bind("<Return>", lambda e, li=i: self.apply_address(li, port_text[li].get()))
+            rb[i].bind("<FocusOut>", lambda e, li=i: self.apply_address(li, port_text[li].get()))
             rb[i].pack()
-        reset_button = tk.Button(popup, text="Reset", command=self.reset_sockets).pack()
-        last_time = time.clock_gettime(time.CLOCK_MONOTONIC) - 10.0
-        loop_count = 5
-
+        tk.Button(popup, text="Reset", command=self.reset_and_reconnect).pack()
         popup.lift()
 
-        if self.all_connected:
+        def refresh():
+            if not self.connection_window_open:
+                popup.destroy()
+                self.connection_window = None
+                return
             for i in range(self.n_lanes):
-                rb[i].config(**{'fg': '#18ff00', 'bg': '#404040'})
-
-        while self.connection_window_open:
+                if self.is_conn[i]:
+                    rb[i].config(**{'fg': '#18ff00', 'bg': '#404040'})
+                else:
+                    rb[i].config(**{'fg': '#000000', 'bg': '#ffffff'})
             if self.all_connected:
                 db.config(text="Connected. Press Reset to drop and reconnect.")
-                popup.update_idletasks()
-                popup.update()
-                time.sleep(0.05)
-                continue
-            time_diff = time.clock_gettime(time.CLOCK_MONOTONIC) - last_time
-            if time_diff < 1.0:
-                popup.update_idletasks()
-                popup.update()
-                time.sleep(0.01)
-                continue
-            elif loop_count < 5:
-                loop_count += 1
-                last_time = time.clock_gettime(time.CLOCK_MONOTONIC)
-                db.config(text=f"Re-attempting in {5-loop_count} seconds.")
-                popup.update_idletasks()
-                popup.update()
-                time.sleep(0.01)
-                continue
-            else:
-                loop_count = 0
-
-            has_focus = self.parent.focus_get()
-            i=0
-            while i < self.n_lanes:
-                while self.entry_widgets[i] == has_focus:
-                    db.config(text=f"Re-attempting connection after editing.")
-                    i=-1
-                    time.sleep(0.05)
-                    popup.update_idletasks()
-                    popup.update()
-                    has_focus = self.parent.focus_get()
-                i+=1
-            self.parent.focus_set()
-            for i in range(self.n_lanes):
-                self.hosts[i] = port_text[i].get().split(':')[0]
-                try:
-                    self.ports[i] = int(port_text[i].get().split(':')[-1])
-                except ValueError:
-                    pass
-            for i in range(4):
-                if not self.is_conn[i]:
-                    rb[i].config(**{'fg': '#000000', 'bg': '#ffffff'})
-                    db.config(text="Attempting to connect to {}:{}".format(
-                        self.hosts[i], self.ports[i]))
-                    popup.update()
-                    print("Attempting to connect to {}:{}".format(
-                        self.hosts[i], self.ports[i]))
-                    try:
-                        self.sockets[i].connect((self.hosts[i], self.ports[i]))
-                    except InterruptedError:
-                        continue
-                    except ConnectionRefusedError:
-                        continue
-                    except:
-                        rb[i].config(**{'fg': '#ff0000', 'bg': '#ffffff'})
-                    else:
-                        self.is_conn[i] = True
-                        print("Connection from {}:{} established.".format(
-                            self.hosts[i], self.ports[i]))
-                        rb[i].config(**{'fg': '#18ff00', 'bg': '#404040'})
-                        time.sleep(0.1)
-            if not all(self.is_conn):
-                print("Waiting 5 seconds and re-attempting connection.")
-                db.config(text="""Waiting 5 seconds and re-attempting connection.""")
-                last_time = time.clock_gettime(time.CLOCK_MONOTONIC)
-            else:
-                self.all_connected = True
                 if autoclose:
-                    self.connection_window_open = False
-            popup.update_idletasks()
-            popup.update()
-        popup.destroy()
+                    self.close_conn_window()
+            else:
+                waiting = [f"{i + 1}" for i in range(self.n_lanes) if not self.is_conn[i]]
+                db.config(text=f"Connecting to lane(s) {', '.join(waiting)}.")
+            popup.after(250, refresh)
+
+        refresh()
+
+    def apply_address(self, lane_idx, address):
+        """ Take an address typed in the connection window. A connected lane
+        is dropped and reconnected to the new address. """
+        host = address.split(':')[0]
+        try:
+            port = int(address.split(':')[-1])
+        except ValueError:
+            return
+        if host == self.hosts[lane_idx] and port == self.ports[lane_idx]:
+            return
+        self.hosts[lane_idx] = host
+        self.ports[lane_idx] = port
+        print(f"Lane {lane_idx + 1} address changed to {host}:{port}.")
+        if self.is_conn[lane_idx]:
+            self.lane_failed(lane_idx)
+
+    def reset_and_reconnect(self):
+        self.reset_sockets()
+        for i in range(self.n_lanes):
+            self.start_reconnect(i)
 
     def send_reset_to_track(self, accept=False):
         print("Sending Reset to the Track")
         if self.is_conn[self.reset_lane]:
-            self.sockets[self.reset_lane].sendall("<reset>".encode('utf-8'))
+            try:
+                self.sockets[self.reset_lane].sendall("<reset>".encode('utf-8'))
+            except OSError:
+                self.lane_failed(self.reset_lane)
+            else:
+                self.metrics.reset_sent()
+                return
+        print(f"Lane {self.reset_lane + 1} is reconnecting. The reset will be sent when it is back.")
+        self.pending_reset = True
+        self.start_reconnect(self.reset_lane)
+
+    # Per lane supervision
+    def lane_failed(self, lane_idx):
+        """ Drop one lane and start reconnecting it in the background. The
+        other lanes are left alone. """
+        if self.is_conn[lane_idx]:
+            print(f"Lane {lane_idx + 1} connection lost. Reconnecting in the background.")
+        self.is_conn[lane_idx] = False
+        self.all_connected = False
+        self.heartbeat_sent[lane_idx] = 0.0
+        self.lane_racing[lane_idx] = False
+        try:
+            self.sockets[lane_idx].shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sockets[lane_idx].close()
+        self.start_reconnect(lane_idx)
+
+    def start_reconnect(self, lane_idx):
+        if self.reconnecting[lane_idx] or self.is_conn[lane_idx] or self._stopping.is_set():
+            return
+        self.reconnecting[lane_idx] = True
+        self.reconnect_attempts[lane_idx] = 0
+        threading.Thread(target=self._reconnect, args=(lane_idx,), daemon=True).start()
+
+    def _reconnect(self, lane_idx):
+        delay = 0.25
+        while not self._stopping.is_set():
+            self.reconnect_attempts[lane_idx] += 1
+            sckt = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sckt.settimeout(self.connect_timeout)
+            try:
+                sckt.connect((self.hosts[lane_idx], self.ports[lane_idx]))
+            except OSError:
+                sckt.close()
+                self._stopping.wait(delay)
+                delay = min(2.0 * delay, self.max_retry_delay)
+                continue
+            sckt.settimeout(None)
+            enable_keepalive(sckt)
+            self._reconnected.put((lane_idx, sckt))
+            return
+
+    def _adopt_reconnected(self, events):
+        while True:
+            try:
+                lane_idx, sckt = self._reconnected.get_nowait()
+            except queue.Empty:
+                return
+            self.reconnecting[lane_idx] = False
+            if self.is_conn[lane_idx]:  # Connected from the hosts dialog meanwhile
+                sckt.close()
+                continue
+            self.sockets[lane_idx].close()
+            self.sockets[lane_idx] = sckt
+            self.is_conn[lane_idx] = True
+            self.last_heard[lane_idx] = time.monotonic()
+            self.all_connected = all(self.is_conn)
+            print(f"Lane {lane_idx + 1} reconnected.")
+            events.append(('connected', lane_idx, b''))
+            if lane_idx == self.reset_lane and self.pending_reset:
+                self.pending_reset = False
+                self.send_reset_to_track()
+
+    def _check_heartbeats(self, events):
+        now = time.monotonic()
+        for li in range(self.n_lanes):
+            if not self.is_conn[li] or self.lane_racing[li]:
+                continue
+            if self.heartbeat_sent[li] > 0.0:
+                if now - self.heartbeat_sent[li] > self.heartbeat_timeout:
+                    print(f"Lane {li + 1} did not answer a heartbeat.")
+                    self.lane_failed(li)
+                    events.append(('disconnected', li, b''))
+            elif now - self.last_heard[li] > self.heartbeat_interval:
+                try:
+                    self.sockets[li].sendall(heartbeat_msg)
+                except OSError:
+                    self.lane_failed(li)
+                    events.append(('disconnected', li, b''))
+                else:
+                    self.heartbeat_sent[li] = now
+
+    def poll(self, wait_len=0.05):
+        """
+        Wait up to wait_len seconds for the lane timers and return a list of
+        (kind, lane_idx, data) events, where kind is 'data', 'connected' or
+        'disconnected'. Heartbeat answers are consumed here. A lane that
+        drops is reconnected in the background and never blocks the caller.
+        """
+        events = []
+        self._adopt_reconnected(events)
+        live = [self.sockets[li] for li in range(self.n_lanes) if self.is_conn[li]]
+        if len(live) == 0:
+            time.sleep(wait_len)
+            readable = []
         else:
-            self.connect_to_track_hosts()
+            readable, _, _ = select.select(live, [], [], wait_len)
+        for sckt in readable:
+            try:
+                li = self.socket_index(sckt)
+            except ValueError:
+                continue
+            if not self.is_conn[li]:
+                continue
+            data = self.get_data_from_socket(sckt)
+            if len(data) == 0:
+                self.lane_failed(li)
+                events.append(('disconnected', li, data))
+                continue
+            self.last_heard[li] = time.monotonic()
+            if data.startswith(heartbeat_reply):
+                self.heartbeat_sent[li] = 0.0
+                continue
+            self.heartbeat_sent[li] = 0.0
+            if b'GO!' in data:
+                self.lane_racing[li] = True
+            elif b'Track count:' in data or b'Ready to Race' in data:
+                self.lane_racing[li] = False
+            events.append(('data', li, data))
+        self._check_heartbeats(events)
+        return events
+
+    def connection_report(self):
+        lines = []
+        for li in range(self.n_lanes):
+            if self.is_conn[li]:
+                state = "connected"
+            elif self.reconnecting[li]:
+                state = f"reconnecting (attempt {self.reconnect_attempts[li]})"
+            else:
+                state = "disconnected"
+            lines.append(f"Lane {li + 1} {self.hosts[li]}:{self.ports[li]} {state}")
+        return '\n'.join(lines)
 
     def get_data_from_socket(self, open_socket):
         try:
             socket_data = open_socket.recv(64)
-        except ConnectionResetError:
+        except OSError:
             return "".encode('utf-8')
+        if len(socket_data) > 0:
+            try:
+                self.metrics.message_received(self.socket_index(open_socket), socket_data)
+            except ValueError:
+                pass
         return socket_data
 
     def select(self, wait_len=0.05):
@@ -0,0 +1,228 @@
+"""
+roster_import.py
+
+Bulk registration from a roster file. A roster is a CSV (or XLSX when openpyxl
+is installed) with one row per scout. Column names are matched without regard
+to case, spaces, or underscores.
+
+Required:   name
+Optional:   rank, heat (defaults to the rank), car_number, ability_rank, notes,
+            and any of the car inspection keys (e.g. passed_weight,
+            made_this_year) with yes/no, true/false, 1/0, or x values.
+
+The whole roster is validated in one pass before anything is added to the
+event, and the race plan is regenerated once at the end.
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import csv
+import os
+from typing import List
+
+import numpy as np
+
+from race_event import Event, Heat, Racer, inspection_bits
+
+true_strings = ('1', 'x', 'y', 'yes', 'true', 'pass', 'passed', 'ok')
+
+
+def normalize_key(key):
+    return ''.join(str(key).lower().split()).replace('_', '').replace('#', 'number')
+
+
+def read_roster(file_name) -> List[dict]:
+    """ Read the rows of a roster file as dictionaries with normalized keys. """
+    ext = os.path.splitext(file_name)[1].lower()
+    if ext in ('.xlsx', '.xlsm'):
+        try:
+            import openpyxl
+        except ImportError:
+            raise ValueError("Reading XLSX rosters requires openpyxl. Save the roster as CSV instead.")
+        book = openpyxl.load_workbook(file_name, read_only=True, data_only=True)
+        rows = book.active.iter_rows(values_only=True)
+        try:
+            header = [normalize_key(x) for x in next(rows)]
+        except StopIteration:
+            return []
+        out = []
+        for row in rows:
+            out.append({key: ('' if value is None else str(value).strip())
+                        for key, value in zip(header, row)})
+        book.close()
+        return out
+    with open(file_name, newline='') as infile:
+        reader = csv.reader(infile)
+        try:
+            header = [normalize_key(x) for x in next(reader)]
+        except StopIteration:
+            return []
+        return [{key: value.strip() for key, value in zip(header, row)}
+                for row in reader]
+
+
+max_car_number = np.iinfo(np.int64).max
+
+
+def parse_car_number(raw) -> int:
+    """ A car number as written in the roster. Spreadsheets may save whole
+    numbers as e.g. '5.0', which is accepted. Raises ValueError for anything
+    that is not a positive whole number that fits the car number arrays. """
+    try:
+        value = int(raw)
+    except ValueError:
+        try:
+            value = float(raw)
+        except ValueError:
+            raise ValueError(f"car number '{raw}' is not a number")
+        if not value.is_integer():
+            raise ValueError(f"car number '{raw}' is not a whole number")
+        value = int(value)
+    if value < 1 or value > max_car_number:
+        raise ValueError(f"car number '{raw}' is out of range")
+    return value
+
+
+def validate_roster(rows: List[dict], event: Event) -> List[str]:
+    """ Check every row at once and return a list of problems. An empty list
+    means the roster can be imported. """
+    problems = []
+    if len(rows) == 0:
+        return ["The roster is empty."]
+    if 'name' not in rows[0]:
+        return ["The roster must have a 'name' column."]
+
+    names = np.array([row.get('name', '') for row in rows], dtype=object)
+    heats = np.array([row.get('heat') or row.get('rank', '') for row in rows], dtype=object)
+    line_numbers = np.arange(len(rows)) + 2  # Header is line 1
+
+    for ln in line_numbers[names == '']:
+        problems.append(f"Line {ln}: missing a name.")
+    for ln in line_numbers[heats == '']:
+        problems.append(f"Line {ln}: missing a heat or rank.")
+
+    # Duplicate racers within a heat, in the roster or already in the event
+    keys = np.array([f"{h}\x00{n}" for h, n in zip(heats, names)], dtype=object)
+    existing = set()
+    for heat in event.heats[:-1]:
+        for racer in heat.racers:
+            existing.add(f"{heat.name}\x00{racer.name}")
+    unique, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    for ui in np.flatnonzero(counts > 1):
+        heat_name, racer_name = unique[ui].split('\x00')
+        lines = ', '.join(str(x) for x in line_numbers[inverse == ui])
+        problems.append(f"Lines {lines}: {racer_name} is listed more than once in {heat_name}.")
+    for ki in np.flatnonzero([key in existing for key in keys]):
+        problems.append(f"Line {line_numbers[ki]}: {names[ki]} is already registered in {heats[ki]}.")
+
+    # Car numbers must be integers and unique across the event
+    raw_numbers = [row.get('carnumber', '') for row in rows]
+    car_numbers = np.zeros(len(rows), dtype=np.int64)
+    for ri, raw in enumerate(raw_numbers):
+        if raw == '':
+            continue
+        try:
+            car_numbers[ri] = parse_car_number(raw)
+        except ValueError as e:
+            problems.append(f"Line {line_numbers[ri]}: {e}.")
+    given = car_numbers > 0
+    unique, inverse, counts = np.unique(car_numbers[given], return_inverse=True,
+                                        return_counts=True)
+    given_lines = line_numbers[given]
+    for ui in np.flatnonzero(counts > 1):
+        lines = ', '.join(str(x) for x in given_lines[inverse == ui])
+        problems.append(f"Lines {lines}: car number {unique[ui]} is used more than once.")
+    used = np.array([racer.car_number for heat in event.heats[:-1] for racer in heat.racers],
+                    dtype=np.int64)
+    for ri in np.flatnonzero(given & np.isin(car_numbers, used)):
+        problems.append(f"Line {line_numbers[ri]}: car number {car_numbers[ri]} is already registered.")
+
+    # Ability ranks must be integers
+    for ri, row in enumerate(rows):
+        if row.get('abilityrank', '') == '':
+            continue
+        try:
+            int(float(row['abilityrank']))
+        except ValueError:
+            problems.append(f"Line {line_numbers[ri]}: ability rank '{row['abilityrank']}' is not a number.")
+
+    return problems
+
+
+def apply_car_status(racer: Racer, row: dict):
+    for key in inspection_bits:
+        value = row.get(normalize_key(key), '')
+        if value != '':
+            racer.inspection.set(key, value.lower() in true_strings)
+    if row.get('notes', '') != '':
+        racer.inspection.notes = row['notes']
+
+
+def import_roster(event: Event,
+                  file_name: str = None,
+                  rows: List[dict] = None,
+                  regenerate: bool = True):
+    """
+    Add every scout in the roster to the event. Nothing is added if any row
+    fails validation; a ValueError listing all of the problems is raised
+    instead. Returns the list of new racers.
+    """
+    if rows is None:
+        rows = read_roster(file_name)
+    problems = validate_roster(rows, event)
+    if len(problems) > 0:
+        raise ValueError('\n'.join(problems))
+
+    used = set(racer.car_number for heat in event.heats for racer in heat.racers)
+    used.update(parse_car_number(row['carnumber']) for row in rows if row.get('carnumber', '') != '')
+    next_number = 1
+
+    by_heat = {}
+    new_racers = []
+    for row in rows:
+        heat_name = row.get('heat') or row.get('rank')
+        car_number = row.get('carnumber', '')
+        if car_number == '':
+            while next_number in used or next_number == 13:
+                next_number += 1
+            car_number = next_number
+            used.add(car_number)
+        racer = Racer(name=row['name'],
+                      rank=row.get('rank', '') or heat_name,
+                      car_number=parse_car_number(car_number),
+                      heat_name=heat_name,
+                      n_lanes=event.n_lanes)
+        apply_car_status(racer, row)
+        by_heat.setdefault(heat_name, []).append((racer, row))
+        new_racers.append(racer)
+
+    for heat_name, entries in by_heat.items():
+        heat_idx = event.heat_index(heat_name=heat_name)
+        if heat_idx >= 0:
+            heat = event.heats[heat_idx]
+            for racer, _ in entries:
+                heat.add_racer(racer)
+        else:
+            ability_rank = -1
+            for _, row in entries:
+                if row.get('abilityrank', '') != '':
+                    ability_rank = int(float(row['abilityrank']))
+                    break
+            event.add_heat(Heat(name=heat_name,
+                                racers=[racer for racer, _ in entries],
+                                ability_rank=ability_rank))
+
+    if regenerate:
+        event.generate_race_plan()
+    return new_racers
@@ -0,0 +1,131 @@
+"""
+scheduler.py
+
+Race day scheduling around the racers who are actually there. The race plan
+gives every racer each lane once. When Event.dynamic_schedule is set the
+next race is picked with next_race_idx instead of simply taking the next
+race in the plan:
+
+    - The lanes of racers who are not checked in are made empty lanes.
+    - Each empty lane is filled by a checked in racer who still needs that
+      lane. A lane that is not in any race yet (a late check in) is used
+      first, otherwise the racer's run in that lane is moved up from the
+      emptiest race still to come.
+    - Races left with nobody in them are skipped.
+
+Only (racer, lane) slots are ever moved, so every racer still runs each lane
+once and the lanes stay balanced. Races keep their place in the plan, so the
+race log can be replayed as before. A racer who checks in late has their
+skipped runs picked up by the races that follow.
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from race_event import Event
+
+
+def is_present(race, lane_idx):
+    return not race.is_empty[lane_idx] and race.racers[lane_idx].checked_in
+
+
+def n_present(race):
+    return sum(is_present(race, li) for li in range(len(race.racers)))
+
+
+def is_run(race):
+    return race.accepted_result_idx >= 0
+
+
+def set_lane(event: Event, race, lane_idx, heat=None, racer=None):
+    """ Put racer in the lane, or make it an empty lane. """
+    if racer is None:
+        heat = event.heats[-1]
+        racer = heat.racers[lane_idx]
+    race.heats[lane_idx] = heat
+    race.racers[lane_idx] = racer
+    race.is_empty[lane_idx] = heat is event.heats[-1]
+
+
+def scheduled_slots(event: Event):
+    """ {(id(racer), lane_idx): race_idx} for the races not run yet. """
+    slots = {}
+    for ri, race in enumerate(event.races):
+        if is_run(race):
+            continue
+        for li, racer in enumerate(race.racers):
+            if not race.is_empty[li]:
+                slots[(id(racer), li)] = ri
+    return slots
+
+
+def compact_race(event: Event, race_idx) -> bool:
+    """ Drop the racers who are not checked in from a race that has not been
+    run and fill the empty lanes. Returns True when the race changed. """
+    race = event.races[race_idx]
+    if is_run(race) or len(race.race_number) > 0:
+        return False  # Leave a race that has been run, even once, as it is
+    changed = False
+    for li in range(event.n_lanes):
+        if not race.is_empty[li] and not race.racers[li].checked_in:
+            set_lane(event, race, li)
+            changed = True
+
+    slots = scheduled_slots(event)
+    in_race = {id(race.racers[li]) for li in range(event.n_lanes) if not race.is_empty[li]}
+    for li in range(event.n_lanes):
+        if not race.is_empty[li]:
+            continue
+        best = None
+        for heat in event.heats[:-1]:
+            for racer in heat.racers:
+                if not racer.checked_in or id(racer) in in_race or racer.race_times[li] > 0.0:
+                    continue
+                donor_idx = slots.get((id(racer), li))
+                if donor_idx is None:
+                    key = (0, 0, 0)  # Not in any race, a late check in
+                elif donor_idx > race_idx:
+                    # The emptiest race first, then the latest one
+                    key = (1, n_present(event.races[donor_idx]), -donor_idx)
+                else:
+                    continue
+                if best is None or key < best[0]:
+                    best = (key, heat, racer, donor_idx)
+        if best is None:
+            continue
+        _, heat, racer, donor_idx = best
+        if donor_idx is not None:
+            set_lane(event, event.races[donor_idx], li)
+        set_lane(event, race, li, heat, racer)
+        slots[(id(racer), li)] = race_idx
+        in_race.add(id(racer))
+        changed = True
+    if changed:
+        event.notify('plan')
+    return changed
+
+
+def next_race_idx(event: Event, start) -> int:
+    """ The first race from start on with a checked in racer, compacting each
+    race on the way. Returns start when no race is left to run. """
+    for ri in range(max(start, 0), len(event.races)):
+        if is_run(event.races[ri]):
+            continue
+        compact_race(event, ri)
+        if n_present(event.races[ri]) > 0:
+            return ri
+    return start
+
+
+def absent_racers(event: Event):
+    return [racer for heat in event.heats[:-1] for racer in heat.racers if not racer.checked_in]
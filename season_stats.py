@@ -0,0 +1,259 @@
+"""
+season_stats.py
+
+Season-wide statistics across many events. Each event (a plan plus its race
+log, or an event store) is ingested once into a column partition, a NumPy
+.npz file with one row per lane of every recorded attempt:
+
+event, log_number, plan_number, lane, racer, heat, car_number, count, time,
+accepted
+
+A manifest.json in the store directory lists the partitions along with the
+size and modification time of the files each one came from. Ingesting an
+event whose files have not changed does nothing, and adding a new event
+reads only that event. Queries load the partitions once into concatenated
+columns and answer with vectorized group-bys:
+
+lane_stats:         Count, mean and variance of the times in each lane.
+racer_progression:  Every accepted time of one racer, across events.
+drift:              The track's speed over the course of each event: what
+                    is left of each time after the lane and car averages
+                    are taken out, smoothed in race order.
+
+    python season_stats.py ingest <store dir> <name> <event file> [race log]
+    python season_stats.py report <store dir>
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import os
+import sys
+
+import numpy as np
+
+from race_event import Event
+
+manifest_name = 'manifest.json'
+numeric_columns = ('log_number', 'plan_number', 'lane', 'car_number', 'count', 'time', 'accepted')
+string_columns = ('racer', 'heat')
+
+
+def file_fingerprint(file_name):
+    if file_name is None:
+        return None
+    info = os.stat(file_name)
+    return [os.path.abspath(file_name), info.st_size, info.st_mtime_ns]
+
+
+def event_columns(event: Event) -> dict:
+    """ One row per occupied lane of every recorded attempt. """
+    rows = []
+    for race in event.races:
+        for ri, log_number in enumerate(race.race_number):
+            for li in range(event.n_lanes):
+                if race.is_empty[li]:
+                    continue
+                racer = race.racers[li]
+                rows.append((log_number, race.plan_number, li, racer.car_number,
+                             race.counts[ri][li], race.times[ri][li],
+                             ri == race.accepted_result_idx, racer.name, racer.heat_name))
+    columns = {}
+    for ci, (name, dtype) in enumerate(zip(numeric_columns + string_columns,
+                                           (np.int32, np.int32, np.int8, np.int32, np.int64,
+                                            np.float64, bool, str, str))):
+        columns[name] = np.array([row[ci] for row in rows], dtype=dtype)
+    order = np.argsort(columns['log_number'], kind='stable')
+    return {name: values[order] for name, values in columns.items()}
+
+
+class SeasonStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = {'events': {}}
+        try:
+            with open(os.path.join(directory, manifest_name)) as infile:
+                self.manifest = json.load(infile)
+        except (OSError, ValueError):
+            pass
+        self._columns = None
+
+    @property
+    def events(self):
+        return list(self.manifest['events'].keys())
+
+    def save_manifest(self):
+        temp_name = os.path.join(self.directory, manifest_name + '.tmp')
+        with open(temp_name, 'w') as outfile:
+            json.dump(self.manifest, outfile, indent=1)
+        os.replace(temp_name, os.path.join(self.directory, manifest_name))
+
+    def ingest(self, name, event_file, log_file=None, n_lanes=4):
+        """ Add (or refresh) one event. Returns the number of rows written, or
+        0 if the event's files are unchanged since they were last ingested. """
+        sources = [file_fingerprint(event_file), file_fingerprint(log_file)]
+        entry = self.manifest['events'].get(name)
+        if entry is not None and entry['sources'] == sources:
+            return 0
+        event = Event(event_file=event_file, log_file=None, n_lanes=n_lanes)
+        if event.store is not None:  # The results are already in the database
+            event.store.close()
+        elif log_file is not None:
+            event.read_log_file(log_file)
+        event.close_log_file()
+        columns = event_columns(event)
+        if entry is None:
+            partition_idx = 1 + max([e['partition_idx'] for e in self.manifest['events'].values()],
+                                    default=-1)
+        else:
+            partition_idx = entry['partition_idx']
+        partition = f"{partition_idx:05d}.npz"
+        np.savez(os.path.join(self.directory, partition), **columns)
+        self.manifest['events'][name] = {
+            'partition': partition,
+            'partition_idx': partition_idx,
+            'sources': sources,
+            'n_rows': int(len(columns['time'])),
+        }
+        self.save_manifest()
+        self._columns = None
+        return len(columns['time'])
+
+    def remove(self, name):
+        entry = self.manifest['events'].pop(name)
+        try:
+            os.remove(os.path.join(self.directory, entry['partition']))
+        except OSError:
+            pass
+        self.save_manifest()
+        self._columns = None
+
+    def columns(self, accepted_only=True):
+        """ All partitions as one set of columns (cached until the next
+        ingest), plus an 'event' column of event indices into self.events. """
+        if self._columns is None:
+            parts = {name: [] for name in numeric_columns + string_columns + ('event',)}
+            for ei, name in enumerate(self.events):
+                entry = self.manifest['events'][name]
+                with np.load(os.path.join(self.directory, entry['partition'])) as data:
+                    for column in numeric_columns + string_columns:
+                        parts[column].append(data[column])
+                    parts['event'].append(np.full(len(data['time']), ei, dtype=np.int32))
+            self._columns = {}
+            for column, values in parts.items():
+                self._columns[column] = np.concatenate(values) if values else np.zeros(0)
+        if not accepted_only:
+            return self._columns
+        keep = self._columns['accepted'].astype(bool) & (self._columns['time'] > 0.0)
+        return {name: values[keep] for name, values in self._columns.items()}
+
+    # QUERIES
+    def lane_stats(self, events=None, n_lanes=4):
+        """ n, mean and variance of the accepted times in each lane. """
+        cols = self.columns()
+        keep = np.ones(len(cols['time']), dtype=bool)
+        if events is not None:
+            keep = np.isin(cols['event'], [self.events.index(name) for name in events])
+        lanes = cols['lane'][keep].astype(np.int64)
+        times = cols['time'][keep]
+        n = np.bincount(lanes, minlength=n_lanes)
+        total = np.bincount(lanes, weights=times, minlength=n_lanes)
+        mean = np.divide(total, n, out=np.zeros(n_lanes), where=n > 0)
+        squares = np.bincount(lanes, weights=(times - mean[lanes]) ** 2, minlength=n_lanes)
+        var = np.divide(squares, n, out=np.zeros(n_lanes), where=n > 0)
+        return [{'lane': li + 1, 'n_runs': int(n[li]), 'mean': float(mean[li]), 'var': float(var[li])}
+                for li in range(n_lanes)]
+
+    def racer_progression(self, racer_name, heat_name=None):
+        """ (event, log number, lane, time) for every accepted run of a racer,
+        in season order. """
+        cols = self.columns()
+        keep = cols['racer'] == racer_name
+        if heat_name is not None:
+            keep &= cols['heat'] == heat_name
+        idx = np.flatnonzero(keep)
+        idx = idx[np.lexsort((cols['log_number'][idx], cols['event'][idx]))]
+        return [(self.events[cols['event'][i]], int(cols['log_number'][i]), int(cols['lane'][i]) + 1,
+                 float(cols['time'][i])) for i in idx]
+
+    @staticmethod
+    def racer_keys(cols):
+        """ One key per row for the racer, by name and heat, as two racers
+        in different heats may share a name. """
+        return np.char.add(np.char.add(cols['racer'].astype(str), '\x00'), cols['heat'].astype(str))
+
+    def racer_summary(self):
+        """ Mean and best accepted time of every racer over the season. """
+        cols = self.columns()
+        unique, inverse = np.unique(self.racer_keys(cols), return_inverse=True)
+        n = np.bincount(inverse)
+        mean = np.bincount(inverse, weights=cols['time']) / n
+        best = np.full(len(unique), np.inf)
+        np.minimum.at(best, inverse, cols['time'])
+        out = []
+        for ui in np.argsort(mean):
+            racer_name, heat_name = unique[ui].split('\x00')
+            out.append({'name': racer_name, 'heat': heat_name, 'n_runs': int(n[ui]),
+                        'mean': float(mean[ui]), 'best': float(best[ui])})
+        return out
+
+    def drift(self, event_name, window=5):
+        """ How much faster (negative) or slower the track ran, in seconds,
+        at each race of an event. The lane averages are taken out of each
+        time, then the average of the same car in the same event, which
+        leaves the track. The result is smoothed over window races. Returns
+        (log numbers, drift). """
+        cols = self.columns()
+        keep = cols['event'] == self.events.index(event_name)
+        racers = self.racer_keys(cols)[keep]
+        times = cols['time'][keep]
+        log_numbers = cols['log_number'][keep]
+        if len(times) == 0:
+            return np.zeros(0, dtype=np.int32), np.zeros(0)
+        lanes = cols['lane'][keep].astype(np.int64)
+        lane_n = np.bincount(lanes)
+        lane_mean = np.bincount(lanes, weights=times) / np.maximum(lane_n, 1)
+        adjusted = times - lane_mean[lanes]
+        _, racer_idx = np.unique(racers, return_inverse=True)
+        car_mean = np.bincount(racer_idx, weights=adjusted) / np.bincount(racer_idx)
+        residual = adjusted - car_mean[racer_idx]
+        races, race_idx = np.unique(log_numbers, return_inverse=True)
+        per_race = np.bincount(race_idx, weights=residual) / np.bincount(race_idx)
+        window = max(1, min(window, len(per_race)))
+        kernel = np.ones(window) / window
+        # Average over the races available at the start and end
+        smoothed = np.convolve(per_race, kernel, mode='same') / np.convolve(
+            np.ones(len(per_race)), kernel, mode='same')
+        return races, smoothed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 5 and sys.argv[1] == 'ingest':
+        store = SeasonStore(sys.argv[2])
+        n_rows = store.ingest(sys.argv[3], sys.argv[4], sys.argv[5] if len(sys.argv) > 5 else None)
+        print(f"Ingested {n_rows} rows." if n_rows else "No changes.")
+    elif len(sys.argv) == 3 and sys.argv[1] == 'report':
+        store = SeasonStore(sys.argv[2])
+        print(f"{len(store.events)} events: {', '.join(store.events)}")
+        for row in store.lane_stats():
+            print(f"Lane {row['lane']}: {row['n_runs']} runs, mean {row['mean']:.4f}, "
+                  f"std {np.sqrt(row['var']):.4f}")
+        for event_name in store.events:
+            races, drift = store.drift(event_name)
+            if len(drift):
+                print(f"{event_name}: track drift {drift.min():+.4f} to {drift.max():+.4f} s")
+    else:
+        print("Usage: python season_stats.py ingest <store dir> <name> <event file> [race log]\n"
+              "       python season_stats.py report <store dir>")
@@ -0,0 +1,59 @@
+"""
+bench_startup.py
+
+Measures how long the race manager, registration and simulator modules take
+to import in a fresh interpreter, and which heavy dependencies each one
+pulls in. Run it directly (it is not collected by pytest):
+
+    python tests/bench_startup.py [repeats]
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+modules = ['race_manager', 'registration', 'timer_sim', 'race_event']
+heavy = ['numpy', 'yaml', 'tksheet', 'pdflatex', 'asyncio', 'registration']
+
+
+def import_time(module, repeats=5):
+    """ Median wall time (s) of a fresh interpreter importing module. """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', f"import {module}"], cwd=repo_dir, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def loaded_heavy_modules(module):
+    code = (f"import sys, {module}\n"
+            f"print(' '.join(m for m in {heavy!r} if m in sys.modules))")
+    out = subprocess.run([sys.executable, '-c', code], cwd=repo_dir, check=True,
+                         capture_output=True, text=True)
+    return out.stdout.split()
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    baseline = import_time('tkinter', repeats)
+    print(f"{'module':15s} {'median s':>9s} {'over tk':>9s}  heavy imports")
+    for module in modules:
+        t = import_time(module, repeats)
+        print(f"{module:15s} {t:9.3f} {t - baseline:9.3f}  {' '.join(loaded_heavy_modules(module))}")
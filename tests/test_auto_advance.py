@@ -0,0 +1,37 @@
+import os
+
+from auto_advance import AutoAdvance
+from race_event import Event
+from timer_clock import default_rate
+
+plan_file = os.path.join(os.path.dirname(__file__), '..', 'demo_race.yaml')
+
+
+def counts_for(event, times):
+    return [int(round(t * default_rate)) for t in times]
+
+
+def test_clean_results_pass_and_odd_ones_are_held():
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    event.goto_race(0)
+    auto = AutoAdvance(delay_s=1.0)
+    race = event.current_race
+    times = [0.0 if race.is_empty[li] else 4.0 + 0.1 * li for li in range(event.n_lanes)]
+    assert auto.check(event, counts_for(event, times)) == []
+
+    missing = list(times)
+    lane = [li for li in range(event.n_lanes) if not race.is_empty[li]][0]
+    missing[lane] = 0.0
+    problems = auto.check(event, counts_for(event, missing))
+    assert problems == [f"Lane {lane + 1} did not report a time."]
+
+    slow = list(times)
+    slow[lane] = 12.0
+    assert len(auto.check(event, counts_for(event, slow))) == 1
+    assert auto.n_held == 2
+
+    # Once accepted, a rerun of the race waits for the operator
+    event.record_race_results(None, counts_for(event, times), True)
+    event.goto_race(0)
+    assert "already has an accepted result" in auto.check(event, counts_for(event, times))[0]
@@ -0,0 +1,54 @@
+import pytest
+
+from race_event import CarInspection, Racer, inspection_bits, inspection_mask, inspection_questions
+
+
+def test_inspection_round_trip():
+    inspection = CarInspection(flags=inspection_mask & ~inspection_bits['passed_weight'],
+                               notes="Heavy, added a hole")
+    status = inspection.to_dict()
+    assert status['passed_weight'] == [False, 'less than 5 oz.']
+    assert status['passed_length'][0]
+    assert all(status['questions'][key] for key in inspection_questions)
+
+    copy = CarInspection().from_dict(status)
+    assert copy.flags == inspection.flags
+    assert copy.notes == inspection.notes
+
+    # Plain bools are accepted and unknown keys are ignored
+    copy.from_dict({'passed_weight': True, 'not_an_item': False})
+    assert copy.passed_all()
+
+
+def test_a_failed_measurement_fails_inspection():
+    racer = Racer(car_number=5, name="Ann")
+    racer.car_status = CarInspection(flags=inspection_mask).to_dict()
+    assert racer.passed_inspection()
+    racer.inspection.set('passed_height', False)
+    assert not racer.passed_inspection()
+    racer.inspection.clear_measurements()
+    racer.inspection.set('made_this_year', True)
+    assert not racer.passed_inspection()
+
+
+def test_car_status_cannot_be_edited_in_place():
+    racer = Racer(car_number=5, name="Ann")
+    with pytest.raises(TypeError):
+        racer.car_status['passed_weight'] = [True, '']
+    with pytest.raises(TypeError):
+        racer.car_status['questions']['made_this_year'] = True
+    with pytest.raises(TypeError):
+        racer.car_status['passed_weight'][0] = True
+
+
+def test_racer_to_dict_and_from_dict():
+    racer = Racer(car_number=12, name="Bo", rank="Wolf", heat_name="Wolves", checked_in=False)
+    copy = Racer(car_number=99)
+    copy.from_dict(racer.to_dict())
+    assert (copy.name, copy.rank, copy.car_number, copy.checked_in) == ("Bo", "Wolf", 12, False)
+
+    copy.from_dict({'heat_name': "Bears", 'heat_index': 3,
+                    'car_status': {'passed_weight': [True, ''], 'notes': "ok"}})
+    assert (copy.heat_name, copy.index_in_heat) == ("Bears", 3)
+    assert copy.inspection.flags == inspection_bits['passed_weight']
+    assert copy.inspection.notes == "ok"
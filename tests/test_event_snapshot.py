@@ -0,0 +1,48 @@
+import os
+import pickle
+
+from race_event import Event
+from race_export import iter_results, iter_standings
+
+plan_file = os.path.join(os.path.dirname(__file__), '..', 'demo_race.yaml')
+
+
+def record(event, ri, accept=True):
+    times = [4.0 + 0.1 * li + 0.01 * ri for li in range(event.n_lanes)]
+    event.record_race_results(times, [int(t * 2000) for t in times], accept)
+
+
+def test_snapshots_share_unchanged_parts():
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    event.goto_race(0)
+    record(event, 0)
+    first = event.snapshot()
+    assert list(iter_results(first)) == list(iter_results(event))
+    assert list(iter_standings(first)) == list(iter_standings(event))
+
+    changed = event.current_race_idx
+    racers = set(id(r) for r in event.races[changed].racers)
+    record(event, 1)
+    second = event.snapshot()
+    assert second.version > first.version
+    # The earlier snapshot still shows the state when it was taken
+    assert first.races[changed].accepted_result_idx == -1
+    assert second.races[changed].accepted_result_idx == 0
+    for old, new, race in zip(first.races, second.races, event.races):
+        if any(id(r) in racers for r in race.racers):
+            assert new is not old
+        else:
+            assert new is old
+    assert second.heats[-1] is first.heats[-1]  # The empty lane heat
+    assert list(iter_standings(second)) == list(iter_standings(event))
+
+    # The views are immutable and can be sent to another process
+    copy = pickle.loads(pickle.dumps(second))
+    assert copy.races[changed].times == second.races[changed].times
+    try:
+        second.heats[0].racers[0].race_times[0] = 1.0
+    except ValueError:
+        pass
+    else:
+        assert False, "Snapshot arrays should be read only."
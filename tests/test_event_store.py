@@ -0,0 +1,87 @@
+import os
+import sqlite3
+
+import yaml
+
+from event_store import EventStore
+from race_event import Event
+
+plan_file = os.path.join(os.path.dirname(__file__), '..', 'demo_race.yaml')
+
+
+def record(event, ri, accept):
+    times = [4.0 + 0.1 * li + 0.01 * ri for li in range(event.n_lanes)]
+    counts = [int(t * 2000) for t in times]
+    event.record_race_results(times, counts, accept)
+
+
+def summary(event):
+    races = [(race.plan_number, [r.name for r in race.racers], list(race.race_number),
+              [[int(c) for c in counts] for counts in race.counts], race.accepted_result_idx)
+             for race in event.races]
+    racers = [(racer.name, [float(t) for t in racer.race_times])
+              for heat in event.heats[:-1] for racer in heat.racers]
+    return races, racers, event.current_race_idx, event.current_race_log_idx
+
+
+def test_results_survive_a_restart(tmp_path):
+    db_file = str(tmp_path / 'event.db')
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    event.goto_race(0)
+    event.heats[0].racers[0].inspection.set('passed_weight', True)
+    event.print_plan_yaml(db_file, revised_plan=event.get_race_plan(regenerate=False))
+
+    event = Event(event_file=db_file)
+    record(event, 0, False)
+    record(event, 1, True)
+    record(event, 2, True)
+    event.goto_race(4)
+
+    restarted = Event(event_file=db_file)
+    assert summary(restarted) == summary(event)
+    assert restarted.heats[0].racers[0].inspection.passed('passed_weight')
+    assert restarted.races[0].accepted_result_idx == 1
+
+    db = sqlite3.connect(db_file)
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    assert db.execute("SELECT COUNT(*) FROM attempts").fetchone()[0] == 3
+
+
+def test_import_and_report_queries(tmp_path):
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    event.goto_race(0)
+    for ri in range(3):
+        record(event, ri, True)
+    store = EventStore(str(tmp_path / 'event.db'))
+    store.save_event(event)
+
+    racer = event.races[0].racers[1]
+    rows = store.racer_results(racer.heat_name, racer.name)
+    assert (0, 0, 2, 4.1, 1) in [tuple(round(x, 2) if isinstance(x, float) else x for x in row)
+                                  for row in rows]
+    assert store.race_attempts(1) == [(1, 1)]
+    standings = store.standings()
+    assert len(standings) > 0
+    averages = [row[3] for row in standings]
+    assert averages == sorted(averages)
+
+
+def test_yaml_plan_keeps_accepted_results(tmp_path):
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    event.goto_race(0)
+    record(event, 0, False)
+    record(event, 1, True)
+    plan = {'heats': [heat.to_dict() for heat in event.heats[:-1]],
+            'races': [race.to_dict() for race in event.races]}
+    yaml_file = str(tmp_path / 'plan.yaml')
+    with open(yaml_file, 'w') as outfile:
+        yaml.safe_dump(plan, outfile)
+
+    loaded = Event(event_file=yaml_file)
+    race = loaded.races[0]
+    assert race.race_number == [0, 1]
+    assert race.accepted_result_idx == 1
+    assert race.racers[0].race_times[0] == 4.01
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from finals import add_elimination_round, add_finals_round, lane_rotation, round_sizes, select_finalists
+from race_event import Event
+
+plan_file = os.path.join(os.path.dirname(__file__), '..', 'demo_race.yaml')
+
+
+def run_races(event, first, speed):
+    """ Accept the races from first on, each car running at its speed. """
+    for ri in range(first, len(event.races)):
+        event.goto_race(ri)
+        race = event.current_race
+        times = [0.0 if race.is_empty[li] else speed[race.racers[li].car_number] + 0.01 * li
+                 for li in range(event.n_lanes)]
+        event.record_race_results(times, [int(t * 2000) for t in times], True)
+
+
+def lanes_run(event, heat):
+    return {racer.name: sorted(li for race in event.races for li, r in enumerate(race.racers)
+                               if r is racer and not race.is_empty[li])
+            for racer in heat.racers}
+
+
+def test_lane_rotation_runs_every_entry_in_every_lane():
+    for n in (2, 4, 5, 8, 16):
+        races = lane_rotation(n, 4)
+        assert len(races) == max(n, 4)
+        for li in range(4):
+            assert sorted(race[li] for race in races) == list(range(max(n, 4)))
+        assert all(len(set(race)) == 4 for race in races)
+    assert round_sizes(16, 4) == [16, 8, 4]
+
+
+def test_finals_seeded_from_the_standings():
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    racers = [racer for heat in event.heats[:-1] for racer in heat.racers]
+    speed = {racer.car_number: 3.0 + 0.1 * i for i, racer in enumerate(reversed(racers))}
+    run_races(event, 0, speed)
+
+    n_races = len(event.races)
+    finals = add_finals_round(event, 3)
+    fastest = sorted(racers, key=lambda r: speed[r.car_number])[:3]
+    assert [r.car_number for r in finals.racers] == [r.car_number for r in fastest]
+    assert len(event.races) == n_races + event.n_lanes
+    assert all(lanes == [0, 1, 2, 3] for lanes in lanes_run(event, finals).values())
+    # The heat results are kept
+    assert all((racer.race_times > 0.0).all() for racer in fastest)
+
+    per_heat = select_finalists(event, 1, per_heat=True)
+    assert len(per_heat) == len(event.heats) - 2
+
+    with pytest.raises(ValueError):
+        add_elimination_round(event, 2)  # Nobody has run the finals yet
+    run_races(event, n_races, speed)
+    cut = add_elimination_round(event, 2)
+    assert cut.name == "Finals 2"
+    assert [r.car_number for r in cut.racers] == [r.car_number for r in fastest[:2]]
@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+
+repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def loaded(module, candidates):
+    code = (f"import sys, {module}\n"
+            f"print(' '.join(m for m in {candidates!r} if m in sys.modules))")
+    out = subprocess.run([sys.executable, '-c', code], cwd=repo_dir, check=True,
+                         capture_output=True, text=True)
+    return out.stdout.split()
+
+
+def test_race_manager_defers_the_plan_editor_and_feed():
+    assert loaded('race_manager', ['registration', 'tksheet', 'results_feed', 'asyncio']) == []
+
+
+def test_race_event_defers_yaml_and_pdflatex():
+    assert loaded('race_event', ['yaml', 'pdflatex']) == []
+
+
+def test_timer_sim_does_not_need_numpy():
+    assert loaded('timer_sim', ['numpy']) == []
+    assert loaded('timer_clock', ['numpy']) == []
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from auto_advance import AutoAdvance
+from outliers import OutlierDetector, RobustWindow
+from race_event import Event
+from timer_clock import default_rate
+
+plan_file = os.path.join(os.path.dirname(__file__), '..', 'demo_race.yaml')
+
+
+def counts_for(times):
+    return [int(round(t * default_rate)) for t in times]
+
+
+def test_robust_window_ignores_one_wild_value():
+    window = RobustWindow(capacity=8)
+    for t in (4.00, 4.01, 3.99, 4.02, 9.0):
+        window.add(t)
+    median, mad = window.median_mad()
+    assert median == pytest.approx(4.01)
+    assert mad == pytest.approx(0.01)
+
+
+def test_flags_bad_runs_and_learns_only_accepted_ones():
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    event.goto_race(0)
+    detector = OutlierDetector(event.n_lanes, min_lane_runs=3)
+    detector.attach(event)
+    for ri in range(4):
+        race = event.current_race
+        times = [0.0 if race.is_empty[li] else 4.0 + 0.1 * li + 0.005 * ri
+                 for li in range(event.n_lanes)]
+        assert detector.check_race(event, counts_for(times)) == {}
+        event.record_race_results(None, counts_for(times), True)
+    lane = [li for li in range(event.n_lanes) if not event.current_race.is_empty[li]][0]
+    assert detector.lanes[lane].n >= 3
+
+    # A missed trigger: the lane reports a time far from its median
+    race = event.current_race
+    times = [0.0 if race.is_empty[li] else 4.0 + 0.1 * li for li in range(event.n_lanes)]
+    times[lane] = 5.5
+    flags = detector.check_race(event, counts_for(times))
+    assert list(flags.keys()) == [lane]
+    assert "lane median" in flags[lane]
+
+    # Saved as an attempt that was not accepted, so nothing is learned
+    n_before = detector.lanes[lane].n
+    detector.flag(race, event.current_race_log_idx, flags)
+    event.record_race_results(None, counts_for(times), False)
+    assert detector.lanes[lane].n == n_before
+    assert event.current_race is race and len(race.race_number) == 1
+    assert (race.plan_number, race.race_number[0]) in detector.flagged
+
+    times[lane] = 0.0
+    assert detector.check_race(event, counts_for(times))[lane] == "no time was reported"
+
+
+def test_reruns_are_limited():
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    event.goto_race(0)
+    detector = OutlierDetector(event.n_lanes, max_reruns=2)
+    auto = AutoAdvance()
+    assert (detector.min_time, detector.max_time) == (auto.min_time, auto.max_time)
+    race = event.current_race
+    for log_number in range(3):
+        flags = detector.check_race(event, [0] * event.n_lanes)  # A dead lane sensor
+        assert len(flags) == sum(not empty for empty in race.is_empty)
+        detector.flag(race, log_number, flags)
+        assert detector.may_rerun(race) == (log_number < 2)
+    assert detector.n_flagged(race) == 3
+    assert detector.n_flagged(event.races[1]) == 0
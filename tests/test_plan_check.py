@@ -0,0 +1,41 @@
+import os
+
+from race_event import Event, Heat, Racer
+from plan_check import validate_plan
+
+plan_file = os.path.join(os.path.dirname(__file__), '..', 'demo_race.yaml')
+
+
+def test_generated_plan_passes():
+    event = Event(event_file=plan_file)
+    report = validate_plan(event.get_race_plan(), event)
+    assert report.passed
+    assert (report.lane_counts == 1).all()
+
+
+def test_problems_are_reported_by_kind():
+    event = Event(event_file=plan_file)
+    plan = [list(row) for row in event.get_race_plan()]
+    first = plan[0][0]
+    plan[1][0] = first  # Same lane twice, right after race 1
+    plan[2][1] = "Nobody : Lions"
+    report = validate_plan(plan, event)
+    assert not report.passed
+    assert len(report.by_kind('duplicate_lane')) == 1
+    assert [1, 2] in [p.races for p in report.by_kind('back_to_back')]
+    assert len(report.by_kind('unknown_entry')) == 1
+    # The racers that were overwritten no longer cover every lane.
+    assert len(report.by_kind('missing_lane')) >= 2
+
+
+def test_back_to_back_is_only_a_warning():
+    event = Event()
+    event.close_log_file()
+    event.add_heat(Heat(name="Bears", racers=[Racer(car_number=i + 1, name=f"Cub {i}", heat_name="Bears")
+                                              for i in range(4)]))
+    report = validate_plan(event.get_race_plan(), event)
+    assert len(report.warnings) > 0
+    assert report.errors == []
+    assert report.passed
+    assert report.summary().startswith("No problems were found with the plan.")
+    assert "Warning: " in report.summary()
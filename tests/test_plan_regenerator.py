@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+import registration
+from race_event import Event
+from registration import PlanRegenerator
+
+plan_file = os.path.join(os.path.dirname(__file__), '..', 'demo_race.yaml')
+
+
+class FakeTop:
+    """ Stands in for the Tk window: after() callbacks run when told to. """
+
+    def __init__(self):
+        self.pending = {}
+        self.next_id = 0
+
+    def after(self, ms, func, *args):
+        self.next_id += 1
+        self.pending[self.next_id] = (func, args)
+        return self.next_id
+
+    def after_cancel(self, after_id):
+        self.pending.pop(after_id, None)
+
+    def run_pending(self):
+        pending, self.pending = self.pending, {}
+        for func, args in pending.values():
+            func(*args)
+
+
+class FakeRaceList:
+    def __init__(self, event):
+        self.top = FakeTop()
+        self.parent = self
+        self.event = event
+        self.plans = []
+
+    def set_plan(self, plan):
+        self.plans.append(plan)
+
+
+def settle(regenerator):
+    """ Start any pending build, wait for the worker and poll for it. """
+    top = regenerator.top
+    top.run_pending()
+    if regenerator._worker is not None:
+        regenerator._worker.join(timeout=5.0)
+    top.run_pending()
+
+
+def make_regenerator():
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    threads = []
+    event.add_observer(lambda e, kind, **info: threads.append(threading.current_thread()))
+    race_list = FakeRaceList(event)
+    return event, race_list, PlanRegenerator(race_list, delay_ms=10), threads
+
+
+def test_edits_are_debounced_and_adopted_on_the_tk_thread():
+    event, race_list, regenerator, threads = make_regenerator()
+    for _ in range(3):
+        regenerator.mark_stale()
+    assert len(race_list.top.pending) == 1
+    settle(regenerator)
+    assert len(race_list.plans) == 1
+    assert race_list.plans[0] == event.get_race_plan(regenerate=False)
+    assert threads and all(t is threading.main_thread() for t in threads)
+
+
+def test_a_stale_result_is_thrown_away():
+    event, race_list, regenerator, _ = make_regenerator()
+    regenerator.mark_stale()
+    race_list.top.run_pending()
+    regenerator._worker.join(timeout=5.0)
+    regenerator.mark_stale()  # Edited while the worker was busy
+    regenerator._poll()
+    assert race_list.plans == []
+    settle(regenerator)
+    assert len(race_list.plans) == 1
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_a_failed_build_stops_polling(monkeypatch):
+    event, race_list, regenerator, _ = make_regenerator()
+
+    class Broken:
+        def get_race_plan(self):
+            raise sqlite3.ProgrammingError("SQLite objects created in a thread")
+
+    monkeypatch.setattr(registration, 'copy_for_planning', lambda e: Broken())
+    regenerator.mark_stale()
+    settle(regenerator)
+    assert race_list.plans == []
+    assert race_list.top.pending == {}
+
+
+def test_a_build_finishing_after_close_is_dropped():
+    event, race_list, regenerator, _ = make_regenerator()
+    plan = event.get_race_plan(regenerate=False)
+    regenerator.mark_stale()
+    race_list.top.run_pending()
+    regenerator.cancel()  # The window closed while the worker was busy
+    regenerator._worker.join(timeout=5.0)
+    race_list.top.run_pending()
+    assert race_list.top.pending == {}
+    assert race_list.plans == []
+    assert event.get_race_plan(regenerate=False) == plan
+    regenerator.mark_stale()
+    assert race_list.top.pending == {}
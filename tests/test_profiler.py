@@ -0,0 +1,61 @@
+import pytest
+
+from profiler import Profiler
+
+
+def test_nested_timers_fold_self_time():
+    profiler = Profiler('timers', slow_frame_ms=0.0)
+
+    def inner():
+        return 3
+
+    inner = profiler.wrap(inner, name='inner')
+
+    def outer():
+        return inner() + 1
+
+    outer = profiler.wrap(outer, name='outer')
+    profiler.frame_start()
+    with profiler.section('socket'):
+        assert outer() == 4
+    profiler.frame_end()
+    assert set(profiler.folded) == {'socket', 'socket;outer', 'socket;outer;inner'}
+    assert profiler.calls['inner'][0] == 1
+    assert len(profiler.slow_frames) == 1
+    assert profiler.slow_frames[0][2][0][0] == 'socket'
+
+
+def test_exceptions_still_close_the_timer():
+    profiler = Profiler()
+
+    def fails():
+        raise ValueError("bad")
+
+    fails = profiler.wrap(fails, name='fails')
+    with pytest.raises(ValueError):
+        fails()
+    assert profiler.stack == []
+    assert profiler.calls['fails'][0] == 1
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        Profiler('perf')
+
+
+@pytest.mark.parametrize('mode', ['cprofile', 'tracemalloc'])
+def test_reports_are_folded_stacks(tmp_path, mode):
+    profiler = Profiler(mode, window_s=60.0)
+    profiler.start_sampler()
+    work = profiler.wrap(lambda: sorted(str(x) for x in range(20000)), name='work')
+    work()
+    written = profiler.write_reports(str(tmp_path / 'profile'))
+    assert len(written) == 3
+    with open(written[2]) as infile:
+        lines = infile.read().splitlines()
+    assert len(lines) > 0
+    for line in lines:
+        stack, value = line.rsplit(' ', 1)
+        assert int(value) > 0
+    with open(written[0]) as infile:
+        assert infile.read().startswith('work ')
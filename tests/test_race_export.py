@@ -0,0 +1,80 @@
+import csv
+import os
+
+from race_event import Event
+from race_export import ResultsExporter, iter_lane_stats, iter_results, iter_standings
+
+plan_file = os.path.join(os.path.dirname(__file__), '..', 'demo_race.yaml')
+
+
+def run_races(event, n_races):
+    for ri in range(n_races):
+        times = [4.0 + 0.1 * li + 0.01 * ri for li in range(event.n_lanes)]
+        counts = [int(t * 2000) for t in times]
+        event.record_race_results(times, counts, True)
+
+
+def make_event(n_races=3):
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    event.goto_race(0)
+    run_races(event, n_races)
+    return event
+
+
+def test_results_only_cover_accepted_races():
+    event = make_event(3)
+    rows = list(iter_results(event))
+    plan_numbers = set(row['plan_number'] for row in rows)
+    assert plan_numbers == {0, 1, 2}
+    for row in rows:
+        assert not event.races[row['plan_number']].is_empty[row['lane'] - 1]
+
+
+def test_standings_are_sorted():
+    event = make_event(4)
+    averages = [row['average'] for row in iter_standings(event)]
+    assert len(averages) > 0
+    assert averages == sorted(averages)
+
+
+def test_lane_stats():
+    event = make_event(3)
+    stats = list(iter_lane_stats(event))
+    assert [row['lane'] for row in stats] == [1, 2, 3, 4]
+    for row in stats:
+        if row['n_runs'] > 0:
+            assert row['min'] <= row['mean'] <= row['max']
+
+
+def test_incremental_export_appends_new_results(tmp_path):
+    event = make_event(2)
+    exporter = ResultsExporter(str(tmp_path), fmt='csv')
+    first = exporter.export(event)
+    assert first > 0
+    assert exporter.export(event) == 0
+
+    run_races(event, 1)
+    # A new exporter picks up where the last one stopped.
+    second = ResultsExporter(str(tmp_path), fmt='csv').export(event)
+    assert second > 0
+    with open(os.path.join(str(tmp_path), 'results.csv')) as infile:
+        rows = list(csv.DictReader(infile))
+    assert len(rows) == first + second
+
+
+def test_a_new_accepted_attempt_replaces_the_old_rows(tmp_path):
+    event = make_event(2)
+    exporter = ResultsExporter(str(tmp_path), fmt='csv')
+    n_rows = exporter.export(event)
+
+    event.goto_race(1)
+    run_races(event, 1)  # Run again and accept the new attempt
+    second = ResultsExporter(str(tmp_path), fmt='csv')
+    assert second.export(event) == n_rows
+    with open(os.path.join(str(tmp_path), 'results.csv')) as infile:
+        rows = list(csv.DictReader(infile))
+    assert len(rows) == n_rows
+    log_numbers = {int(row['plan_number']): int(row['log_number']) for row in rows}
+    assert log_numbers[1] == int(event.races[1].race_number[event.races[1].accepted_result_idx])
+    assert second.export(event) == 0
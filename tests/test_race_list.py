@@ -0,0 +1,96 @@
+import os
+
+from race_event import Event
+from registration import RaceList, RegistrationWindow, sheet_edit_bindings
+
+plan_file = os.path.join(os.path.dirname(__file__), '..', 'demo_race.yaml')
+
+
+class FakeSheet:
+    def __init__(self, data):
+        self.data = data
+        self.highlights = set()
+
+    def set_sheet_data(self, data, reset_highlights=False):
+        if reset_highlights:
+            self.highlights = set()
+        self.data = data
+        return data
+
+    def get_sheet_data(self):
+        return [list(row) for row in self.data]
+
+
+def test_moving_rows_rebuilds_the_cell_index():
+    event = Event(event_file=plan_file)
+    plan = event.get_race_plan()
+    event.close_log_file()
+    race_list = RaceList.__new__(RaceList)
+    race_list.sheet = FakeSheet(plan)
+    race_list.sheet_data = plan
+    race_list.index_is_stale = True
+    racer = event.heats[0].racers[0]
+    cells = race_list.cells_for_racer(racer)
+    assert len(cells) == event.n_lanes
+
+    # Like tksheet, a row move swaps in a new list
+    race_list.sheet.data = plan[1:] + plan[:1]
+    assert "end_move_rows" in sheet_edit_bindings
+    race_list.mark_index_stale()
+    moved = race_list.cells_for_racer(racer)
+    assert sorted(moved) == sorted(((ri - 1) % len(plan), ci) for ri, ci in cells)
+
+
+def test_a_new_plan_clears_the_highlights():
+    race_list = RaceList.__new__(RaceList)
+    race_list.sheet = FakeSheet([["A : Bears"]])
+    race_list.sheet.highlights.add((0, 0))
+    race_list.set_plan([["B : Bears"]])
+    assert race_list.sheet.highlights == set()
+    assert race_list.highlighted_cells == []
+
+
+class FakeList:
+    def __init__(self):
+        self.selected = -1
+        self.shown_heat = None
+
+    def get_selected_racer_index(self):
+        return self.selected
+
+    get_selected_heat_index = get_selected_racer_index
+
+    def set_racers_from_heat(self, heat_idx):
+        self.shown_heat = heat_idx
+        self.selected = -1
+
+
+class FakeRaceList:
+    def __init__(self):
+        self.highlighted = None
+
+    def remove_highlighting(self):
+        self.highlighted = None
+
+    def highlight_racer(self, racer):
+        self.highlighted = racer
+
+
+def test_the_pane_follows_a_list_rebuilt_from_code():
+    event = Event(event_file=plan_file)
+    event.close_log_file()
+    window = RegistrationWindow.__new__(RegistrationWindow)
+    window.event = event
+    window.heat_list, window.racer_list, window.race_list = FakeList(), FakeList(), FakeRaceList()
+    window.refresh_pane()
+    window.racer_list.selected = 2
+    window.check_racer_pane()
+    assert window.race_list.highlighted is window.get_racer_by_index(2)
+
+    # The racer is deleted and the list rebuilt, then the next racer is picked
+    event.remove_racer(racer=window.race_list.highlighted)
+    window.refresh_pane()
+    assert window.race_list.highlighted is None
+    window.racer_list.selected = 2
+    window.check_racer_pane()
+    assert window.race_list.highlighted is window.get_racer_by_index(2)
@@ -0,0 +1,97 @@
+import csv
+import os
+
+import pytest
+
+from race_event import Event
+from race_timeline import RaceTimeline
+
+plan_file = os.path.join(os.path.dirname(__file__), '..', 'demo_race.yaml')
+
+
+class FakeClock:
+    def __init__(self):
+        self.t = 1000.0
+
+    def __call__(self):
+        return self.t
+
+    def advance(self, dt):
+        self.t += dt
+
+
+def run_race(timeline, clock, event, staging=20.0):
+    lanes = [li for li in range(event.n_lanes) if not event.current_race.is_empty[li]]
+    race_idx = event.current_race_idx
+    for li in lanes:
+        timeline.go(li, race_idx)
+    clock.advance(4.0)
+    for li in lanes:
+        timeline.lane_finished(li, lanes, race_idx)
+    clock.advance(6.0)  # The MC reads the times
+    timeline.reset_sent()
+    times = [4.0] * event.n_lanes
+    event.record_race_results(times, [8000] * event.n_lanes, True)
+    clock.advance(1.0)
+    lanes = [li for li in range(event.n_lanes) if not event.current_race.is_empty[li]]
+    for li in lanes:
+        timeline.lane_ready(li, lanes)
+    clock.advance(staging)
+
+
+def test_steps_rate_and_projection(tmp_path):
+    clock = FakeClock()
+    timeline = RaceTimeline(clock=clock)
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    event.goto_race(0)
+    timeline.attach(event)
+    for _ in range(4):
+        run_race(timeline, clock, event)
+
+    cycles = timeline.cycles()
+    assert len(cycles) == 4
+    assert cycles[0]['cycle_s'] == pytest.approx(31.0)
+    assert cycles[0]['race'] == pytest.approx(4.0)
+    assert cycles[0]['decide'] == pytest.approx(6.0)
+    assert cycles[0]['track_reset'] == pytest.approx(1.0)
+    assert cycles[0]['staging'] == pytest.approx(20.0)
+    assert cycles[-1]['cycle_s'] is None  # The next race has not started
+
+    summary = timeline.summary(event)
+    assert summary['slowest_step'] == 'staging'
+    assert summary['races_per_hour'] == pytest.approx(3600.0 / 31.0)
+    assert summary['races_left'] == len(event.races) - 4
+    assert summary['projected_finish'] == pytest.approx(clock.t + 31.0 * summary['races_left'])
+    assert "Slowest step: staging" in timeline.report(event)
+
+    events_file, cycles_file = timeline.export(str(tmp_path))
+    with open(cycles_file) as infile:
+        assert len(list(csv.DictReader(infile))) == 4
+    with open(events_file) as infile:
+        kinds = [row['kind'] for row in csv.DictReader(infile)]
+    assert kinds.count('accept') == 4 and kinds.count('all_ready') == 4
+
+
+def test_a_missed_finish_does_not_merge_races():
+    clock = FakeClock()
+    timeline = RaceTimeline(clock=clock)
+    lanes = [0, 1, 2, 3]
+    for li in lanes:
+        timeline.go(li, 0)
+    clock.advance(4.0)
+    for li in lanes[:-1]:  # The last lane's count is lost
+        timeline.lane_finished(li, lanes, 0)
+    clock.advance(6.0)
+    timeline.reset_sent()
+    clock.advance(21.0)
+    for li in lanes:
+        timeline.go(li, 1)
+    for li in lanes:
+        timeline.lane_finished(li, lanes, 1)
+
+    cycles = timeline.cycles()
+    assert len(cycles) == 2
+    assert cycles[0]['race'] is None
+    assert cycles[0]['cycle_s'] == pytest.approx(31.0)
+    assert cycles[1]['race'] == pytest.approx(0.0)
@@ -0,0 +1,44 @@
+import os
+
+from race_event import Event
+
+plan_file = os.path.join(os.path.dirname(__file__), '..', 'demo_race.yaml')
+
+
+def test_views_are_reused_until_their_race_changes():
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    event.goto_race(0)
+    views = [event.race_view(ri) for ri in range(len(event.races))]
+    n_builds = event.views.n_builds
+    assert event.get_chips_for_race(1) == [racer.chip() for racer in event.races[1].racers]
+    assert event.get_race_plan(regenerate=False)[2] == event.races[2].get_racer_list([])
+    assert event.views.n_builds == n_builds
+
+    # A result only rebuilds its own race
+    times = [4.0 + 0.1 * li for li in range(event.n_lanes)]
+    event.record_race_results(times, [int(t * 2000) for t in times], True)
+    assert event.views.n_builds == n_builds
+    views[0] = event.race_view(0)
+    assert views[0].attempts == ('0 < ACC',)
+    assert event.race_view(1) is views[1]
+    assert event.views.n_builds == n_builds + 1
+
+    # Renaming a racer rebuilds the races they are in
+    racer = event.races[1].racers[1]
+    racer.name = "Renamed"
+    event.notify('racer', racer=racer)
+    for ri, race in enumerate(event.races):
+        view = event.race_view(ri)
+        assert (view is views[ri]) == (racer not in race.racers)
+    assert "Renamed" in event.get_chips_for_race(1)[1]['text']
+
+    # A swap without a notification is still caught
+    race = event.races[3]
+    race.racers[0], race.racers[1] = race.racers[1], race.racers[0]
+    assert event.race_view(3).racers == tuple(race.racers)
+
+    event.generate_race_plan()
+    event.views.refresh()
+    assert event.views.is_empty.shape == (len(event.races), event.n_lanes)
+    assert (event.views.is_empty == [race.is_empty for race in event.races]).all()
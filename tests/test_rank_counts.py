@@ -0,0 +1,27 @@
+import numpy as np
+
+from race_event import rank_counts
+
+
+def test_ranks_are_places_not_a_permutation():
+    # argsort + 1 would give [2, 3, 1, 4] here.
+    assert list(rank_counts([8200, 8000, 8400, 8600])) == [2, 1, 3, 4]
+
+
+def test_ties_share_a_place():
+    assert list(rank_counts([8000, 8000, 8400, 8600])) == [1, 1, 3, 4]
+    assert list(rank_counts([8000, 8001, 8400, 8600], tolerance=1)) == [1, 1, 3, 4]
+
+
+def test_empty_and_missing_lanes_are_unplaced():
+    ranks = rank_counts([8000, 0, 7000, 8400], is_empty=[False, False, True, False])
+    assert list(ranks) == [1, 0, 0, 2]
+
+
+def test_batch_ranking_matches_single_races():
+    rng = np.random.default_rng(0)
+    counts = rng.integers(7000, 9000, size=(50, 4))
+    is_empty = rng.random((50, 4)) < 0.2
+    batch = rank_counts(counts, is_empty)
+    for c, e, ranks in zip(counts, is_empty, batch):
+        assert (rank_counts(c, e) == ranks).all()
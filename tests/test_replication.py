@@ -0,0 +1,121 @@
+import os
+import time
+
+from race_event import Event
+from replication import ReplicationPrimary, ReplicationStandby, event_state, restore_event_state
+
+plan_file = os.path.join(os.path.dirname(__file__), '..', 'demo_race.yaml')
+
+
+def new_event():
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    event.goto_race(0)
+    return event
+
+
+def record(event, ri, accept):
+    times = [4.0 + 0.1 * li + 0.01 * ri for li in range(event.n_lanes)]
+    counts = [int(t * 2000) for t in times]
+    event.record_race_results(times, counts, accept)
+
+
+def follow(primary, standby, n_ops, timeout=5.0):
+    applied = 0
+    end = time.monotonic() + timeout
+    while applied < n_ops and time.monotonic() < end:
+        primary.admit()
+        applied += standby.apply()
+        time.sleep(0.01)
+    return applied
+
+
+def test_state_round_trip():
+    event = new_event()
+    record(event, 0, True)
+    record(event, 1, False)
+    record(event, 2, True)
+    event.races[1].racers[0].inspection.notes = "Wheels"
+    copy = new_event()
+    restore_event_state(copy, event_state(event))
+    assert event_state(copy) == event_state(event)
+    assert copy.races[0].racers[0].race_times.sum() > 0.0
+    assert copy.current_race is copy.races[copy.current_race_idx]
+
+
+def test_standby_mirrors_the_primary_and_takes_over(tmp_path):
+    address = "unix:" + str(tmp_path / 'replication.sock')
+    primary_event = new_event()
+    record(primary_event, 0, True)
+    primary = ReplicationPrimary(primary_event, address)
+    standby_event = new_event()
+    standby = ReplicationStandby(standby_event, address)
+    try:
+        assert follow(primary, standby, 1) == 1  # The snapshot
+        primary_event.generate_race_plan()  # Plan edits are sent as a snapshot
+        primary_event.goto_race(1)
+        record(primary_event, 1, False)  # A rerun that was not accepted
+        record(primary_event, 2, True)
+        primary_event.goto_race(5)
+        primary_event.goto_race(3)
+        follow(primary, standby, 100, timeout=0.5)
+        assert standby.seq == primary.seq
+        assert event_state(standby_event) == event_state(primary_event)
+
+        log_file = str(tmp_path / 'standby_log.csv')
+        standby.take_over(log_file)
+        record(standby_event, 3, True)
+        standby_event.close_log_file()
+        with open(log_file) as infile:
+            lines = infile.read().splitlines()
+        assert len(lines) == 3
+        assert lines[0].endswith("NA")
+        assert lines[-1].endswith("Accepted")
+    finally:
+        standby.active = False
+        primary.shutdown()
+
+
+def test_gap_forces_a_new_snapshot(tmp_path):
+    address = "unix:" + str(tmp_path / 'replication.sock')
+    primary_event = new_event()
+    primary = ReplicationPrimary(primary_event, address)
+    standby = ReplicationStandby(new_event(), address)
+    standby.reconnect_delay = 0.05
+    try:
+        follow(primary, standby, 1)
+        standby.ops.put({'op': 'race', 'race_idx': 2, 'seq': standby.seq + 5})
+        standby.apply()
+        assert standby.seq == -1
+        record(primary_event, 0, True)
+        end = time.monotonic() + 5.0
+        while standby.seq != primary.seq and time.monotonic() < end:
+            primary.admit()
+            standby.apply()
+            time.sleep(0.01)
+        assert event_state(standby.event) == event_state(primary_event)
+    finally:
+        standby.active = False
+        primary.shutdown()
+
+
+def test_dynamic_schedule_does_not_record_twice(tmp_path):
+    address = "unix:" + str(tmp_path / 'replication.sock')
+    primary_event = new_event()
+    primary_event.dynamic_schedule = True
+    primary_event.check_in(primary_event.races[1].racers[0], False)
+    primary = ReplicationPrimary(primary_event, address)
+    standby_event = new_event()
+    standby = ReplicationStandby(standby_event, address)
+    try:
+        assert follow(primary, standby, 1) == 1
+        record(primary_event, 0, True)  # Compacts race 1, a snapshot before the result
+        record(primary_event, 1, True)
+        follow(primary, standby, 100, timeout=0.5)
+        assert standby.seq == primary.seq
+        assert [list(race.race_number) for race in standby_event.races] == \
+               [list(race.race_number) for race in primary_event.races]
+        assert event_state(standby_event) == event_state(primary_event)
+    finally:
+        standby.active = False
+        primary.shutdown()
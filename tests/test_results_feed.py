@@ -0,0 +1,101 @@
+import json
+import os
+import socket
+import struct
+import threading
+
+from race_event import Event
+from results_feed import FeedPublisher, ResultsFeed, race_lanes, ws_frame
+
+plan_file = os.path.join(os.path.dirname(__file__), '..', 'demo_race.yaml')
+
+
+def read_frame(conn):
+    def read(n):
+        data = b''
+        while len(data) < n:
+            chunk = conn.recv(n - len(data))
+            assert chunk, "connection closed"
+            data += chunk
+        return data
+
+    head = read(2)
+    n = head[1] & 0x7f
+    if n == 126:
+        n = struct.unpack('!H', read(2))[0]
+    elif n == 127:
+        n = struct.unpack('!Q', read(8))[0]
+    return head[0], read(n)
+
+
+def test_frame_lengths():
+    assert ws_frame('x' * 125)[:2] == b'\x81\x7d'
+    assert ws_frame('x' * 126)[:4] == b'\x81\x7e\x00\x7e'
+    assert ws_frame('x' * 65536)[:10] == b'\x81\x7f' + struct.pack('!Q', 65536)
+    assert ws_frame('x' * 65536)[10:] == b'x' * 65536
+
+
+def test_lanes_match_the_chips():
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    race_idx, lanes = race_lanes(event.snapshot(), len(event.races) + 5)
+    assert race_idx == event.last_race
+    chips = event.get_chips_for_race(race_idx)
+    for lane, chip in zip(lanes, chips):
+        assert chip['text'] == "{}\n#{}:{}".format(lane['racer'], lane['car_number'], lane['heat'])
+    event.close_log_file()
+
+
+def test_handshake_snapshot_and_update():
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    event.goto_race(0)
+    feed = ResultsFeed(host='127.0.0.1', port=0)
+    feed.start()
+    publisher = FeedPublisher(event, feed)
+    build, built_on = publisher.build, []
+
+    def record_build(snapshot):
+        built_on.append(threading.current_thread())
+        build(snapshot)
+
+    publisher.build = record_build
+    conn = socket.create_connection(('127.0.0.1', feed.port), timeout=5.0)
+    try:
+        # The sample key and answer from RFC 6455
+        conn.sendall(b"GET /ws HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n"
+                     b"Connection: Upgrade\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+                     b"Sec-WebSocket-Version: 13\r\n\r\n")
+        response = b''
+        while b'\r\n\r\n' not in response:
+            response += conn.recv(1)
+        assert response.startswith(b"HTTP/1.1 101")
+        assert b"Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=" in response
+
+        opcode, payload = read_frame(conn)
+        assert opcode == 0x81
+        snapshot = json.loads(payload)
+        assert snapshot['type'] == 'snapshot'
+        assert [race['title'] for race in snapshot['races']] == ["Racing", "On Deck", "Next Up"]
+        assert snapshot['races'][0]['lanes'] == race_lanes(event.snapshot(), 0)[1]
+
+        times = [4.0 + 0.1 * li for li in range(event.n_lanes)]
+        event.record_race_results(times, [int(t * 2000) for t in times], True)
+        update = None
+        while update is None or not update['standings']:
+            update = json.loads(read_frame(conn)[1])
+        assert update['type'] == 'update'
+        assert update['current_race_idx'] == event.current_race_idx
+        assert update['removed'] == []
+        assert len(update['standings']) > 0
+        assert {row['name'] for row in update['standings']} <= \
+            {racer.name for racer in event.races[0].racers}
+    finally:
+        conn.close()
+        feed.shutdown()
+        feed._thread.join(timeout=5.0)
+        event.close_log_file()
+
+    assert publisher.standings
+    # Only the first snapshot, taken on attach, was built before the wrapper
+    assert built_on and all(thread is feed._thread for thread in built_on)
@@ -0,0 +1,140 @@
+import socket
+import time
+
+from rm_socket import TimerComs
+
+
+class FakeLane:
+    def __init__(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.server.settimeout(5.0)
+        self.conn = None
+
+    @property
+    def address(self):
+        return "127.0.0.1:{}".format(self.server.getsockname()[1])
+
+    def accept(self):
+        self.conn, _ = self.server.accept()
+        self.conn.settimeout(5.0)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+        self.server.close()
+
+
+def connected_coms(n_lanes=4):
+    lanes = [FakeLane() for _ in range(n_lanes)]
+    coms = TimerComs(None, addresses=[lane.address for lane in lanes], n_lanes=n_lanes, reset_lane=0)
+    for li, lane in enumerate(lanes):
+        coms.sockets[li].connect((coms.hosts[li], coms.ports[li]))
+        coms.is_conn[li] = True
+        coms.last_heard[li] = time.monotonic()
+        lane.accept()
+    return coms, lanes
+
+
+def poll_until(coms, kind, timeout=5.0):
+    events = []
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        events.extend(coms.poll(0.05))
+        if any(e[0] == kind for e in events):
+            return events
+    return events
+
+
+def test_one_lane_drops_and_reconnects_alone():
+    coms, lanes = connected_coms()
+    try:
+        lanes[2].conn.sendall(b'<GO!>')
+        assert poll_until(coms, 'data') == [('data', 2, b'<GO!>')]
+
+        lanes[1].conn.close()
+        lanes[1].conn = None
+        events = poll_until(coms, 'disconnected')
+        assert ('disconnected', 1, b'') in events
+        assert coms.is_conn == [True, False, True, True]
+
+        lanes[1].accept()
+        assert ('connected', 1, b'') in poll_until(coms, 'connected')
+        assert all(coms.is_conn)
+        lanes[1].conn.sendall(b'<Track count:8000>')
+        assert ('data', 1, b'<Track count:8000>') in poll_until(coms, 'data')
+    finally:
+        coms.shutdown()
+        for lane in lanes:
+            lane.close()
+
+
+def test_heartbeats_are_answered_and_missed():
+    coms, lanes = connected_coms(n_lanes=4)
+    coms.heartbeat_interval = 0.1
+    coms.heartbeat_timeout = 0.3
+    try:
+        coms.lane_racing = [True, False, True, True]
+        time.sleep(0.15)
+        coms.poll(0.0)
+        assert lanes[1].conn.recv(64) == b'<counts>'
+        lanes[1].conn.sendall(b'<Counts:15420>')
+        events = []
+        for _ in range(5):
+            events.extend(coms.poll(0.05))
+        assert events == []  # The answer is consumed
+        assert coms.is_conn[1]
+
+        # A short result is not taken for an answer
+        coms.heartbeat_sent[1] = time.monotonic()
+        lanes[1].conn.sendall(b'<60>')
+        assert ('data', 1, b'<60>') in poll_until(coms, 'data')
+
+        # Lane 2 stops answering
+        events = poll_until(coms, 'disconnected', timeout=2.0)
+        assert ('disconnected', 1, b'') in events
+        assert coms.is_conn == [True, False, True, True]
+    finally:
+        coms.shutdown()
+        for lane in lanes:
+            lane.close()
+
+
+def test_reset_waits_for_the_reset_lane():
+    coms, lanes = connected_coms()
+    try:
+        lanes[0].conn.close()
+        lanes[0].conn = None
+        poll_until(coms, 'disconnected')
+        coms.send_reset_to_track()
+        assert coms.pending_reset
+        lanes[0].accept()
+        poll_until(coms, 'connected')
+        assert lanes[0].conn.recv(64) == b'<reset>'
+        assert not coms.pending_reset
+    finally:
+        coms.shutdown()
+        for lane in lanes:
+            lane.close()
+
+
+def test_edited_address_moves_the_lane():
+    coms, lanes = connected_coms(n_lanes=2)
+    moved = FakeLane()
+    try:
+        coms.apply_address(1, lanes[1].address)  # Unchanged, so nothing happens
+        assert coms.is_conn == [True, True]
+
+        coms.apply_address(1, moved.address)
+        assert coms.is_conn == [True, False]
+        moved.accept()
+        assert ('connected', 1, b'') in poll_until(coms, 'connected')
+        moved.conn.sendall(b'<Ready to Race>')
+        assert ('data', 1, b'<Ready to Race>') in poll_until(coms, 'data')
+    finally:
+        coms.shutdown()
+        moved.close()
+        for lane in lanes:
+            lane.close()
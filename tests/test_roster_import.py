@@ -0,0 +1,56 @@
+import pytest
+
+from race_event import Event
+from roster_import import import_roster, read_roster, validate_roster
+
+
+def write_roster(tmp_path, text):
+    file_name = tmp_path / "roster.csv"
+    file_name.write_text(text)
+    return str(file_name)
+
+
+def test_import_creates_heats_and_plan(tmp_path):
+    lines = ["Name,Rank,Car Number,Ability Rank,Passed Weight"]
+    for i in range(40):
+        rank = ["Lion", "Tiger", "Wolf", "Bear"][i % 4]
+        lines.append(f"Scout {i},{rank},{100 + i},{i % 4},yes")
+    event = Event()
+    new_racers = import_roster(event, write_roster(tmp_path, '\n'.join(lines)))
+    assert len(new_racers) == 40
+    assert sorted(heat.name for heat in event.heats[:-1]) == ["Bear", "Lion", "Tiger", "Wolf"]
+    assert all(racer.car_status['passed_weight'][0] for racer in new_racers)
+    assert len(event.races) > 0
+
+
+def test_missing_car_numbers_are_assigned(tmp_path):
+    event = Event()
+    new_racers = import_roster(event, write_roster(tmp_path, "name,heat\nA,Webelos\nB,Webelos\n"))
+    numbers = [racer.car_number for racer in new_racers]
+    assert len(set(numbers)) == 2
+    assert all(n > 0 for n in numbers)
+
+
+def test_validation_reports_every_problem(tmp_path):
+    file_name = write_roster(tmp_path,
+                             "name,heat,car number\n"
+                             "A,Bears,5\n"
+                             "A,Bears,6\n"
+                             ",Bears,7\n"
+                             "B,Bears,5\n"
+                             "C,Bears,seven\n"
+                             "D,Bears,0\n"
+                             "E,Bears,5.5\n"
+                             "F,Bears,8.0\n"
+                             "G,Bears,1e30\n"
+                             "H,Bears,9223372036854775808\n")
+    event = Event()
+    problems = validate_roster(read_roster(file_name), event)
+    assert len(problems) == 8
+    assert "Line 7: car number '0' is out of range." in problems
+    assert "Line 8: car number '5.5' is not a whole number." in problems
+    assert "Line 10: car number '1e30' is out of range." in problems
+    assert "Line 6: car number 'seven' is not a number." in problems
+    with pytest.raises(ValueError):
+        import_roster(event, file_name)
+    assert len(event.heats) == 1  # Nothing was added
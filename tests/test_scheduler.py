@@ -0,0 +1,92 @@
+import os
+
+from event_store import EventStore
+from race_event import Event
+from scheduler import n_present, next_race_idx
+
+plan_file = os.path.join(os.path.dirname(__file__), '..', 'demo_race.yaml')
+
+
+def run_day(event):
+    """ Accept every race the scheduler hands out. Returns the races run. """
+    n_run = 0
+    event.goto_race(next_race_idx(event, 0))
+    race = event.current_race
+    while race.accepted_result_idx < 0 and n_present(race) > 0:
+        times = [0.0 if race.is_empty[li] else 4.0 + 0.1 * li for li in range(event.n_lanes)]
+        event.record_race_results(times, [int(t * 2000) for t in times], True)
+        n_run += 1
+        race = event.current_race
+    return n_run
+
+
+def test_absent_racers_are_skipped_and_lanes_stay_balanced():
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    n_planned = len(event.races)
+    racers = [racer for heat in event.heats[:-1] for racer in heat.racers]
+    absent = racers[::3]
+    for racer in absent:
+        event.check_in(racer, False)
+    event.dynamic_schedule = True
+
+    n_run = run_day(event)
+    assert n_run < n_planned
+    for racer in racers:
+        if racer in absent:
+            assert not racer.race_times.any()
+        else:
+            # Every racer who is there runs each lane exactly once
+            assert (racer.race_times > 0.0).all()
+            assert sum(racer is r and not empty for race in event.races
+                       for r, empty in zip(race.racers, race.is_empty)) == event.n_lanes
+
+
+def test_late_check_in_is_picked_up():
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    late = event.heats[0].racers[0]
+    event.check_in(late, False)
+    event.dynamic_schedule = True
+    event.goto_race(next_race_idx(event, 0))
+    assert late not in event.current_race.racers
+
+    event.check_in(late, True)
+    run_day(event)
+    assert (late.race_times > 0.0).all()
+
+
+def test_check_in_is_saved(tmp_path):
+    db_file = str(tmp_path / 'event.db')
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    event.heats[1].racers[1].checked_in = False
+    event.print_plan_yaml(db_file, revised_plan=event.get_race_plan(regenerate=False))
+
+    event = Event(event_file=db_file)
+    assert not event.heats[1].racers[1].checked_in
+    event.check_in(event.heats[1].racers[1])
+    event.store.close()
+    store = EventStore(db_file)
+    assert store.db.execute("SELECT COUNT(*) FROM racers WHERE checked_in = 0").fetchone()[0] == 0
+    store.close()
+
+
+def test_saved_schedule_reloads_with_its_log_once(tmp_path):
+    plan = str(tmp_path / 'plan.yaml')
+    log = str(tmp_path / 'race_log.csv')
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    event.write_plan_yaml(plan)
+    event = Event(event_file=plan, log_file=log)
+    event.heats[0].racers[0].checked_in = False
+    event.dynamic_schedule = True
+    run_day(event)
+    event.write_plan_yaml(plan, results=False)
+    event.close_log_file()
+
+    reloaded = Event(event_file=plan, log_file=log)
+    reloaded.close_log_file()
+    for race, saved in zip(reloaded.races, event.races):
+        assert race.race_number == saved.race_number
+        assert race.accepted_result_idx == saved.accepted_result_idx
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+
+from race_event import Event
+from season_stats import SeasonStore
+
+plan_file = os.path.join(os.path.dirname(__file__), '..', 'demo_race.yaml')
+
+
+def make_event(tmp_path, name, slow_down):
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    event_file = str(tmp_path / f'{name}.yaml')
+    log_file = str(tmp_path / f'{name}.csv')
+    # Writing a revised plan rebuilds the races, so it comes first
+    event.print_plan_yaml(event_file, revised_plan=event.get_race_plan(regenerate=False))
+    event.goto_race(0)
+    for ri in range(6):
+        times = [4.0 + 0.1 * li + slow_down * ri for li in range(event.n_lanes)]
+        event.record_race_results(times, [int(t * 2000) for t in times], ri != 2)
+        if ri == 2:  # Rerun the race that was not accepted
+            event.record_race_results(times, [int(t * 2000) for t in times], True)
+    event.write_race_log(log_file)
+    return event, event_file, log_file
+
+
+def test_incremental_ingest_and_queries(tmp_path):
+    first, first_plan, first_log = make_event(tmp_path, 'first', 0.0)
+    second, second_plan, second_log = make_event(tmp_path, 'second', 0.01)
+    store = SeasonStore(str(tmp_path / 'season'))
+    assert store.ingest('first', first_plan, first_log) > 0
+    assert store.ingest('first', first_plan, first_log) == 0  # Unchanged
+    assert store.ingest('second', second_plan, second_log) > 0
+
+    # A new store on the same directory sees both events
+    store = SeasonStore(str(tmp_path / 'season'))
+    assert store.events == ['first', 'second']
+    lanes = store.lane_stats()
+    occupied = [not race.is_empty[li] for race in first.races[:6] for li in range(4)]
+    assert sum(row['n_runs'] for row in lanes) == 2 * sum(occupied)
+    assert lanes[1]['mean'] > lanes[0]['mean']
+
+    racer = first.races[0].racers[0]
+    progression = store.racer_progression(racer.name, racer.heat_name)
+    assert [entry[0] for entry in progression].count('first') == len(
+        [t for t in racer.race_times if t > 0])
+    assert progression[0][3] == 4.0
+
+    races, drift = store.drift('first')
+    assert np.allclose(drift, 0.0)
+    races, drift = store.drift('second', window=1)
+    assert drift[-1] > drift[0]
+
+
+def test_drift_keeps_racers_with_the_same_name_apart(tmp_path):
+    event = Event(event_file=plan_file)
+    event.generate_race_plan()
+    fast, slow = event.heats[0].racers[0], event.heats[1].racers[0]
+    slow.name = fast.name
+    event_file = str(tmp_path / 'shared.yaml')
+    log_file = str(tmp_path / 'shared.csv')
+    event.print_plan_yaml(event_file, revised_plan=event.get_race_plan(regenerate=False))
+    event.goto_race(0)
+    for _ in range(len(event.races)):
+        racers = event.current_race.racers
+        times = [4.0 + 0.1 * li + (0.5 if racers[li] is slow else 0.0) for li in range(event.n_lanes)]
+        event.record_race_results(times, [int(t * 2000) for t in times], True)
+    event.write_race_log(log_file)
+
+    store = SeasonStore(str(tmp_path / 'season'))
+    store.ingest('shared', event_file, log_file)
+    races, drift = store.drift('shared', window=1)
+    assert len(races) > 0
+    assert np.allclose(drift, 0.0)
@@ -0,0 +1,42 @@
+import numpy as np
+
+from timer_clock import TimerCalibration
+
+
+def test_default_rate_matches_firmware():
+    clock = TimerCalibration(4)
+    assert list(clock.to_seconds([8000, 8200, 0, 1])) == [4.0, 4.1, 0.0, 0.0005]
+
+
+def test_microsecond_clock_keeps_precision():
+    clock = TimerCalibration(4, rate=80000000)  # 80 MHz
+    counts = [320000013, 320000093, 400000000000, 0]
+    assert list(clock.to_microseconds(counts)) == [4000000, 4000001, 5000000000, 0]
+
+
+def test_offset_and_drift():
+    clock = TimerCalibration(2)
+    clock.set_lane(0, offset=10)
+    clock.set_lane(1, drift_ppb=1000000)  # 0.1% fast
+    us = clock.to_microseconds([8010, 8008])
+    assert us[0] == 4000000
+    assert abs(int(us[1]) - 4000000) <= 1
+
+
+def test_round_trip_and_file(tmp_path):
+    clock = TimerCalibration(4)
+    clock.set_lane(2, rate=1000000, offset=3, drift_ppb=-500)
+    file_name = str(tmp_path / "cal.csv")
+    clock.save(file_name)
+    loaded = TimerCalibration(4).load(file_name)
+    assert (loaded.rates == clock.rates).all()
+    assert (loaded.offsets == clock.offsets).all()
+    assert (loaded.drift_ppb == clock.drift_ppb).all()
+    count = loaded.seconds_to_counts(2, 3.987654)
+    assert abs(loaded.lane_seconds(2, count) - 3.987654) < 2e-6
+
+
+def test_batches():
+    clock = TimerCalibration(4)
+    counts = np.full((10, 4), 8000)
+    assert (clock.to_seconds(counts) == 4.0).all()
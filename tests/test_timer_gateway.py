@@ -0,0 +1,77 @@
+import os
+import socket
+import time
+
+from rm_socket import TimerComs
+from timer_gateway import FrameReader, GatewayComs, TimerGateway, encode_frame
+
+
+def test_frames_survive_arbitrary_splits():
+    stream = (encode_frame('data', 2, b'<GO!>') + encode_frame('connected', 0)
+              + encode_frame('command', 3, b'<reset>'))
+    reader = FrameReader()
+    frames = []
+    for i in range(0, len(stream), 3):
+        frames.extend(reader.feed(stream[i:i + 3]))
+    assert frames == [('data', 2, b'<GO!>'), ('connected', 0, b''), ('command', 3, b'<reset>')]
+    assert reader.buffer == b''
+
+
+def test_managers_share_one_lane_connection(tmp_path):
+    lane_server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    lane_server.bind(('127.0.0.1', 0))
+    lane_server.listen(1)
+    lane_server.settimeout(5.0)
+    coms = TimerComs(None, addresses=["127.0.0.1:{}".format(lane_server.getsockname()[1])],
+                     n_lanes=1, reset_lane=0)
+    gateway = TimerGateway(coms, listen="unix:" + str(tmp_path / 'gateway.sock'))
+    managers = [GatewayComs("unix:" + str(tmp_path / 'gateway.sock'), n_lanes=1, reset_lane=0)
+                for _ in range(2)]
+    received = [[], []]
+
+    def run_until(condition, timeout=5.0):
+        end = time.monotonic() + timeout
+        while time.monotonic() < end and not condition():
+            gateway.step(0.01)
+            for mi, manager in enumerate(managers):
+                received[mi].extend(manager.poll(0.0))
+        return condition()
+
+    try:
+        coms.start_reconnect(0)
+        lane_conn, _ = lane_server.accept()
+        lane_conn.settimeout(5.0)
+        assert run_until(lambda: all(m.is_conn[0] for m in managers))
+
+        lane_conn.sendall(b'<GO!>')
+        assert run_until(lambda: all(('data', 0, b'<GO!>') in r for r in received))
+
+        managers[1].send_reset_to_track()
+        run_until(lambda: False, timeout=0.2)
+        assert lane_conn.recv(64) == b'<reset>'
+        lane_conn.close()
+    finally:
+        for manager in managers:
+            manager.shutdown()
+        gateway.shutdown()
+        lane_server.close()
+
+
+def test_a_stalled_manager_does_not_hold_up_the_gateway(tmp_path):
+    path = str(tmp_path / 'gateway.sock')
+    coms = TimerComs(None, addresses=["127.0.0.1:9"], n_lanes=1, reset_lane=0)
+    gateway = TimerGateway(coms, listen="unix:" + path)
+    stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stalled.connect(path)
+    try:
+        gateway.step(0.01)
+        assert len(gateway.clients) == 1
+        start = time.monotonic()
+        for _ in range(64):  # Far more than the socket buffers hold
+            for client in gateway.clients:
+                gateway.send(client, b'x' * 65536)
+        assert time.monotonic() - start < 1.0
+    finally:
+        gateway.shutdown()
+        stalled.close()
+    assert not os.path.exists(path)
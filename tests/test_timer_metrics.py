@@ -0,0 +1,69 @@
+import json
+
+from timer_metrics import RingBuffer, TimerMetrics
+
+
+def test_ring_buffer_keeps_the_latest_samples():
+    buf = RingBuffer(capacity=4)
+    assert buf.summary() == {'n': 0}
+    for v in range(1, 7):
+        buf.add(v * 1000000)
+    assert sorted(buf.values().tolist()) == [3000000, 4000000, 5000000, 6000000]
+    s = buf.summary()
+    assert s['n'] == 6
+    assert s['max_ms'] == 6.0
+    assert s['p50_ms'] == 4.5
+
+
+def test_go_skew_finds_the_slow_lane():
+    metrics = TimerMetrics(n_lanes=3)
+    for _ in range(3):
+        metrics.first_go_ns = 0
+        for li in (0, 2, 1):
+            metrics.message_received(li, b'<GO!>')
+    assert metrics.lanes[1]['go_skew'].n == 3
+    assert metrics.slowest_lane() == 1
+
+
+def test_turnaround_runs_from_the_last_finish_to_the_next_go():
+    metrics = TimerMetrics(n_lanes=2)
+    metrics.message_received(0, b'<GO!>')
+    metrics.message_received(0, b'<Track count:8000>')
+    metrics.message_received(1, b'<Track count:8100>')
+    assert metrics.manager['turnaround'].n == 0
+    metrics.first_go_ns = 0  # The next race
+    metrics.message_received(1, b'<GO!>')
+    metrics.message_received(0, b'<GO!>')
+    assert metrics.manager['turnaround'].n == 1
+
+
+def test_ready_latency_and_processing():
+    metrics = TimerMetrics(n_lanes=2)
+    metrics.message_received(0, b'<Ready to Race>')
+    assert metrics.lanes[0]['ready_latency'].n == 0  # No reset was sent
+    metrics.reset_sent()
+    metrics.message_received(0, b'<Ready to Race>')
+    metrics.message_received(0, b'<Ready to Race>')
+    assert metrics.lanes[0]['ready_latency'].n == 1
+    assert metrics.lanes[0]['interval'].n == 2
+    metrics.message_processed(0)
+    metrics.message_received(1, b'<Track count:5000>')
+    metrics.time_displayed(1)
+    metrics.time_displayed(1)
+    assert metrics.lanes[0]['processing'].n == 1
+    assert metrics.lanes[1]['display'].n == 1
+    assert "Lane" in metrics.report()
+
+
+def test_dump_appends_json_lines(tmp_path):
+    metrics = TimerMetrics(n_lanes=2)
+    metrics.record('loop', 0)
+    file_name = str(tmp_path / 'metrics.jsonl')
+    metrics.dump(file_name)
+    metrics.maybe_dump(file_name, interval_s=0.0)
+    metrics.maybe_dump(file_name, interval_s=3600.0)
+    with open(file_name) as infile:
+        lines = [json.loads(line) for line in infile]
+    assert len(lines) == 2
+    assert len(lines[0]['lanes']) == 2
+    assert lines[0]['manager']['loop']['n'] == 1
@@ -0,0 +1,131 @@
+"""
+timer_clock.py
+
+Conversion of lane timer counts to race times.
+
+Each lane timer reports the number of clock edges it counted while the car
+was on the track. TimerCalibration holds, for each lane:
+
+rate:       Counts per second (an integer). The stock NodeMCU firmware counts
+            both edges of a 1 kHz clock, so the default is 2000.
+offset:     Counts to subtract before converting (trigger latency).
+drift_ppb:  How fast the lane clock runs, in parts per billion. A clock that
+            is 25 ppm fast has drift_ppb = 25000.
+
+All conversions are done with 64 bit integers to whole microseconds, so
+moving the timers to a MHz clock does not lose precision. Race logs keep the
+raw counts, and times are derived from them on demand.
+
+The constants and seconds_to_counts do not need numpy, so the timer
+simulator can use them without loading it.
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+default_rate = 2000  # Counts per second
+us_per_second = 1000000
+ppb = 1000000000
+
+
+def seconds_to_counts(seconds, rate=default_rate, offset=0, drift_ppb=0):
+    """ The count a lane timer reports for a run of seconds. """
+    us = int(round(seconds * us_per_second))
+    us = us + (us * int(drift_ppb)) // ppb
+    return (us * int(rate)) // us_per_second + int(offset)
+
+
+class TimerCalibration:
+    def __init__(self,
+                 n_lanes: int = 4,
+                 rate: int = default_rate,
+                 offset: int = 0,
+                 drift_ppb: int = 0):
+        import numpy as np
+        self.n_lanes = n_lanes
+        self.rates = np.full(n_lanes, int(round(rate)), dtype=np.int64)
+        self.offsets = np.full(n_lanes, int(offset), dtype=np.int64)
+        self.drift_ppb = np.full(n_lanes, int(drift_ppb), dtype=np.int64)
+
+    def set_lane(self, lane_idx, rate=None, offset=None, drift_ppb=None):
+        if rate is not None:
+            rate = int(round(float(rate)))
+            if rate <= 0:
+                raise ValueError(f"The clock rate for lane {lane_idx + 1} must be positive.")
+            self.rates[lane_idx] = rate
+        if offset is not None:
+            self.offsets[lane_idx] = int(offset)
+        if drift_ppb is not None:
+            drift_ppb = int(drift_ppb)
+            if drift_ppb <= -ppb:
+                raise ValueError(f"The drift for lane {lane_idx + 1} is out of range.")
+            self.drift_ppb[lane_idx] = drift_ppb
+
+    def set_rate(self, rate):
+        for li in range(self.n_lanes):
+            self.set_lane(li, rate=rate)
+
+    @property
+    def mean_rate(self):
+        import numpy as np
+        return float(np.mean(self.rates))
+
+    def to_microseconds(self, counts):
+        """ Convert one count per lane (or an n_races x n_lanes array) to
+        whole microseconds. Lanes without a count stay at 0. """
+        import numpy as np
+        counts = np.asarray(counts, dtype=np.int64)
+        ticks = np.maximum(counts - self.offsets, 0)
+        # Split the division so no intermediate product overflows 64 bits.
+        whole, part = np.divmod(ticks, self.rates)
+        us = whole * us_per_second + (part * us_per_second) // self.rates
+        # A fast clock (positive drift) counts too many ticks.
+        us -= (us * self.drift_ppb) // (ppb + self.drift_ppb)
+        return np.where(counts > 0, us, 0)
+
+    def to_seconds(self, counts):
+        return self.to_microseconds(counts) / us_per_second
+
+    def lane_seconds(self, lane_idx, count):
+        if count <= 0:
+            return 0.0
+        import numpy as np
+        counts = np.zeros(self.n_lanes, dtype=np.int64)
+        counts[lane_idx] = count
+        return float(self.to_microseconds(counts)[lane_idx]) / us_per_second
+
+    def seconds_to_counts(self, lane_idx, seconds):
+        """ The inverse conversion for one lane. """
+        return seconds_to_counts(seconds, self.rates[lane_idx], self.offsets[lane_idx],
+                                 self.drift_ppb[lane_idx])
+
+    def load(self, file_name):
+        """ Read lane,rate,offset,drift_ppb lines (lanes are 1 indexed). """
+        with open(file_name) as infile:
+            for line in infile:
+                fields = [x.strip() for x in line.split(',')]
+                if len(fields) < 2 or not fields[0].isdigit():
+                    continue
+                li = int(fields[0]) - 1
+                if li >= self.n_lanes:
+                    continue
+                offset = fields[2] if len(fields) > 2 and fields[2] else None
+                drift = fields[3] if len(fields) > 3 and fields[3] else None
+                self.set_lane(li, rate=fields[1], offset=offset, drift_ppb=drift)
+        return self
+
+    def save(self, file_name):
+        with open(file_name, 'w') as outfile:
+            outfile.write("lane,rate,offset,drift_ppb\n")
+            for li in range(self.n_lanes):
+                outfile.write(f"{li + 1},{self.rates[li]},{self.offsets[li]},{self.drift_ppb[li]}\n")
@@ -0,0 +1,389 @@
+"""
+timer_gateway.py
+
+A small process that holds the connections to the lane timers and forwards
+their messages, tagged with the lane, over a single stream to any number of
+race managers (for example the main laptop and a backup). Managers send
+commands (the reset) back over the same stream.
+
+    python timer_gateway.py --hosts_file lane_hosts.csv
+    python race_manager.py --gateway 127.0.0.1:5050
+
+The listen/gateway address is host:port for TCP or unix:/path for a Unix
+socket. Commands are not authenticated, so the gateway only listens on this
+machine unless another address is given with --listen (e.g. 0.0.0.0:5050 for
+a backup laptop on the race network). Every message is a frame of
+
+    lane (1 byte), kind (1 byte), payload length (2 bytes, big endian), payload
+
+and everything produced by one pass over the lane sockets goes out to each
+manager in a single send.
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import argparse
+import os
+import queue
+import select
+import socket
+import struct
+import threading
+import time
+
+from rm_socket import TimerComs, enable_keepalive
+from timer_metrics import TimerMetrics
+
+frame_header = struct.Struct('!BBH')
+frame_kinds = ('data', 'connected', 'disconnected', 'command')
+kind_codes = {kind: code for code, kind in enumerate(frame_kinds)}
+default_gateway_port = 5050
+default_listen = f"127.0.0.1:{default_gateway_port}"
+default_reset_lane = 0  # 0 indexed
+
+
+def encode_frame(kind, lane_idx, payload=b''):
+    return frame_header.pack(lane_idx, kind_codes[kind], len(payload)) + payload
+
+
+class FrameReader:
+    """ Collects bytes from a stream and returns the complete frames. """
+
+    def __init__(self):
+        self.buffer = b''
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        while len(self.buffer) >= frame_header.size:
+            lane_idx, code, length = frame_header.unpack_from(self.buffer)
+            end = frame_header.size + length
+            if len(self.buffer) < end:
+                break
+            if code < len(frame_kinds):
+                frames.append((frame_kinds[code], lane_idx, self.buffer[frame_header.size:end]))
+            self.buffer = self.buffer[end:]
+        return frames
+
+
+def parse_address(address):
+    """ Returns (family, address) for host:port or unix:/path. """
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    host, port = address.rsplit(':', 1)
+    return socket.AF_INET, (host, int(port))
+
+
+def open_stream(address, timeout=2.0):
+    family, addr = parse_address(address)
+    sckt = socket.socket(family, socket.SOCK_STREAM)
+    sckt.settimeout(timeout)
+    try:
+        sckt.connect(addr)
+    except OSError:
+        sckt.close()
+        raise
+    sckt.settimeout(None)
+    if family == socket.AF_INET:
+        sckt.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        enable_keepalive(sckt)
+    return sckt
+
+
+class _Client:
+    """ A race manager. Each has its own sender thread so a slow manager never
+    holds up the lane timers or the other managers. """
+
+    def __init__(self, sckt):
+        self.socket = sckt
+        self.reader = FrameReader()
+        self.queue = queue.Queue()
+        threading.Thread(target=self._send, daemon=True).start()
+
+    def _send(self):
+        while True:
+            payload = self.queue.get()
+            if payload is None:
+                break
+            try:
+                self.socket.sendall(payload)
+            except OSError:
+                # The gateway loop sees the hang up and drops the manager
+                self._hang_up()
+                break
+
+    def _hang_up(self):
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        self.queue.put(None)
+        self._hang_up()  # Wakes the sender if it is stuck in sendall
+        self.socket.close()
+
+
+class TimerGateway:
+    def __init__(self,
+                 coms: TimerComs,
+                 listen: str = default_listen):
+        self.coms = coms
+        family, addr = parse_address(listen)
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.unlink(addr)
+        self.listener = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(addr)
+        self.listener.listen(8)
+        if family == socket.AF_INET and not (addr[0].startswith('127.') or addr[0] == 'localhost'):
+            print(f"Warning: any host that can reach {listen} can send commands to the lane timers.")
+        self.family = family
+        # Kept for shutdown, the listener can no longer be asked once closed
+        self.unix_path = addr if family == socket.AF_UNIX else None
+        self.clients = {}  # socket -> _Client
+        self.running = True
+
+    @property
+    def address(self):
+        return self.listener.getsockname()
+
+    def lane_status_frames(self):
+        return b''.join(encode_frame('connected' if self.coms.is_conn[li] else 'disconnected', li)
+                        for li in range(self.coms.n_lanes))
+
+    def accept_client(self):
+        client, _ = self.listener.accept()
+        if self.family == socket.AF_INET:
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.clients[client] = _Client(client)
+        print(f"Race manager connected ({len(self.clients)} subscribed).")
+        self.send(client, self.lane_status_frames())
+
+    def drop_client(self, client):
+        self.clients.pop(client).close()
+        print(f"Race manager disconnected ({len(self.clients)} subscribed).")
+
+    def send(self, client, payload):
+        """ Queue payload for a manager, without waiting for it to be sent. """
+        self.clients[client].queue.put(payload)
+
+    def handle_command(self, lane_idx, payload):
+        if b'reset' in payload:
+            self.coms.send_reset_to_track()
+        elif lane_idx < self.coms.n_lanes and self.coms.is_conn[lane_idx]:
+            try:
+                self.coms.sockets[lane_idx].sendall(payload)
+            except OSError:
+                self.coms.lane_failed(lane_idx)
+
+    def step(self, wait_len=0.02):
+        """ One pass: lane sockets, then manager connections and commands. """
+        events = self.coms.poll(wait_len)
+        if events:
+            payload = b''.join(encode_frame(kind, li, data) for kind, li, data in events)
+            for client in self.clients:
+                self.send(client, payload)
+        readable, _, _ = select.select([self.listener] + list(self.clients), [], [], 0)
+        for sckt in readable:
+            if sckt is self.listener:
+                self.accept_client()
+                continue
+            try:
+                data = sckt.recv(1024)
+            except OSError:
+                data = b''
+            if len(data) == 0:
+                self.drop_client(sckt)
+                continue
+            for kind, lane_idx, payload in self.clients[sckt].reader.feed(data):
+                if kind == 'command':
+                    self.handle_command(lane_idx, payload)
+
+    def run(self):
+        for li in range(self.coms.n_lanes):
+            self.coms.start_reconnect(li)
+        while self.running:
+            self.step()
+
+    def shutdown(self):
+        self.running = False
+        for client in self.clients.values():
+            client.close()
+        self.clients = {}
+        self.listener.close()
+        if self.unix_path is not None:
+            try:
+                os.unlink(self.unix_path)
+            except OSError:
+                pass
+        self.coms.shutdown()
+
+
+class GatewayComs:
+    """
+    Stands in for TimerComs in the race manager when the lane timers are
+    reached through a gateway. poll() returns the same (kind, lane_idx,
+    data) events.
+    """
+    reconnect_delay: float = 1.0
+
+    def __init__(self,
+                 address: str,
+                 n_lanes: int = 4,
+                 reset_lane: int = default_reset_lane):
+        self.address = address
+        self.n_lanes = n_lanes
+        self.reset_lane = reset_lane
+        self.is_conn = [False] * n_lanes
+        self.all_connected = False
+        self.gateway_up = False
+        self.hosts = [address] * n_lanes
+        self.ports = [0] * n_lanes
+        self.metrics = TimerMetrics(n_lanes)
+        self.reader = FrameReader()
+        self.stream = None
+        self._reconnected = queue.Queue()
+        self._stopping = threading.Event()
+        self._reconnecting = False
+        self.start_reconnect()
+
+    def start_reconnect(self):
+        if self._reconnecting or self._stopping.is_set():
+            return
+        self._reconnecting = True
+        threading.Thread(target=self._reconnect, daemon=True).start()
+
+    def _reconnect(self):
+        while not self._stopping.is_set():
+            try:
+                stream = open_stream(self.address)
+            except OSError:
+                self._stopping.wait(self.reconnect_delay)
+                continue
+            self._reconnected.put(stream)
+            return
+
+    def gateway_failed(self, events):
+        print(f"Lost the timer gateway at {self.address}. Reconnecting.")
+        self.stream.close()
+        self.stream = None
+        self.gateway_up = False
+        for li in range(self.n_lanes):
+            if self.is_conn[li]:
+                events.append(('disconnected', li, b''))
+        self.is_conn = [False] * self.n_lanes
+        self.all_connected = False
+        self.start_reconnect()
+
+    def poll(self, wait_len=0.05):
+        events = []
+        try:
+            stream = self._reconnected.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            self._reconnecting = False
+            self.stream = stream
+            self.reader = FrameReader()
+            self.gateway_up = True
+            print(f"Connected to the timer gateway at {self.address}.")
+        if self.stream is None:
+            time.sleep(wait_len)
+            return events
+        readable, _, _ = select.select([self.stream], [], [], wait_len)
+        if not readable:
+            return events
+        try:
+            data = self.stream.recv(4096)
+        except OSError:
+            data = b''
+        if len(data) == 0:
+            self.gateway_failed(events)
+            return events
+        for kind, lane_idx, payload in self.reader.feed(data):
+            if lane_idx >= self.n_lanes:
+                continue
+            if kind == 'data':
+                self.metrics.message_received(lane_idx, payload)
+            elif kind in ('connected', 'disconnected'):
+                self.is_conn[lane_idx] = kind == 'connected'
+                self.all_connected = all(self.is_conn)
+            events.append((kind, lane_idx, payload))
+        return events
+
+    def send_command(self, lane_idx, payload):
+        if self.stream is None:
+            return False
+        try:
+            self.stream.sendall(encode_frame('command', lane_idx, payload))
+        except OSError:
+            return False
+        return True
+
+    def send_reset_to_track(self, accept=False):
+        print("Sending Reset to the Track (through the gateway)")
+        if self.send_command(self.reset_lane, "<reset>".encode('utf-8')):
+            self.metrics.reset_sent()
+        else:
+            print("The timer gateway is not connected. The reset was not sent.")
+
+    def connection_report(self):
+        state = "connected" if self.gateway_up else "reconnecting"
+        lines = [f"Gateway {self.address} {state}"]
+        for li in range(self.n_lanes):
+            lines.append(f"Lane {li + 1} {'connected' if self.is_conn[li] else 'disconnected'}")
+        return '\n'.join(lines)
+
+    # The lane hosts belong to the gateway
+    def connect_to_track_hosts(self, autoclose=False, reset=False):
+        print(f"The lane timers are managed by the gateway at {self.address}.")
+
+    def reset_sockets(self):
+        pass
+
+    def get_hosts_and_ports(self, hosts_file):
+        print("Load the timer hosts file in the gateway instead.")
+
+    def save_timer_hosts(self, file_name):
+        print("The timer hosts are managed by the gateway.")
+
+    def shutdown(self):
+        self._stopping.set()
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Share the lane timers with one or more race managers.")
+    parser.add_argument('--hosts_file', help='A file with the ip and port addresses of the lane timers (hosts).',
+                        default='lane_hosts_LOCAL.csv')
+    parser.add_argument('--listen', help='host:port or unix:/path to accept race managers on.',
+                        default=default_listen)
+    parser.add_argument('--reset_lane', help='The lane (1 indexed) whose timer takes the reset.',
+                        type=int, default=default_reset_lane + 1)
+    cli_args = parser.parse_args()
+
+    gateway = TimerGateway(TimerComs(None, hosts_file=cli_args.hosts_file,
+                                     reset_lane=cli_args.reset_lane - 1),
+                           listen=cli_args.listen)
+    print(f"Timer gateway listening on {cli_args.listen}.")
+    try:
+        gateway.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gateway.shutdown()
@@ -0,0 +1,183 @@
+"""
+timer_metrics.py
+
+Latency and jitter instrumentation for the lane timers and the race manager
+loop. Every message from a lane timer is stamped with time.monotonic_ns when
+it is read, and the following are kept in fixed-size ring buffers:
+
+Per lane
+interval:       Time since the previous message from the same lane.
+go_skew:        How long after the first lane's <GO!> this lane's arrived.
+                A lane that is consistently late has a slow NodeMCU or link.
+ready_latency:  Time from sending <reset> until the lane reports ready.
+processing:     Time from reading the message until it was handled.
+display:        Time from reading a <Track count:N> until the time was shown.
+
+Manager
+ui_update:      Time Tk spent on the windows between passes over the timers.
+loop:           Time for a whole pass over the timers.
+turnaround:     Time from the last finish of a race to the next <GO!>.
+
+Copyright [2020] [Lee R. Burchett]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import time
+
+import numpy as np
+
+lane_metrics = ('interval', 'go_skew', 'ready_latency', 'processing', 'display')
+manager_metrics = ('ui_update', 'loop', 'turnaround')
+
+
+class RingBuffer:
+    """ The last capacity samples (in nanoseconds). """
+
+    def __init__(self, capacity=512):
+        self.data = np.zeros(capacity, dtype=np.int64)
+        self.n = 0  # Total number of samples ever added
+
+    def add(self, value):
+        self.data[self.n % len(self.data)] = value
+        self.n += 1
+
+    def values(self):
+        if self.n < len(self.data):
+            return self.data[:self.n]
+        return self.data
+
+    def summary(self):
+        """ Statistics in milliseconds. """
+        values = self.values()
+        if len(values) == 0:
+            return {'n': 0}
+        p50, p95 = np.percentile(values, [50, 95])
+        return {'n': int(self.n),
+                'mean_ms': float(np.mean(values)) / 1e6,
+                'p50_ms': float(p50) / 1e6,
+                'p95_ms': float(p95) / 1e6,
+                'max_ms': float(np.max(values)) / 1e6,
+                'jitter_ms': float(np.std(values)) / 1e6}
+
+
+class TimerMetrics:
+    def __init__(self,
+                 n_lanes: int = 4,
+                 capacity: int = 512):
+        self.n_lanes = n_lanes
+        self.lanes = [{name: RingBuffer(capacity) for name in lane_metrics}
+                      for _ in range(n_lanes)]
+        self.manager = {name: RingBuffer(capacity) for name in manager_metrics}
+        self.last_recv_ns = [0] * n_lanes
+        self.last_count_ns = [0] * n_lanes
+        self.first_go_ns = 0
+        self.last_finish_ns = 0
+        self.reset_sent_ns = 0
+        self.waiting_for_ready = [False] * n_lanes
+        self.last_dump_ns = time.monotonic_ns()
+
+    # Timer messages
+    def message_received(self, lane_idx, data: bytes):
+        now = time.monotonic_ns()
+        if self.last_recv_ns[lane_idx]:
+            self.lanes[lane_idx]['interval'].add(now - self.last_recv_ns[lane_idx])
+        self.last_recv_ns[lane_idx] = now
+        if b'GO!' in data:
+            if self.first_go_ns == 0 or now - self.first_go_ns > 2e9:
+                self.first_go_ns = now  # The first lane of a new race
+                if self.last_finish_ns:
+                    self.manager['turnaround'].add(now - self.last_finish_ns)
+                    self.last_finish_ns = 0
+            self.lanes[lane_idx]['go_skew'].add(now - self.first_go_ns)
+        elif b'Ready to Race' in data:
+            if self.waiting_for_ready[lane_idx]:
+                self.lanes[lane_idx]['ready_latency'].add(now - self.reset_sent_ns)
+                self.waiting_for_ready[lane_idx] = False
+        elif b'Track count:' in data:
+            self.last_count_ns[lane_idx] = now
+            self.last_finish_ns = now
+        return now
+
+    def reset_sent(self):
+        self.reset_sent_ns = time.monotonic_ns()
+        self.waiting_for_ready = [True] * self.n_lanes
+
+    def message_processed(self, lane_idx):
+        self.lanes[lane_idx]['processing'].add(time.monotonic_ns() - self.last_recv_ns[lane_idx])
+
+    def time_displayed(self, lane_idx):
+        if self.last_count_ns[lane_idx]:
+            self.lanes[lane_idx]['display'].add(time.monotonic_ns() - self.last_count_ns[lane_idx])
+            self.last_count_ns[lane_idx] = 0
+
+    # Manager loop
+    def record(self, name, start_ns):
+        self.manager[name].add(time.monotonic_ns() - start_ns)
+
+    def summary(self):
+        return {'lanes': [{name: buf.summary() for name, buf in lane.items()}
+                          for lane in self.lanes],
+                'manager': {name: buf.summary() for name, buf in self.manager.items()}}
+
+    def slowest_lane(self, metric='go_skew'):
+        """ The (0 indexed) lane with the largest median for metric, or -1. """
+        medians = []
+        for lane in self.lanes:
+            values = lane[metric].values()
+            medians.append(np.median(values) if len(values) else -1)
+        if max(medians) < 0:
+            return -1
+        return int(np.argmax(medians))
+
+    def dump(self, file_name):
+        with open(file_name, 'a') as outfile:
+            outfile.write(json.dumps(dict(self.summary(), time=time.time())) + '\n')
+
+    def maybe_dump(self, file_name, interval_s=60.0):
+        """ Append a summary to file_name at most once per interval. """
+        if file_name is None:
+            return
+        now = time.monotonic_ns()
+        if now - self.last_dump_ns >= interval_s * 1e9:
+            self.last_dump_ns = now
+            try:
+                self.dump(file_name)
+            except OSError as e:
+                print(f"Unable to write metrics to {file_name}. {e}")
+
+    def report(self):
+        """ A fixed width text table for the diagnostics window. """
+        lines = ["Lane " + ''.join(name.rjust(15) for name in lane_metrics)]
+        for li, lane in enumerate(self.lanes):
+            cells = []
+            for name in lane_metrics:
+                s = lane[name].summary()
+                if s['n'] == 0:
+                    cells.append('-'.rjust(15))
+                else:
+                    cells.append(f"{s['p50_ms']:.1f}/{s['p95_ms']:.1f}".rjust(15))
+            lines.append(f"{li + 1:4d} " + ''.join(cells))
+        lines.append("")
+        for name, buf in self.manager.items():
+            s = buf.summary()
+            if s['n'] == 0:
+                lines.append(f"{name}: -")
+            else:
+                lines.append(f"{name}: p50 {s['p50_ms']:.2f} ms, p95 {s['p95_ms']:.2f} ms, "
+                             f"max {s['max_ms']:.2f} ms")
+        slow = self.slowest_lane()
+        if slow >= 0:
+            lines.append(f"Slowest lane to report GO: {slow + 1}")
+        lines.append("Lane columns are p50/p95 in ms.")
+        return '\n'.join(lines)
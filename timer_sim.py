@@ -20,13 +20,14 @@ limitations under the License.
 
 import sys
 import socket
-import numpy as np
+import random
 import select
 import time
 import tkinter as tk
 from queue import Queue
 from threading import Thread, Lock
 from typing import Iterable
+from timer_clock import default_rate, seconds_to_counts
 
 infile = "lane_hosts.csv"
 ready_msg = "<Ready to Race.>".encode('utf-8')
@@ -38,6 +39,7 @@ stringlen = 64
 race_ready = False
 running_race = True
 mutex = Lock()
+clock_rate = default_rate  # Counts per second
 
 
 class Lane:
@@ -161,7 +163,7 @@ class MainWindow:
 
 
 def make_str(race_number):
-    new_times = 12.0 + np.random.randn(4) / 10.0
+    new_times = [12.0 + random.gauss(0.0, 0.1) for _ in range(4)]
     time_str = ["{:5.3f}".format(x) for x in new_times]
     time_str.insert(0, "{:5}".format(race_number))
     return ','.join(time_str), race_number + 1
@@ -187,12 +189,12 @@ def race_reset():
 
 def time_msg():
     """Normally distributed random numbers around 4 seconds"""
-    racer_time = np.random.randn() * 0.1 + 4.0
+    racer_time = random.gauss(4.0, 0.1)
     "Convert to counts"
     print("Time = {}".format(racer_time))
-    racer_time = np.array(racer_time * 2000.0).astype(np.int32)
-    print("Counts = {}".format(racer_time))
-    time_message = "{}".format(racer_time).encode('utf-8')
+    counts = seconds_to_counts(racer_time, clock_rate)
+    print("Counts = {}".format(counts))
+    time_message = "{}".format(counts).encode('utf-8')
     return time_message
 
 
@@ -204,10 +206,10 @@ def run_race(lanes):
     for lane in lanes:
         lane.connection.sendall(go_msg)
     time.sleep(3)
-    for idx, lane in enumerate(lanes):
+    for lane in lanes:
         if lane.reporting.get():
             lane.connection.sendall(time_prefix + time_msg() + time_suffix)
-        time.sleep(np.random.rand() / 2.0)
+        time.sleep(random.random() / 2.0)
 
 
 def close_manager():
@@ -243,7 +245,10 @@ if __name__ == "__main__":
         infile = sys.argv[1]
     else:
         infile = sys.argv[1]
-        print("Only the first argument is used")
+        clock_rate = int(float(sys.argv[2]))
+        print("Simulating timers that count at {} Hz.".format(clock_rate))
+        if len(sys.argv) > 3:
+            print("Only the first two arguments are used")
 
     set_host_and_port(the_lanes, infile)
 